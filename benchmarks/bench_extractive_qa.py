@@ -0,0 +1,137 @@
+"""Latency/accuracy benchmark of the extractive QA backends.
+
+Compares the current full-context remote path against retrieval-narrowed
+contexts and the local (rule-based and CPU model) backends, on questions
+whose gold answers come from claim_details.json. The bundled notes come
+from the data_creation/insurance_data.py template, so backends are also
+scored on HANDWRITTEN_NOTES: free-text notes with no structured fields,
+written independently of that template.
+
+    python -m benchmarks.bench_extractive_qa [--top-k 4] [--endpoint http://127.0.0.1:8765]
+"""
+from src.config import read_config
+from src.clients import ClientProvider
+from src.data_ingestion import DataIngestion
+from src.extractive_qa import ExtractiveQA
+from src.qa_backends import create_backend
+import argparse
+import os
+import re
+import statistics
+import time
+
+QUESTIONS = (
+    ("Who is the doctor?", lambda claim: claim["provider_name"]),
+    ("What is the ICD code?", lambda claim: claim["icd_code"]),
+    ("What is the CPT code?", lambda claim: claim["cpt_code"]),
+    ("What is the diagnosis?", lambda claim: claim["primary_diagnosis"]),
+    ("How much did insurance pay?", lambda claim: claim["financials"]["insurance_paid"]),
+    ("What was the billed amount?", lambda claim: claim["financials"]["billed_amount"]),
+    ("What is the copay?", lambda claim: claim["financials"]["copay"]),
+    ("What is the claim date?", lambda claim: claim["claim_date"]),
+)
+
+# (question, note, gold answer) in phrasings the synthetic generator never uses
+HANDWRITTEN_NOTES = (
+    ("Who is the doctor?", "Pt evaluated by Jennifer Walsh, NP, in urgent care.", "Jennifer Walsh, NP"),
+    ("Who is the doctor?", "Consulting cardiologist: Dr. Raymond Ortiz.", "Dr. Raymond Ortiz"),
+    ("What is the ICD code?", "Final dx K21.9 GERD without esophagitis.", "K21.9"),
+    ("What is the ICD code?", "ICD: I48.91", "I48.91"),
+    ("What is the CPT code?", "Billing code 71046 for two-view chest x-ray.", "71046"),
+    ("How much was billed?", "Charges for today's visit came to $275.", "275"),
+    ("How much was billed?", "We billed the patient's plan USD 1,050.", "1,050"),
+    ("How much did insurance pay?", "Plan paid $410.00; remainder to patient.", "410.00"),
+    ("How much did insurance pay?", "Payment from insurance: $88.40.", "88.40"),
+    ("What is the copay?", "Copay $40 collected.", "40"),
+    ("What medication was prescribed?", "Will begin atorvastatin 20 mg nightly.", "atorvastatin 20 mg"),
+    ("What medication was prescribed?", "Prescribed Albuterol inhaler as needed.", "Albuterol"),
+    ("What was the diagnosis?", "Diagnosis: migraine without aura.", "migraine without aura"),
+    ("What was the diagnosis?", "Findings consistent with plantar fasciitis.", "plantar fasciitis"),
+    ("When was the visit?", "Date of service: 2025-02-19.", "2025-02-19"),
+    ("When was the visit?", "Seen on March 3, 2025 for follow-up.", "March 3, 2025"),
+    ("What is the policy number?", "Member policy #HX99812 on file.", "HX99812"),
+    ("Who is the patient?", "Patient: Emily Rhodes, DOB 1980-04-02.", "Emily Rhodes"),
+    ("Who is the patient?", "Mr. Daniel Price arrived at 9am.", "Daniel Price"),
+    ("Who treated the patient?", "Treating provider Dr. Lee (Dermatology) excised the lesion.", "Dr. Lee (Dermatology)"),
+)
+
+
+def normalize(value) -> str:
+    text = str(value).lower()
+    try:
+        return f"{float(text.strip('$')):.2f}"
+    except ValueError:
+        return re.sub(r"[^a-z0-9.]+", " ", text).strip()
+
+
+def is_correct(answer, gold) -> bool:
+    if answer is None:
+        return False
+    predicted, expected = normalize(answer.answer), normalize(gold)
+    return bool(predicted) and (predicted in expected or expected in predicted)
+
+
+def load_claims(data_path: str):
+    claims = []
+    for patient_id in sorted(os.listdir(data_path)):
+        claims.extend(DataIngestion(patient_id=patient_id, data_path=data_path).ingest_patient_data() or [])
+    return claims
+
+
+def run(backend_name: str, top_k: int, claims, client_provider) -> dict:
+    backend = create_backend(backend_name, client_provider=client_provider)
+    latencies, correct, context_chars = [], 0, 0
+    for claim in claims:
+        extractive_qa = ExtractiveQA(claim_data=claim, client_provider=client_provider, backend=backend, top_k=top_k)
+        for question, gold in QUESTIONS:
+            context_chars += len(extractive_qa.context_for(question))
+            start = time.perf_counter()
+            answer = extractive_qa.qa(question)
+            latencies.append(time.perf_counter() - start)
+            correct += is_correct(answer, gold(claim))
+    latencies.sort()
+    handwritten = sum(is_correct(backend.answer(question, note), gold) for question, note, gold in HANDWRITTEN_NOTES)
+    return {
+        "backend": backend_name,
+        "context": f"top-{top_k}" if top_k else "full",
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(0.95 * (len(latencies) - 1))] * 1000,
+        "accuracy": correct / len(latencies),
+        "handwritten_accuracy": handwritten / len(HANDWRITTEN_NOTES),
+        "avg_context_chars": context_chars / len(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", default=read_config('DATA_PATH'))
+    parser.add_argument("--top-k", type=int, default=4)
+    parser.add_argument("--backends", default="remote,rules,local")
+    parser.add_argument("--endpoint", help="Send remote calls to this URL (e.g. a stub server) instead of Hugging Face")
+    args = parser.parse_args()
+
+    claims = load_claims(args.data)
+    client_provider = ClientProvider.from_config()
+    client_provider.cache = None
+    if args.endpoint:
+        client_provider.endpoint_url = args.endpoint.rstrip("/")
+
+    print(f"{len(claims)} claims x {len(QUESTIONS)} questions")
+    print(f"{'backend':<8} {'context':<8} {'p50 ms':>10} {'p95 ms':>10} {'accuracy':>9} {'handwrit':>9} "
+          f"{'ctx chars':>10}")
+    for backend_name in args.backends.split(","):
+        if backend_name == "remote" and not (args.endpoint or os.getenv("HF_TOKEN")):
+            print("remote   skipped (set HF_TOKEN or --endpoint)")
+            continue
+        for top_k in (0, args.top_k):
+            try:
+                row = run(backend_name, top_k, claims, client_provider)
+            except ImportError as e:
+                print(f"{backend_name:<8} skipped ({e})")
+                break
+            print(f"{row['backend']:<8} {row['context']:<8} {row['p50_ms']:>10.3f} {row['p95_ms']:>10.3f} "
+                  f"{row['accuracy']:>9.2%} {row['handwritten_accuracy']:>9.2%} {row['avg_context_chars']:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
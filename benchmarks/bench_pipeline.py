@@ -0,0 +1,226 @@
+"""Throughput, latency, memory and concurrency benchmark of the pipeline against a local stub.
+
+Builds (or reuses) a synthetic corpus with benchmarks/corpus.py, starts the
+stub inference server with the given latency/jitter, and measures:
+
+  * ingestion throughput (cold index, warm index, field-projected streaming)
+  * p50/p95/p99 latency per pipeline option
+  * memory high-water marks (process RSS and Python peak per stage)
+  * throughput as concurrency grows
+
+Results can be saved as a baseline and later runs compared against it; the
+run exits non-zero when a metric regresses by more than --tolerance.
+
+    python -m benchmarks.bench_pipeline [--claims 1000] [--latency 0.05 --jitter 0.02]
+        [--save-baseline benchmarks/baselines/1000.json | --baseline benchmarks/baselines/1000.json]
+"""
+from concurrent.futures import ThreadPoolExecutor
+from src.clients import ClientProvider
+from src.data_ingestion import DataIngestion
+from src.holistic_analysis import ANALYSIS_FIELDS
+from src.pipeline import Pipeline
+from src.utils.stub_server import StubInferenceServer
+from benchmarks.corpus import build_corpus, corpus_dir, patient_ids
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import time
+import tracemalloc
+
+# Questions the router hands to the model, so qa/advanced_qa measure the inference path
+QUESTION = "Why was the procedure needed?"
+CLAIM_OPTIONS = ("qa", "advanced_qa", "summary")
+PATIENT_OPTIONS = ("analysis", "history_qa")
+# Absolute slack per metric unit, so sub-millisecond noise does not count as a regression
+MIN_DELTA = {"_ms": 2.0, "_mb": 8.0}
+
+
+def percentile(values, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(int(fraction * len(values)), len(values) - 1)] if values else 0.0
+
+
+def latency_metrics(prefix: str, latencies) -> dict:
+    return {f"{prefix}_p{int(fraction * 100)}_ms": round(percentile(latencies, fraction) * 1000, 3)
+            for fraction in (0.5, 0.95, 0.99)}
+
+
+def rss_mb() -> float:
+    "Process RSS high-water mark in MB (ru_maxrss is KB on Linux, bytes on macOS)"
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def python_peak_mb(fn) -> float:
+    "Peak Python allocations of fn() in MB"
+    tracemalloc.start()
+    try:
+        fn()
+        return round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 2)
+    finally:
+        tracemalloc.stop()
+
+
+def bench_ingestion(data_path: str, patients) -> dict:
+    "Claims per second through DataIngestion; the first pass also builds the claim index"
+    metrics = {}
+    for name, read in (
+        ("ingest_cold", lambda ingestion: ingestion.ingest_patient_data()),
+        ("ingest_warm", lambda ingestion: ingestion.ingest_patient_data()),
+        ("stream_fields", lambda ingestion: ingestion.iter_patient_claims(fields=ANALYSIS_FIELDS)),
+    ):
+        claims = 0
+        start = time.perf_counter()
+        for patient_id in patients:
+            claims += sum(1 for _ in read(DataIngestion(patient_id=patient_id, data_path=data_path)) or ())
+        metrics[f"{name}_claims_per_s"] = round(claims / (time.perf_counter() - start), 1)
+    metrics["ingest_rss_mb"] = rss_mb()
+    return metrics
+
+
+def bench_memory(data_path: str, patient_id: str) -> dict:
+    "Python peak of loading a patient's claims vs the streamed analysis report"
+    return {
+        "ingest_patient_peak_mb": python_peak_mb(
+            lambda: DataIngestion(patient_id=patient_id, data_path=data_path).ingest_patient_data()),
+        "analysis_peak_mb": python_peak_mb(
+            lambda: Pipeline(patient_id=patient_id, data_path=data_path).pipeline("analysis")),
+    }
+
+
+def sample_claims(data_path: str, patients, samples: int, rng: random.Random):
+    "(patient_id, claim_id) pairs picked across the corpus"
+    chosen = rng.sample(patients, min(samples, len(patients)))
+    return [(patient_id, rng.choice(DataIngestion(patient_id=patient_id, data_path=data_path)
+                                    .claim_index.claim_ids(patient_id)))
+            for patient_id in chosen]
+
+
+def run_option(data_path: str, client_provider, option: str, patient_id: str, claim_id: str = None) -> float:
+    pipeline = Pipeline(patient_id=patient_id, claim_id=claim_id, data_path=data_path,
+                        client_provider=client_provider)
+    start = time.perf_counter()
+    result = pipeline.pipeline(option=option, question=QUESTION)
+    if result is None:
+        raise RuntimeError(f"{option} failed for {patient_id}/{claim_id}")
+    return time.perf_counter() - start
+
+
+def bench_options(data_path: str, client_provider, claims) -> dict:
+    metrics = {}
+    for option in CLAIM_OPTIONS + PATIENT_OPTIONS:
+        latencies = [run_option(data_path, client_provider, option, patient_id,
+                                claim_id if option in CLAIM_OPTIONS else None)
+                     for patient_id, claim_id in claims]
+        metrics.update(latency_metrics(option, latencies))
+    metrics["options_rss_mb"] = rss_mb()
+    return metrics
+
+
+def bench_concurrency(data_path: str, client_provider, claims, levels, requests: int) -> dict:
+    "advanced_qa requests per second and p95 latency at each concurrency level"
+    metrics = {}
+    work = [claims[i % len(claims)] for i in range(requests)]
+    for level in levels:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=level) as pool:
+            latencies = list(pool.map(
+                lambda claim: run_option(data_path, client_provider, "advanced_qa", *claim), work))
+        metrics[f"concurrency_{level}_requests_per_s"] = round(len(work) / (time.perf_counter() - start), 1)
+        metrics[f"concurrency_{level}_p95_ms"] = round(percentile(latencies, 0.95) * 1000, 3)
+    return metrics
+
+
+def higher_is_better(name: str) -> bool:
+    return name.endswith("_per_s")
+
+
+def compare(metrics: dict, baseline: dict, tolerance: float) -> list:
+    "Regression messages for metrics worse than the baseline by more than tolerance (a fraction)"
+    regressions = []
+    for name, expected in baseline.items():
+        actual = metrics.get(name)
+        if actual is None or not expected:
+            continue
+        if higher_is_better(name):
+            regressed = actual < expected * (1 - tolerance)
+        else:
+            slack = next((delta for suffix, delta in MIN_DELTA.items() if name.endswith(suffix)), 0.0)
+            regressed = actual > expected * (1 + tolerance) + slack
+        if regressed:
+            regressions.append(f"{name}: {actual} vs baseline {expected}")
+    return regressions
+
+
+def run_suite(data_path: str, samples: int = 20, latency: float = 0.0, jitter: float = 0.0,
+              concurrency=(1, 4, 16), requests: int = 64, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    patients = patient_ids(data_path)
+    metrics = bench_ingestion(data_path, patients)
+    largest = max(patients, key=lambda patient_id: len(os.listdir(os.path.join(data_path, patient_id))))
+    metrics.update(bench_memory(data_path, largest))
+    claims = sample_claims(data_path, patients, samples, rng)
+    with StubInferenceServer(latency=latency, jitter=jitter, seed=seed) as stub:
+        # No result cache and no retries: every request reaches the stub
+        client_provider = ClientProvider(endpoint_url=stub.url, max_retries=0,
+                                         pool_size=max(concurrency))
+        metrics.update(bench_options(data_path, client_provider, claims))
+        metrics.update(bench_concurrency(data_path, client_provider, claims, concurrency, requests))
+    return metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--claims", type=int, default=1000, help="Corpus size (10^3 .. 10^6)")
+    parser.add_argument("--data", help="Use this corpus instead of benchmarks/corpora/<claims>")
+    parser.add_argument("--samples", type=int, default=20, help="Claims/patients timed per option")
+    parser.add_argument("--latency", type=float, default=0.05, help="Stub seconds per inference call")
+    parser.add_argument("--jitter", type=float, default=0.02, help="Extra random stub delay, up to seconds")
+    parser.add_argument("--concurrency", default="1,4,16")
+    parser.add_argument("--requests", type=int, default=64, help="Requests per concurrency level")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="Write the results to this JSON file")
+    parser.add_argument("--save-baseline", help="Write the metrics to this baseline file")
+    parser.add_argument("--baseline", help="Fail if a metric regresses against this baseline file")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed regression, as a fraction")
+    args = parser.parse_args()
+
+    data_path = args.data
+    if not data_path:
+        data_path = corpus_dir(args.claims)
+        manifest = build_corpus(data_path, args.claims, seed=args.seed)
+        print(f"Corpus {data_path}: {manifest['claims']} claims, {manifest['patients']} patients")
+
+    metrics = run_suite(data_path, samples=args.samples, latency=args.latency, jitter=args.jitter,
+                        concurrency=[int(level) for level in args.concurrency.split(",")],
+                        requests=args.requests, seed=args.seed)
+    results = {
+        "corpus": data_path, "latency": args.latency, "jitter": args.jitter,
+        "python": platform.python_version(), "machine": platform.machine(), "metrics": metrics,
+    }
+    for name, value in metrics.items():
+        print(f"{name:<40} {value:>12}")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save_baseline)), exist_ok=True)
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(metrics, json.load(f)["metrics"], args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Import-time benchmark of the CLI, based on `python -X importtime`.
+
+Runs one pipeline option in a fresh interpreter and reports the total
+import time, the slowest modules and any inference backend it loaded.
+Local options (LOCAL_OPTIONS) must not load a backend and must stay within
+STARTUP_BUDGET_MS; tests/test_benchmarks.py fails when either regresses.
+
+    python -m benchmarks.bench_startup [--option analysis] [--patient PA-12345] [--data data/claim] [--top 15]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Options answered without any model call
+LOCAL_OPTIONS = ("analysis",)
+# Heavy modules that only model-backed options may import
+BACKEND_MODULES = ("huggingface_hub", "dotenv", "pandas", "src.clients")
+# Total import time allowed for a local option (about 1.2 s before backends were loaded lazily)
+STARTUP_BUDGET_MS = 500
+SCRIPT = (
+    "import sys\n"
+    "from src.pipeline import Pipeline\n"
+    "Pipeline(patient_id=sys.argv[1], data_path=sys.argv[2] or None).pipeline(sys.argv[3])\n"
+)
+
+
+def import_times(code: str, *args) -> dict:
+    "Run code in a fresh interpreter; {module: (level, self_us, cumulative_us)} from -X importtime"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code, *args], cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # Nesting is shown as two spaces per level after the first
+        level = (len(name) - len(name.lstrip()) - 1) // 2
+        times[name.strip()] = (level, int(self_us), int(cumulative_us))
+    return times
+
+
+def startup_profile(option: str, patient_id: str, data_path: str = None, top: int = 10) -> dict:
+    "Import time and backend modules of running one option from a cold start"
+    times = import_times(SCRIPT, patient_id, data_path or "", option)
+    slowest = sorted(times.items(), key=lambda item: item[1][1], reverse=True)[:top]
+    return {
+        "option": option,
+        "import_ms": round(sum(cumulative for level, _, cumulative in times.values() if level == 0) / 1000, 1),
+        "modules": len(times),
+        "backend_modules": [name for name in BACKEND_MODULES if name in times],
+        "slowest_self_ms": {name: round(self_us / 1000, 1) for name, (_, self_us, _) in slowest},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--option", default="analysis")
+    parser.add_argument("--patient", default="PA-12345")
+    parser.add_argument("--data", help="Claim data directory (default: DATA_PATH)")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+    profile = startup_profile(args.option, args.patient, args.data, args.top)
+    print(json.dumps(profile, indent=2))
+    if args.option in LOCAL_OPTIONS and (profile["backend_modules"] or profile["import_ms"] > STARTUP_BUDGET_MS):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
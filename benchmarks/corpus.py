@@ -0,0 +1,74 @@
+"""Synthetic claim corpora for the benchmarks, generated with data_creation/insurance_data.py.
+
+Corpora are written in parallel in the DATA_PATH layout (<patient>/<claim>/claim_details.json
+and claim_text_data.txt) and are reused when a directory already holds one
+built with the same parameters.
+
+    python -m benchmarks.corpus --claims 100000 [--out benchmarks/corpora/100000] [--seed 0]
+"""
+import argparse
+import json
+import os
+import time
+from datetime import date
+
+MANIFEST = "corpus.json"
+# Fixed 'today' for claim dates, so a seed gives the same corpus on any day
+REFERENCE_DATE = date(2025, 1, 1)
+CORPORA_DIR = os.path.join("benchmarks", "corpora")
+
+
+def corpus_dir(n_claims: int) -> str:
+    return os.path.join(CORPORA_DIR, str(n_claims))
+
+
+def read_manifest(output_dir: str):
+    try:
+        with open(os.path.join(output_dir, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def build_corpus(output_dir: str, n_claims: int, claims_per_patient: int = 8, seed: int = 0,
+                 workers: int = None) -> dict:
+    """Write n_claims claims spread over patients of claims_per_patient claims each; returns the manifest.
+
+    The same seed gives the same patients, claim ids and amounts.
+    """
+    params = {"claims": n_claims, "claims_per_patient": claims_per_patient, "seed": seed}
+    manifest = read_manifest(output_dir)
+    if manifest and all(manifest.get(key) == value for key, value in params.items()):
+        return manifest
+
+    # Imported here: faker is only needed to generate data, not to run the benchmarks
+    from data_creation.insurance_data import generate_dataset
+
+    start = time.perf_counter()
+    result = generate_dataset(output_dir, claims=n_claims,
+                              claims_per_patient=(claims_per_patient, claims_per_patient),
+                              seed=seed, workers=workers, reference_date=REFERENCE_DATE)
+    manifest = {**params, "patients": result["patients"], "build_seconds": round(time.perf_counter() - start, 2)}
+    with open(os.path.join(output_dir, MANIFEST), "w") as f:
+        json.dump(manifest, f)
+    return manifest
+
+
+def patient_ids(output_dir: str):
+    return sorted(name for name in os.listdir(output_dir) if os.path.isdir(os.path.join(output_dir, name)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--claims", type=int, default=1000)
+    parser.add_argument("--out", help=f"Output directory (default {CORPORA_DIR}/<claims>)")
+    parser.add_argument("--claims-per-patient", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, help="Generator processes (default: CPU count)")
+    args = parser.parse_args()
+    print(build_corpus(args.out or corpus_dir(args.claims), args.claims, args.claims_per_patient, args.seed,
+                       args.workers))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,45 @@
+"""Synthetic insurance claims for development and load testing.
+
+    python -m data_creation.insurance_data                                  # the five sample patients
+    python -m data_creation.insurance_data --claims 1000000 --seed 7 --out /tmp/claims [--layout packed]
+
+Generation is deterministic for a seed (and reference date) regardless of the
+number of workers: every patient draws from its own random.Random seeded
+with (seed, patient index), and Faker is only used to sample pools of names
+and sentences up front. Patients are generated in shards across a process
+pool; output is the data/claim/<patient>/<claim>/ layout or packed
+<patient>.claims archives (src/claim_archive.py).
+"""
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
 from faker import Faker
-import random
+import argparse
+import calendar
 import json
 import os
+import random
 import yaml
 
-OUTPUT_DIR = 'data\claim'
-CONFIG_PATH = "data_creation/config.yaml"
+OUTPUT_DIR = os.path.join('data', 'claim')
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.yaml")
 MIN_CLAIMS_PER_PATIENT = 2
 MAX_CLAIMS_PER_PATIENT = 6
+# Faker values sampled once per worker process; claims pick from these pools
+POOL_SIZE = 2000
+# Patients per process pool task
+SHARD_SIZE = 500
+WRITE_BUFFER = 1024 * 1024
+LAYOUTS = ("directory", "packed")
+
+# Generated when neither a patient nor a claim count is given
+SAMPLE_PATIENTS = {
+    "PA-12345": "Hypertension",
+    "PB-24680": "Migraine",
+    "PC-13579": "Asthma",
+    "PD-09876": "Type 2 Diabetes",
+    "PE-54321": "Acute Sinusitis",
+}
 
-fake = Faker()
 with open(CONFIG_PATH, "r") as file:
     data = yaml.safe_load(file)
 
@@ -17,65 +47,85 @@ ICD_CODES = data["ICD_CODES"]
 CPT_CODES = data["CPT_CODES"]
 DRUG_NAMES = data["DRUG_NAMES"]
 PROVIDER_NAMES = data["PROVIDER_NAMES"]
+# Diagnosis -> (procedure, index into PROVIDER_NAMES); others get an office visit with a random provider
+DIAGNOSIS_PROCEDURES = {
+    "Hypertension": ("Echocardiogram", 2),
+    "Migraine": ("MRI Brain w/o Contrast", 1),
+    "Asthma": ("Spirometry (Lung Function Test)", 4),
+    "Type 2 Diabetes": ("Blood Glucose Test", 0),
+}
+
+
+class FakerPool:
+    "Faker output sampled in bulk once, instead of calling Faker for every field of every claim"
 
+    def __init__(self, seed: int, size: int = POOL_SIZE):
+        fake = Faker()
+        fake.seed_instance(seed)
+        self.first_names = [fake.first_name() for _ in range(size)]
+        self.last_names = [fake.last_name() for _ in range(size)]
+        self.sentences = [fake.sentence() for _ in range(size)]
 
-def create_patient_profile(patient_id):
+
+_pools = {}
+
+
+def faker_pool(seed: int) -> FakerPool:
+    "The pool for a seed, built once per process"
+    if seed not in _pools:
+        _pools[seed] = FakerPool(seed)
+    return _pools[seed]
+
+
+def months_ago(reference: date, months: int) -> date:
+    month_index = reference.year * 12 + reference.month - 1 - months
+    year, month = divmod(month_index, 12)
+    return date(year, month + 1, min(reference.day, calendar.monthrange(year, month + 1)[1]))
+
+
+def create_patient_profile(patient_id, rng, pool, reference_date):
+    date_of_birth = reference_date - timedelta(days=rng.randint(20 * 365, 70 * 365))
     return {
         "patient_id": patient_id,
-        "first_name": fake.first_name(),
-        "last_name": fake.last_name(),
-        "date_of_birth": fake.date_between(start_date="-70y", end_date="-20y").isoformat(),
-        "policy_number": fake.bothify(text='P#####-##')
+        "first_name": rng.choice(pool.first_names),
+        "last_name": rng.choice(pool.last_names),
+        "date_of_birth": date_of_birth.isoformat(),
+        "policy_number": f"P{rng.randrange(10 ** 5):05d}-{rng.randrange(100):02d}",
     }
 
 
-def generate_claim(patient_profile, base_diagnosis, claim_number_offset):
-    procedure_key = "Office Visit (Established Patient)"
-    provider = random.choice(PROVIDER_NAMES)
-
-    if base_diagnosis == "Hypertension":
-        procedure_key = "Echocardiogram"
-        provider = PROVIDER_NAMES[2]
-    elif base_diagnosis == "Migraine":
-        procedure_key = "MRI Brain w/o Contrast"
-        provider = PROVIDER_NAMES[1]
-    elif base_diagnosis == "Asthma":
-        procedure_key = "Spirometry (Lung Function Test)"
-        provider = PROVIDER_NAMES[4]
-    elif base_diagnosis == "Type 2 Diabetes":
-        procedure_key = "Blood Glucose Test"
-        provider = PROVIDER_NAMES[0]
-
+def generate_claim(patient_profile, base_diagnosis, claim_number_offset, rng, pool, reference_date, claim_id=None):
+    procedure_key, provider_index = DIAGNOSIS_PROCEDURES.get(base_diagnosis, ("Office Visit (Established Patient)", None))
+    provider = PROVIDER_NAMES[provider_index] if provider_index is not None else rng.choice(PROVIDER_NAMES)
     procedure_code = CPT_CODES[procedure_key]
 
-    visit_date = fake.date_between(
-        start_date=f"-{claim_number_offset}M", end_date=f"-{claim_number_offset}M").isoformat()
+    visit_date = months_ago(reference_date, claim_number_offset).isoformat()
 
-    billed_amount = round(random.uniform(500.0, 3500.0), 2)
-    allowed_amount = round(billed_amount * random.uniform(0.65, 0.85), 2)
-    copay = random.choice([25.0, 50.0, 75.0])
+    billed_amount = round(rng.uniform(500.0, 3500.0), 2)
+    allowed_amount = round(billed_amount * rng.uniform(0.65, 0.85), 2)
+    copay = rng.choice([25.0, 50.0, 75.0])
     insurance_paid = round(allowed_amount - copay, 2)
 
     summary = (
         f"Claim for {base_diagnosis} ({ICD_CODES[base_diagnosis]}). "
         f"Patient presented with symptoms requiring {procedure_key} ({procedure_code}). "
-        f"Recommended medication: {random.choice(DRUG_NAMES)}."
+        f"Recommended medication: {rng.choice(DRUG_NAMES)}."
     )
 
     clinical_note = (
         f"CLINICAL NOTE: Patient {patient_profile['first_name']} {patient_profile['last_name']} (Policy: {patient_profile['policy_number']}) "
         f"was seen today, {visit_date}, by {provider}. The main subjective complaint was a "
         f"recurrent flare-up of their **{base_diagnosis}** symptoms, which are generally well-managed. "
-        f"{fake.paragraph(nb_sentences=2)} Assessment determined the necessity of a diagnostic "
+        f"{' '.join(rng.sample(pool.sentences, 2))} Assessment determined the necessity of a diagnostic "
         f"procedure to confirm the severity: **{procedure_key}** (CPT: {procedure_code}). "
         f"The diagnosis code assigned is **{ICD_CODES[base_diagnosis]}**. The patient was advised "
         f"on the necessity of lifestyle modifications and will be starting the new medication, "
-        f"{random.choice(DRUG_NAMES)}, immediately. Total billed charges for this visit are ${billed_amount:.2f}. "
+        f"{rng.choice(DRUG_NAMES)}, immediately. Total billed charges for this visit are ${billed_amount:.2f}. "
         f"All staff were informed regarding the high priority of the patient's next appointment."
     )
 
     structured_details = {
-        "claim_id": fake.bothify(text='CLM#########'),
+        "claim_id": claim_id or f"CLM{rng.randrange(10 ** 9):09d}",
         "claim_date": visit_date,
         "patient_info": patient_profile,
         "provider_name": provider,
@@ -94,70 +144,151 @@ def generate_claim(patient_profile, base_diagnosis, claim_number_offset):
     return structured_details, clinical_note, summary
 
 
+def generate_patient_claims(patient_id, base_condition, num_claims, rng, pool, reference_date):
+    "The patient's claims as (structured, note, summary), oldest first"
+    patient = create_patient_profile(patient_id, rng, pool, reference_date)
+    other_diagnoses = [d for d in ICD_CODES if d != base_condition]
+    claim_ids = set()
+    claims = []
+    for i in range(1, num_claims + 1):
+        current_diagnosis = base_condition
+        if rng.random() < 0.25 and other_diagnoses:
+            current_diagnosis = rng.choice(other_diagnoses)
+        claim_id = f"CLM{rng.randrange(10 ** 9):09d}"
+        while claim_id in claim_ids:
+            claim_id = f"CLM{rng.randrange(10 ** 9):09d}"
+        claim_ids.add(claim_id)
+        claims.append(generate_claim(patient, current_diagnosis, num_claims - i + 1, rng, pool, reference_date,
+                                     claim_id=claim_id))
+    return claims
 
-def save_claim_files(structured_details, unstructured_note, summary):
+
+def claim_text(unstructured_note, summary):
+    return (
+        "---CLINICAL NOTE ---\n"
+        f"{unstructured_note}\n\n"
+        "---SUMMARY ---\n"
+        f"{summary}\n"
+    )
+
+
+def save_claim_files(structured_details, unstructured_note, summary, output_dir=OUTPUT_DIR):
 
     patient_id = structured_details['patient_info']['patient_id']
     claim_id = structured_details['claim_id']
 
-    claim_dir = os.path.join(OUTPUT_DIR, patient_id, claim_id)
+    claim_dir = os.path.join(output_dir, patient_id, claim_id)
 
     os.makedirs(claim_dir, exist_ok=True)
 
-    with open(os.path.join(claim_dir, 'claim_details.json'), 'w') as f:
-        json.dump(structured_details, f, indent=4)
+    # Each file is rendered in memory and written with a single buffered write
+    with open(os.path.join(claim_dir, 'claim_details.json'), 'w', buffering=WRITE_BUFFER) as f:
+        f.write(json.dumps(structured_details, indent=4))
 
-    text_content = (
-        "---CLINICAL NOTE ---\n"
-        f"{unstructured_note}\n\n"
-        "---SUMMARY ---\n"
-        f"{summary}\n"
-    )
+    with open(os.path.join(claim_dir, 'claim_text_data.txt'), 'w', buffering=WRITE_BUFFER) as f:
+        f.write(claim_text(unstructured_note, summary))
 
-    with open(os.path.join(claim_dir, 'claim_text_data.txt'), 'w') as f:
-        f.write(text_content)
 
+def plan_patients(patients=None, claims=None, claims_per_patient=(MIN_CLAIMS_PER_PATIENT, MAX_CLAIMS_PER_PATIENT),
+                  seed=0):
+    """(patient index, patient id, base condition, claim count) for every patient to generate.
 
-patient_profiles = {
-    "PA-12345": create_patient_profile("PA-12345"),
-    "PB-24680": create_patient_profile("PB-24680"),
-    "PC-13579": create_patient_profile("PC-13579"),
-    "PD-09876": create_patient_profile("PD-09876"),
-    "PE-54321": create_patient_profile("PE-54321"),
-}
+    With neither patients nor claims, the five SAMPLE_PATIENTS. With claims,
+    patients are added until the total is reached (the last one is trimmed).
+    """
+    low, high = claims_per_patient
+    diagnoses = list(ICD_CODES)
+    plan = []
+    if patients is None and claims is None:
+        for index, (patient_id, condition) in enumerate(SAMPLE_PATIENTS.items()):
+            plan.append((index, patient_id, condition, random.Random(f"{seed}:{index}:plan").randint(low, high)))
+        return plan
+    total, index = 0, 0
+    while (patients is None or index < patients) and (claims is None or total < claims):
+        rng = random.Random(f"{seed}:{index}:plan")
+        condition, count = rng.choice(diagnoses), rng.randint(low, high)
+        if claims is not None:
+            count = min(count, claims - total)
+        plan.append((index, f"PT-{index:07d}", condition, count))
+        total += count
+        index += 1
+    return plan
 
-patient_conditions = {
-    "PA-12345": "Hypertension",
-    "PB-24680": "Migraine",
-    "PC-13579": "Asthma",
-    "PD-09876": "Type 2 Diabetes",
-    "PE-54321": "Acute Sinusitis",
-}
 
-total_claims_generated = 0
-all_icd_keys = list(ICD_CODES.keys())
-print("--- STARTING DYNAMIC TEST DATA GENERATION ---")
-for patient_id, base_condition in patient_conditions.items():
-    patient = patient_profiles[patient_id]
+def _generate_shard(task):
+    "Generate and write one shard of patients; returns the number of claims written"
+    output_dir, layout, seed, reference_date, shard = task
+    reference_date = date.fromisoformat(reference_date)
+    pool = faker_pool(seed)
+    written = 0
+    for index, patient_id, condition, num_claims in shard:
+        rng = random.Random(f"{seed}:{index}")
+        claims = generate_patient_claims(patient_id, condition, num_claims, rng, pool, reference_date)
+        if layout == "packed":
+            from src.claim_archive import archive_path, write_archive
+            # claim_id order, as convert_directory() and the claim index read them
+            write_archive(archive_path(output_dir, patient_id),
+                          sorted((structured['claim_id'], structured, claim_text(note, summary))
+                                 for structured, note, summary in claims))
+        else:
+            for structured, note, summary in claims:
+                save_claim_files(structured, note, summary, output_dir=output_dir)
+        written += len(claims)
+    return written
 
-    num_claims = random.randint(MIN_CLAIMS_PER_PATIENT, MAX_CLAIMS_PER_PATIENT)
-    print(
-        f"Generating {num_claims} claims for Patient {patient_id} ({base_condition})...")
 
-    for i in range(1, num_claims + 1):
-        current_diagnosis = base_condition
-        if random.random() < 0.25 and len(all_icd_keys) > 1:
-            available_diagnoses = [d for d in all_icd_keys if d != base_condition]
-            if available_diagnoses:
-                current_diagnosis = random.choice(available_diagnoses)
-        structured, unstructured, summary = generate_claim(
-            patient, current_diagnosis, num_claims - i + 1)
-        save_claim_files(structured, unstructured, summary)
-        total_claims_generated += 1
-
-print("--- FILE GENERATION COMPLETE ---")
-print(f"Total Claims Generated: {total_claims_generated}")
-print(f"Data is organized in the '{OUTPUT_DIR}' directory.")
-print("\nExample Path Structure (Note the single text file):")
-print(f"  {OUTPUT_DIR}/PA-12345/CLM#########/claim_details.json")
-print(f"  {OUTPUT_DIR}/PA-12345/CLM#########/claim_text_data.txt")
+def generate_dataset(output_dir=OUTPUT_DIR, patients=None, claims=None,
+                     claims_per_patient=(MIN_CLAIMS_PER_PATIENT, MAX_CLAIMS_PER_PATIENT), seed=None, workers=None,
+                     layout="directory", reference_date=None, shard_size=SHARD_SIZE):
+    """Generate claims into output_dir; returns {patients, claims, seed, layout, output_dir}.
+
+    The same seed and reference_date (default: today) give the same output
+    for any number of workers.
+    """
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown layout {layout}, expected one of {LAYOUTS}")
+    seed = random.randrange(2 ** 32) if seed is None else seed
+    reference_date = (reference_date or date.today()).isoformat()
+    plan = plan_patients(patients, claims, claims_per_patient, seed)
+    tasks = [(output_dir, layout, seed, reference_date, plan[start:start + shard_size])
+             for start in range(0, len(plan), shard_size)]
+    os.makedirs(output_dir, exist_ok=True)
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+    if workers <= 1:
+        counts = [_generate_shard(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            counts = list(executor.map(_generate_shard, tasks))
+    return {"patients": len(plan), "claims": sum(counts), "seed": seed, "layout": layout, "output_dir": output_dir}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", default=OUTPUT_DIR, help="Output directory")
+    parser.add_argument("--patients", type=int, help="Number of patients (default: the five sample patients)")
+    parser.add_argument("--claims", type=int, help="Total number of claims to generate")
+    parser.add_argument("--min-claims", type=int, default=MIN_CLAIMS_PER_PATIENT, help="Claims per patient, at least")
+    parser.add_argument("--max-claims", type=int, default=MAX_CLAIMS_PER_PATIENT, help="Claims per patient, at most")
+    parser.add_argument("--seed", type=int, help="Seed for reproducible output (default: random, printed)")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: CPU count)")
+    parser.add_argument("--layout", choices=LAYOUTS, default="directory")
+    parser.add_argument("--reference-date", type=date.fromisoformat, help="'Today' for claim dates (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    print("--- STARTING DYNAMIC TEST DATA GENERATION ---")
+    result = generate_dataset(args.out, patients=args.patients, claims=args.claims,
+                              claims_per_patient=(args.min_claims, args.max_claims), seed=args.seed,
+                              workers=args.workers, layout=args.layout, reference_date=args.reference_date)
+    print("--- FILE GENERATION COMPLETE ---")
+    print(f"Total Claims Generated: {result['claims']} for {result['patients']} patients (seed {result['seed']})")
+    print(f"Data is organized in the '{args.out}' directory.")
+    if args.layout == "packed":
+        print(f"  {args.out}/<patient_id>.claims")
+    else:
+        print("\nExample Path Structure (Note the single text file):")
+        print(f"  {args.out}/<patient_id>/CLM#########/claim_details.json")
+        print(f"  {args.out}/<patient_id>/CLM#########/claim_text_data.txt")
+
+
+if __name__ == "__main__":
+    main()
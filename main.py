@@ -1,7 +1,63 @@
 from src.pipeline import Pipeline
+import argparse
 import sys
 
 
+def run_batch_command(argv):
+    from src.batch import run_batch
+    from src.config import read_config
+
+    parser = argparse.ArgumentParser(prog="python -m main batch",
+                                     description="Run one option over every claim in a data directory.")
+    parser.add_argument("--option", required=True, help="Pipeline option, e.g. 'summary' or 'qa'")
+    parser.add_argument("--input", default=read_config('DATA_PATH'), help="Claim data directory")
+    parser.add_argument("--out", required=True, help="JSONL file results are appended to")
+    parser.add_argument("--question", default="", help="Question for 'qa' and 'advanced_qa'")
+    parser.add_argument("--workers", type=int, default=read_config('BATCH_WORKERS', 4))
+    parser.add_argument("--processes", action="store_true", help="Use a process pool instead of threads (each process builds its client from config)")
+    args = parser.parse_args(argv)
+
+    counts = run_batch(option=args.option, input_dir=args.input, out_path=args.out, question=args.question,
+                       workers=args.workers, use_processes=args.processes)
+    print(f"Processed: {counts['processed']}, failed: {counts['failed']}, skipped (already done): {counts['skipped']}")
+
+
+def run_serve_command(argv):
+    from src.server import AgentServer
+
+    parser = argparse.ArgumentParser(prog="python -m main serve",
+                                     description="Serve qa, advanced_qa, summary and analysis over HTTP.")
+    parser.add_argument("--host", default=None, help="Interface to bind (default: SERVER_HOST)")
+    parser.add_argument("--port", type=int, default=None, help="Port to bind (default: SERVER_PORT)")
+    parser.add_argument("--workers", type=int, default=None, help="Concurrent requests (default: SERVER_WORKERS)")
+    parser.add_argument("--queue-size", type=int, default=None,
+                        help="Queued requests before new ones get 503 (default: SERVER_QUEUE_SIZE)")
+    args = parser.parse_args(argv)
+
+    server = AgentServer(host=args.host, port=args.port, workers=args.workers, queue_size=args.queue_size)
+    print(f"Serving on {server.url} (GET /metrics for stats)")
+    server.serve_forever()
+
+
+# Labels printed before each streamed field
+STREAM_LABELS = {"answer": "Answer: ", "reasoning": "Reason: ", "partial": "Partial summary: ",
+                 "summary": "Summary: ", "result": "Output: "}
+
+
+def print_stream(pieces):
+    "Print (field, text) pieces as they arrive, starting a labelled line whenever the field changes"
+    current = None
+    for field, text in pieces:
+        if field != current or field == "partial":
+            if current is not None:
+                print()
+            print(STREAM_LABELS.get(field, f"{field}: "), end="")
+            current = field
+        print(text, end="", flush=True)
+    if current is not None:
+        print()
+
+
 def run():
     try:
         arg_count = len(sys.argv) - 1
@@ -9,14 +65,37 @@ def run():
             print("Usage: python -m main <option> [question]")
             print("  <option>   : required argument (e.g., 'qa', 'summary')")
             print("  [question] : optional argument (string, e.g., 'What is diagnosis?')")
+            print("  --stream   : print advanced_qa/summary output as it is generated")
+            print("       python -m main batch --option <option> --input data/claim --out results.jsonl")
+            print("       python -m main serve [--port 8000]")
 
             sys.exit(1)
 
         option = sys.argv[1]
-        question = " ".join(sys.argv[2:]) if arg_count > 1 else ""
+        if option == "batch":
+            run_batch_command(sys.argv[2:])
+            return
+        if option == "serve":
+            run_serve_command(sys.argv[2:])
+            return
+        arguments = sys.argv[2:]
+        stream = "--stream" in arguments
+        question = " ".join(argument for argument in arguments if argument != "--stream")
 
         pipeline = Pipeline(patient_id="PA-12345", claim_id="CLM153910000") # You can change patient_id and claim_id with any other id in data/claim folder
-        print(pipeline.pipeline(option=option, question=question))
+        if stream:
+            print_stream(pipeline.pipeline(option=option, question=question, stream=True))
+        else:
+            result = pipeline.pipeline(option=option, question=question)
+            if option == "analysis":
+                from src.holistic_analysis import HolisticAnalysis
+                result = HolisticAnalysis.format_report(result)
+            print(result)
+
+        from src.config import read_config
+        from src.utils.tracing import tracer
+        if tracer.enabled and read_config('TRACE_EXPORT_PATH'):
+            tracer.export(read_config('TRACE_EXPORT_PATH'))
 
     except Exception as e:
         print(f"Error: {e}")
@@ -25,4 +104,3 @@ def run():
 
 if __name__ == "__main__":
     run()
-
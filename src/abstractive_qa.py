@@ -1,52 +1,157 @@
 from src.config import read_config
-from huggingface_hub import InferenceClient
-import os
+from src.clients import BACKEND_CHAT, get_client_provider
+from src.prompt_builder import PromptBuilder, PromptRecord, prompt_recorder
+from src.streaming import JSONFieldStream, StreamMeter, delta_text
 import json
 
 
 class AbstractiveQA:
-    def __init__(self,claim_data:str):
+    def __init__(self,claim_data:str, client_provider=None, prompt_builder=None):
         self.system_prompt = read_config('SYSTEM_PROMPT_ABSTRACIVE_QA')
         if not self.system_prompt:
             raise ValueError("No System prompt available.")
         self.model = read_config("LLM_MODEL")
         self.claim_data = claim_data
+        self.client_provider = client_provider or get_client_provider()
+        self.prompt_builder = prompt_builder or PromptBuilder.from_config()
+        # Token counts and stage timings of the last qa()/aqa() call
+        self.last_record = None
+        # (answer, reasoning) of the last qa_stream()/aqa_stream() call
+        self.last_result = None
+
+    def build_messages(self, question: str, record: PromptRecord = None):
+        "Chat messages asking the question about this claim, within the prompt token budget"
+        return self.prompt_builder.qa_messages(self.system_prompt, self.claim_data, question, record)
+
+    def parse_response(self, response):
+        "Extract (answer, reasoning) from the JSON chat completion"
+        return self.parse_content(response.choices[0].message.content)
+
+    @staticmethod
+    def parse_content(content: str):
+        json_result = json.loads(content)
+        return json_result['answer'], json_result['reasoning']
+
+    def _stream_kwargs(self, messages):
+        return {"messages": messages, "model": self.model, "max_tokens": 512, "temperature": 0.1}
+
+    @staticmethod
+    def _record_usage(record: PromptRecord, response):
+        completion_tokens = getattr(getattr(response, "usage", None), "completion_tokens", None)
+        if isinstance(completion_tokens, int):
+            record.completion_tokens = completion_tokens
+
+    def _finish(self, record: PromptRecord):
+        self.last_record = record
+        prompt_recorder.record(record)
 
     def qa(self, question: str):
+        record = PromptRecord("qa")
         try:
+            with record.stage("build"):
+                messages = self.build_messages(question, record)
+            with record.stage("call"):
+                record.calls += 1
+                response = self.client_provider.call(
+                    BACKEND_CHAT,
+                    "chat_completion",
+                    messages=messages,
+                    model=self.model,
+                    max_tokens=512,
+                    temperature=0.1,
+
+                )
+            self._record_usage(record, response)
+            with record.stage("parse"):
+                return self.parse_response(response)
+        except Exception as e:
+            print(f"Raise Exception {e}")
+            return None
+        finally:
+            self._finish(record)
 
-            user_query = (
-                f"Based on the following clinical note, please answer my question.\n\n"
-                f"--- CLAIM DETAILS ---\n"
-                f"{self.claim_data}\n\n"
-                f"--- QUESTION ---\n"
-                f"{question}"
-            )
-            messages = [
-                {"role": "system", "content": self.system_prompt},
-                {"role": "user", "content": user_query}
-            ]
-            client = InferenceClient(token=os.getenv("HF_TOKEN"))
-
-            response = client.chat_completion(
-                messages=messages,
-                model=self.model,
-                max_tokens=512,
-                temperature=0.1,
-
-            )
-            result = response.choices[0].message.content
-            json_result = json.loads(result)
-            return json_result['answer'], json_result['reasoning']
+    async def aqa(self, question: str):
+        "Async version of qa()"
+        record = PromptRecord("qa")
+        try:
+            with record.stage("build"):
+                messages = self.build_messages(question, record)
+            with record.stage("call"):
+                record.calls += 1
+                response = await self.client_provider.acall(
+                    BACKEND_CHAT,
+                    "chat_completion",
+                    messages=messages,
+                    model=self.model,
+                    max_tokens=512,
+                    temperature=0.1,
+                )
+            self._record_usage(record, response)
+            with record.stage("parse"):
+                return self.parse_response(response)
         except Exception as e:
             print(f"Raise Exception {e}")
             return None
+        finally:
+            self._finish(record)
 
+    def qa_stream(self, question: str):
+        """Like qa(), but yields ("answer", text) and then ("reasoning", text) pieces as the model
+        generates them; the parsed (answer, reasoning) is kept in last_result"""
+        record = PromptRecord("qa")
+        self.last_result = None
+        try:
+            with record.stage("build"):
+                messages = self.build_messages(question, record)
+            record.calls += 1
+            parser, meter, pieces = JSONFieldStream(), StreamMeter(), []
+            for chunk in self.client_provider.stream(BACKEND_CHAT, "chat_completion", **self._stream_kwargs(messages)):
+                text = delta_text(chunk)
+                if text:
+                    meter.tick()
+                    pieces.append(text)
+                    yield from parser.feed(text)
+            meter.apply(record)
+            with record.stage("parse"):
+                self.last_result = self.parse_content("".join(pieces))
+        except Exception as e:
+            print(f"Raise Exception {e}")
+        finally:
+            self._finish(record)
+
+    async def aqa_stream(self, question: str):
+        "Async version of qa_stream()"
+        record = PromptRecord("qa")
+        self.last_result = None
+        try:
+            with record.stage("build"):
+                messages = self.build_messages(question, record)
+            record.calls += 1
+            parser, meter, pieces = JSONFieldStream(), StreamMeter(), []
+            async for chunk in self.client_provider.astream(BACKEND_CHAT, "chat_completion",
+                                                            **self._stream_kwargs(messages)):
+                text = delta_text(chunk)
+                if text:
+                    meter.tick()
+                    pieces.append(text)
+                    for delta in parser.feed(text):
+                        yield delta
+            meter.apply(record)
+            with record.stage("parse"):
+                self.last_result = self.parse_content("".join(pieces))
+        except Exception as e:
+            print(f"Raise Exception {e}")
+        finally:
+            self._finish(record)
 
 if __name__ == "__main__":
     from src.data_ingestion import DataIngestion
     data_ingestion = DataIngestion(patient_id="PA-12345")
     claim_data = data_ingestion.ingest_claim_data(claim_path='CLM153910000')
-    abstractive_qa = AbstractiveQA()
-    result = abstractive_qa.qa(data=claim_data, question="Who is the doctor")
+    abstractive_qa = AbstractiveQA(claim_data=claim_data)
+    result = abstractive_qa.qa(question="Who is the doctor")
     print(result)
+    print(abstractive_qa.last_record)
+    for field, text in abstractive_qa.qa_stream(question="Who is the doctor"):
+        print(text, end="", flush=True)
+    print()
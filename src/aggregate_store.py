@@ -0,0 +1,312 @@
+from typing import Dict, List, Optional
+import json
+import sqlite3
+import threading
+import time
+
+from src.holistic_analysis import AMOUNT_COLUMNS, _amount, _period, _round, amount_percentiles, ratio_outliers
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS claim_contributions (
+    patient_id TEXT NOT NULL,
+    claim_id TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    period TEXT,
+    provider_name TEXT,
+    primary_diagnosis TEXT,
+    billed_amount REAL,
+    allowed_amount REAL,
+    copay REAL,
+    insurance_paid REAL,
+    PRIMARY KEY (patient_id, claim_id)
+);
+CREATE TABLE IF NOT EXISTS patient_aggregates (
+    patient_id TEXT PRIMARY KEY,
+    aggregate TEXT NOT NULL,
+    verified_at REAL NOT NULL
+);
+"""
+
+CONTRIBUTION_COLUMNS = ("claim_id", "mtime_ns", "period", "provider_name", "primary_diagnosis") + AMOUNT_COLUMNS
+INDEX_COLUMNS = ("mtime_ns", "claim_date", "provider_name", "primary_diagnosis") + AMOUNT_COLUMNS
+# Running sums drift by float rounding; anything within this is not a mismatch
+TOLERANCE = 0.01
+
+
+def _empty_aggregate() -> Dict:
+    return {"claims": 0, "totals": dict.fromkeys(AMOUNT_COLUMNS, 0.0), "providers": {}, "diagnoses": {},
+            "trends": {}, "patient_info": None, "percentiles": {}, "outliers": []}
+
+
+def _contribution(row) -> Dict:
+    "Per-claim contribution from a ClaimIndex row"
+    return {
+        "claim_id": row["claim_id"],
+        "mtime_ns": row["mtime_ns"],
+        "period": _period(row["claim_date"]),
+        "provider_name": row["provider_name"],
+        "primary_diagnosis": row["primary_diagnosis"],
+        **{name: row[name] for name in AMOUNT_COLUMNS},
+    }
+
+
+def _apply(aggregate: Dict, contribution: Dict, sign: int):
+    "Add (sign=1) or subtract (sign=-1) one claim from an aggregate in place"
+    aggregate["claims"] += sign
+    for key, field in (("providers", "provider_name"), ("diagnoses", "primary_diagnosis")):
+        value = contribution[field]
+        if value is not None:
+            counts = aggregate[key]
+            counts[value] = counts.get(value, 0) + sign
+            if counts[value] <= 0:
+                del counts[value]
+    trend = None
+    if contribution["period"] is not None:
+        trend = aggregate["trends"].setdefault(
+            contribution["period"], {"claims": 0, **dict.fromkeys(AMOUNT_COLUMNS, 0.0)})
+        trend["claims"] += sign
+    for name in AMOUNT_COLUMNS:
+        value = _amount(contribution[name])
+        if value == value:
+            aggregate["totals"][name] += sign * value
+            if trend is not None:
+                trend[name] += sign * value
+    if trend is not None and trend["claims"] <= 0:
+        del aggregate["trends"][contribution["period"]]
+
+
+def _same(left: Dict, right: Dict) -> bool:
+    "Aggregates are equal up to float drift in the running sums"
+    if (left["claims"], left["providers"], left["diagnoses"]) != (right["claims"], right["providers"], right["diagnoses"]):
+        return False
+    if set(left["trends"]) != set(right["trends"]):
+        return False
+    pairs = [(left["totals"], right["totals"])] + [(left["trends"][p], right["trends"][p]) for p in left["trends"]]
+    return all(a.get("claims") == b.get("claims") and
+               all(abs(a[name] - b[name]) <= TOLERANCE for name in AMOUNT_COLUMNS) for a, b in pairs)
+
+
+class AggregateStore:
+    """Materialized per-patient claim aggregates, kept next to the ClaimIndex.
+
+    Totals, provider and diagnosis counts and monthly trends are stored per
+    patient and updated by applying only the claims that were added, edited
+    or removed since the last sync (detected against the index mtimes);
+    percentiles and outliers are recomputed from the stored per-claim
+    amounts only when a sync changed something. Reads within check_interval
+    seconds of a sync are a dictionary lookup; every verify_interval seconds
+    a background thread compares the aggregate against a full recompute and
+    rebuilds it if it drifted.
+    """
+
+    _shared: Dict[int, "AggregateStore"] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, claim_index, check_interval: float = 5.0, verify_interval: float = 3600.0):
+        self.claim_index = claim_index
+        self.check_interval = check_interval
+        self.verify_interval = verify_interval
+        # Lives in the same database file as the index it mirrors
+        self._conn = sqlite3.connect(claim_index.index_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.RLock()
+        self._cache: Dict[str, Dict] = {}
+        self._checked: Dict[str, float] = {}
+        self._verifying = set()
+        self.syncs = 0
+        self.claims_applied = 0
+        self.verifications = 0
+        self.mismatches = 0
+
+    @classmethod
+    def shared(cls, claim_index, check_interval: float = 5.0, verify_interval: float = 3600.0) -> "AggregateStore":
+        "Return one long-lived store per claim index"
+        with cls._shared_lock:
+            store = cls._shared.get(id(claim_index))
+            if store is None or store.claim_index is not claim_index:
+                store = cls._shared[id(claim_index)] = cls(claim_index, check_interval, verify_interval)
+            return store
+
+    def _load(self, patient_id: str):
+        row = self._conn.execute(
+            "SELECT aggregate, verified_at FROM patient_aggregates WHERE patient_id = ?", (patient_id,)).fetchone()
+        if row is None:
+            # Built from scratch by the sync that follows, so verified now
+            return _empty_aggregate(), time.time()
+        return json.loads(row["aggregate"]), row["verified_at"]
+
+    def _contributions(self, patient_id: str) -> Dict[str, sqlite3.Row]:
+        return {row["claim_id"]: row for row in self._conn.execute(
+            f"SELECT {', '.join(CONTRIBUTION_COLUMNS)} FROM claim_contributions WHERE patient_id = ?",
+            (patient_id,))}
+
+    def _distributions(self, aggregate: Dict, patient_id: str):
+        "Set the percentiles and outliers of an aggregate from the stored per-claim amounts"
+        rows = self._conn.execute(
+            f"SELECT claim_id, {', '.join(AMOUNT_COLUMNS)} FROM claim_contributions "
+            f"WHERE patient_id = ? ORDER BY claim_id", (patient_id,)).fetchall()
+        amounts = {name: [_amount(row[name]) for row in rows] for name in AMOUNT_COLUMNS}
+        aggregate["percentiles"] = amount_percentiles(amounts)
+        aggregate["outliers"] = ratio_outliers(amounts["billed_amount"], amounts["allowed_amount"],
+                                               [row["claim_id"] for row in rows],
+                                               (aggregate["patient_info"] or {}).get('patient_id'))
+
+    def _save(self, patient_id: str, aggregate: Dict, verified_at: float, removed: List[str], added: List[Dict]):
+        with self._conn:
+            self._conn.executemany(
+                "DELETE FROM claim_contributions WHERE patient_id = ? AND claim_id = ?",
+                [(patient_id, claim_id) for claim_id in removed])
+            placeholders = ", ".join("?" for _ in CONTRIBUTION_COLUMNS)
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO claim_contributions (patient_id, {', '.join(CONTRIBUTION_COLUMNS)}) "
+                f"VALUES (?, {placeholders})",
+                [(patient_id, *(item[column] for column in CONTRIBUTION_COLUMNS)) for item in added])
+            if removed or added or "percentiles" not in aggregate:
+                self._distributions(aggregate, patient_id)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO patient_aggregates (patient_id, aggregate, verified_at) VALUES (?, ?, ?)",
+                (patient_id, json.dumps(aggregate), verified_at))
+        self._cache[patient_id] = aggregate
+
+    def sync(self, patient_id: str) -> Dict[str, List[str]]:
+        "Apply claims added, changed or removed since the last sync; returns the claim ids applied"
+        self.claim_index.refresh_patient(patient_id)
+        with self._lock:
+            aggregate, verified_at = self._load(patient_id)
+            stored = self._contributions(patient_id)
+            current = {row["claim_id"]: row for row in self.claim_index.iter_claims(
+                patient_id, columns=("mtime_ns",), refresh=False)}
+            changes = {
+                "added": sorted(current.keys() - stored.keys()),
+                "changed": sorted(claim_id for claim_id in current.keys() & stored.keys()
+                                  if current[claim_id]["mtime_ns"] != stored[claim_id]["mtime_ns"]),
+                "removed": sorted(stored.keys() - current.keys()),
+            }
+            added = []
+            for claim_id in changes["removed"] + changes["changed"]:
+                _apply(aggregate, stored[claim_id], -1)
+            for claim_id in changes["added"] + changes["changed"]:
+                row = self.claim_index.get_claim(patient_id, claim_id)
+                if row is None:
+                    continue
+                if aggregate["patient_info"] is None:
+                    aggregate["patient_info"] = json.loads(row["details"]).get("patient_info") or {}
+                contribution = _contribution(row)
+                _apply(aggregate, contribution, 1)
+                added.append(contribution)
+            if added or changes["removed"] or patient_id not in self._cache:
+                self._save(patient_id, aggregate, verified_at, changes["removed"], added)
+            self._checked[patient_id] = time.monotonic()
+            self.syncs += 1
+            self.claims_applied += len(added) + len(changes["removed"])
+        return changes
+
+    def recompute(self, patient_id: str, refresh: bool = True) -> Dict:
+        "Aggregate built from scratch over the index (the reference for verify()), without distributions"
+        aggregate = _empty_aggregate()
+        for row in self.claim_index.iter_claims(patient_id, columns=INDEX_COLUMNS + ("details",), refresh=refresh):
+            if aggregate["patient_info"] is None:
+                aggregate["patient_info"] = json.loads(row["details"]).get("patient_info") or {}
+            _apply(aggregate, _contribution(row), 1)
+        return aggregate
+
+    def verify(self, patient_id: str) -> bool:
+        "Compare the materialized aggregate with a full recompute; rebuild it if they differ"
+        with self._lock:
+            self.sync(patient_id)
+            expected = self.recompute(patient_id, refresh=False)
+            aggregate, _ = self._load(patient_id)
+            matched = _same(aggregate, expected)
+            self.verifications += 1
+            if not matched:
+                self.mismatches += 1
+                print(f"Aggregate for patient {patient_id} drifted from a full recompute; rebuilding")
+                with self._conn:
+                    self._conn.execute("DELETE FROM claim_contributions WHERE patient_id = ?", (patient_id,))
+                contributions = [_contribution(row) for row in self.claim_index.iter_claims(
+                    patient_id, columns=INDEX_COLUMNS, refresh=False)]
+                self._save(patient_id, expected, time.time(), [], contributions)
+            else:
+                with self._conn:
+                    self._conn.execute("UPDATE patient_aggregates SET verified_at = ? WHERE patient_id = ?",
+                                       (time.time(), patient_id))
+        return matched
+
+    def aggregate(self, patient_id: str) -> Dict:
+        "Materialized aggregate of a patient, synced at most every check_interval seconds"
+        checked = self._checked.get(patient_id)
+        if checked is None or time.monotonic() - checked >= self.check_interval:
+            self.sync(patient_id)
+            with self._lock:
+                verified_at = self._load(patient_id)[1]
+            if time.time() - verified_at >= self.verify_interval:
+                self._verify_in_background(patient_id)
+        return self._cache[patient_id]
+
+    def _verify_in_background(self, patient_id: str) -> Optional[threading.Thread]:
+        "Run verify() on a daemon thread, unless one is already running for this patient"
+        with self._lock:
+            if patient_id in self._verifying:
+                return None
+            self._verifying.add(patient_id)
+
+        def run():
+            try:
+                self.verify(patient_id)
+            except Exception as e:
+                print(e)
+            finally:
+                with self._lock:
+                    self._verifying.discard(patient_id)
+
+        thread = threading.Thread(target=run, name=f"verify-{patient_id}", daemon=True)
+        thread.start()
+        return thread
+
+    def report(self, patient_id: str, distributions: bool = True) -> Optional[Dict]:
+        """Holistic report of a patient, shaped like HolisticAnalysis.analysis().
+
+        Everything is read from the materialized aggregate, including the
+        percentiles and outliers kept up to date by sync().
+        """
+        aggregate = self.aggregate(patient_id)
+        if not aggregate["claims"]:
+            return None
+        patient_info = aggregate["patient_info"] or {}
+        totals = aggregate["totals"]
+        report = {
+            "patient_id": patient_info.get('patient_id'),
+            "patient_name": f"{patient_info.get('first_name', '')} {patient_info.get('last_name', '')}".strip(),
+            "total_copay": _round(totals["copay"]),
+            "total_allowed_amount": _round(totals["allowed_amount"]),
+            "total_insurance_paid": _round(totals["insurance_paid"]),
+            "total_billed_amount": _round(totals["billed_amount"]),
+            "providers": sorted(aggregate["providers"]),
+            "diagnosis_counts": dict(sorted(aggregate["diagnoses"].items(), key=lambda item: (-item[1], item[0]))),
+            "total_claims_count": aggregate["claims"],
+        }
+        if distributions:
+            report["percentiles"] = aggregate["percentiles"]
+        report["trends"] = [{"period": period, "claims": trend["claims"],
+                             **{name: _round(trend[name]) for name in AMOUNT_COLUMNS}}
+                            for period, trend in sorted(aggregate["trends"].items())]
+        if distributions:
+            report["outliers"] = aggregate["outliers"]
+        return report
+
+    def stats(self) -> dict:
+        return {
+            "syncs": self.syncs,
+            "claims_applied": self.claims_applied,
+            "verifications": self.verifications,
+            "mismatches": self.mismatches,
+        }
+
+
+if __name__ == "__main__":
+    from src.config import read_config
+    from src.claim_index import ClaimIndex
+    store = AggregateStore.shared(ClaimIndex.shared(read_config('DATA_PATH'), read_config('CLAIM_INDEX_PATH')))
+    print(store.report("PA-12345"))
+    print(store.verify("PA-12345"), store.stats())
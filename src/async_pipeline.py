@@ -0,0 +1,90 @@
+from src.config import read_config
+from src.pipeline import Pipeline
+from src.abstractive_qa import AbstractiveQA
+from src.extractive_qa import ExtractiveQA
+from src.summary import Summarization
+from src.batched_qa import BatchedQA
+from src.clients import get_client_provider
+from typing import Dict, List, Sequence, Union
+import asyncio
+
+QA_OPTIONS = ("qa", "advanced_qa")
+
+
+class AsyncPipeline:
+    """Asyncio front-end over Pipeline that fans many questions out concurrently.
+
+    Every model call for a claim (extractive QA, abstractive QA and the
+    summary) runs at the same time, bounded by ASYNC_CONCURRENCY in-flight
+    requests.
+    """
+
+    def __init__(self, patient_id: str, claim_id: str = None, concurrency: int = None, client_provider=None):
+        self.pipeline = Pipeline(patient_id=patient_id, claim_id=claim_id)
+        self.concurrency = concurrency or read_config('ASYNC_CONCURRENCY', 8)
+        self.client_provider = client_provider or get_client_provider()
+
+    async def _claim(self, claim: Union[Dict, str, None]):
+        "Resolve a claim given as details dict, claim id or None (the pipeline's claim)"
+        if isinstance(claim, dict):
+            return claim
+        if claim is None:
+            return await asyncio.to_thread(lambda: self.pipeline.claim_data)
+        return await asyncio.to_thread(self.pipeline.data_ingestion.ingest_claim_data, claim)
+
+    async def answer_many(self, claim: Union[Dict, str, None], questions: Sequence[str],
+                          options: Sequence[str] = QA_OPTIONS, summary: bool = True, batched: bool = False) -> Dict:
+        """Answer every question with each QA option, plus a summary, concurrently.
+
+        Returns {"summary": ..., "answers": [{"question": ..., <option>: ...}, ...]}
+        with answers in the same order as questions. With `batched`, all
+        advanced_qa questions share BatchedQA prompts instead of one call each.
+        """
+        claim_data = await self._claim(claim)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def limited(coroutine):
+            async with semaphore:
+                return await coroutine
+
+        handlers = {}
+        if "qa" in options:
+            handlers["qa"] = ExtractiveQA(claim_data=claim_data, client_provider=self.client_provider).aqa
+        if "advanced_qa" in options and not batched:
+            handlers["advanced_qa"] = AbstractiveQA(claim_data=claim_data, client_provider=self.client_provider).aqa
+
+        keys = [(question, option) for question in questions for option in handlers]
+        coroutines = [limited(handlers[option](question)) for question, option in keys]
+        batched_answers = None
+        if "advanced_qa" in options and batched:
+            batched_qa = BatchedQA(client_provider=self.client_provider)
+            batched_answers = asyncio.ensure_future(
+                limited(batched_qa.aanswer_many([claim_data], [(0, question) for question in questions])))
+        if summary:
+            summarization = Summarization(client_provider=self.client_provider)
+            coroutines.append(limited(summarization.asummarize(claim_data=claim_data)))
+
+        results = await asyncio.gather(*coroutines)
+
+        answers: List[Dict] = [{"question": question} for question in questions]
+        for index, ((_, option), result) in enumerate(zip(keys, results)):
+            answers[index // len(handlers)][option] = result
+        if batched_answers is not None:
+            for answer, batched_answer in zip(answers, await batched_answers or [{}] * len(answers)):
+                answer["advanced_qa"] = ((batched_answer["answer"], batched_answer["reasoning"])
+                                         if batched_answer.get("answer") is not None else None)
+        return {"summary": results[-1] if summary else None, "answers": answers}
+
+    def answer_many_sync(self, claim: Union[Dict, str, None], questions: Sequence[str], **kwargs) -> Dict:
+        "Run answer_many() from synchronous code"
+        async def run():
+            try:
+                return await self.answer_many(claim, questions, **kwargs)
+            finally:
+                await self.client_provider.aclose()
+        return asyncio.run(run())
+
+
+if __name__ == "__main__":
+    async_pipeline = AsyncPipeline(patient_id="PA-12345", claim_id="CLM153910000")
+    print(async_pipeline.answer_many_sync(None, ["Who is the doctor?", "What is the diagnosis?"]))
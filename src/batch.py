@@ -0,0 +1,145 @@
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Iterator, Optional, Set, Tuple
+import dataclasses
+import json
+import os
+
+# Options that work on a whole patient rather than a single claim
+PATIENT_OPTIONS = {"analysis", "history_qa", "patient_qa"}
+
+
+def iter_units(input_dir: str, option: str) -> Iterator[Tuple[str, Optional[str]]]:
+    "Stream (patient_id, claim_id) pairs from data/claim/<patient>/<claim>/ without listing everything up front"
+    with os.scandir(input_dir) as patients:
+        for patient in patients:
+            if not patient.is_dir():
+                continue
+            if option in PATIENT_OPTIONS:
+                yield patient.name, None
+                continue
+            with os.scandir(patient.path) as claims:
+                for claim in claims:
+                    if claim.is_dir():
+                        yield patient.name, claim.name
+
+
+def to_jsonable(result):
+    "Convert pipeline results (dataclasses, tuples, inference outputs) to JSON-friendly values"
+    if dataclasses.is_dataclass(result) and not isinstance(result, type):
+        return dataclasses.asdict(result)
+    if isinstance(result, dict):
+        return {key: to_jsonable(value) for key, value in result.items()}
+    if isinstance(result, (list, tuple, set)):
+        return [to_jsonable(value) for value in result]
+    return result
+
+
+def _unit_key(record: dict) -> Tuple[str, Optional[str], Optional[str], Optional[str]]:
+    "Resume key of a JSONL record: the same claim asked another option or question is another unit"
+    return record["patient_id"], record.get("claim_id"), record.get("option"), record.get("question")
+
+
+def load_completed(out_path: str, option: str, question: str = "") -> Set[Tuple]:
+    """Unit keys (patient_id, claim_id, option, question) already written successfully.
+
+    Drops a partially written last line left by a crash, and the failure
+    records of earlier runs of this option and question: those units are
+    retried and written again, so each unit keeps one record.
+    """
+    completed = set()
+    if not os.path.exists(out_path):
+        return completed
+    run = (option, question or None)
+
+    def retried(record) -> bool:
+        return record.get("error") is not None and _unit_key(record)[2:] == run
+
+    valid_size, failures = 0, 0
+    with open(out_path, 'rb') as file:
+        for line in file:
+            if not line.endswith(b"\n"):
+                break
+            valid_size += len(line)
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("error") is None:
+                completed.add(_unit_key(record))
+            elif retried(record):
+                failures += 1
+    if not failures:
+        with open(out_path, 'rb+') as file:
+            file.truncate(valid_size)
+        return completed
+    # Copy the file without those failure records, then swap it in so a crash here leaves the old file
+    temp_path = out_path + ".tmp"
+    with open(out_path, 'rb') as file, open(temp_path, 'wb') as out:
+        for line in file:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                dropped = retried(json.loads(line))
+            except ValueError:
+                dropped = False
+            if not dropped:
+                out.write(line)
+    os.replace(temp_path, out_path)
+    return completed
+
+
+def process_unit(option: str, data_path: str, patient_id: str, claim_id: Optional[str], question: str = ""):
+    "Run one pipeline option for one claim (or patient) and return a JSONL record"
+    from src.pipeline import Pipeline
+    record = {"patient_id": patient_id, "claim_id": claim_id, "option": option, "question": question or None}
+    try:
+        pipeline = Pipeline(patient_id=patient_id, claim_id=claim_id, data_path=data_path)
+        result = pipeline.pipeline(option=option, question=question)
+        if result is None and option not in PATIENT_OPTIONS:
+            raise RuntimeError("Pipeline returned no result")
+        record["result"] = to_jsonable(result)
+        record["error"] = None
+    except Exception as e:
+        record["result"] = None
+        record["error"] = str(e)
+    return record
+
+
+def run_batch(option: str, input_dir: str, out_path: str, question: str = "", workers: int = 4,
+              use_processes: bool = False) -> dict:
+    """Process every claim under input_dir and append one JSON line per claim to out_path.
+
+    Units already present in out_path for the same option and question are
+    skipped, so an interrupted run resumes where it stopped; units that
+    failed are retried. At most 2 * workers units
+    are in flight at a time. With use_processes, each worker process builds its
+    own client provider from config, so a provider set with
+    src.clients.set_client_provider() only applies to threads.
+    """
+    completed = load_completed(out_path, option, question)
+    executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    counts = {"processed": 0, "failed": 0, "skipped": 0}
+    max_in_flight = max(1, workers) * 2
+
+    with executor_class(max_workers=workers) as executor, open(out_path, 'a') as out:
+        pending = set()
+
+        def drain(return_when):
+            nonlocal pending
+            done, pending = wait(pending, return_when=return_when)
+            for future in done:
+                record = future.result()
+                out.write(json.dumps(record, default=str) + "\n")
+                out.flush()
+                counts["failed" if record["error"] else "processed"] += 1
+
+        for patient_id, claim_id in iter_units(input_dir, option):
+            if (patient_id, claim_id, option, question or None) in completed:
+                counts["skipped"] += 1
+                continue
+            pending.add(executor.submit(process_unit, option, input_dir, patient_id, claim_id, question))
+            if len(pending) >= max_in_flight:
+                drain(FIRST_COMPLETED)
+        while pending:
+            drain(FIRST_COMPLETED)
+    return counts
@@ -0,0 +1,284 @@
+from typing import Dict, Iterable, List, Sequence, Tuple
+import asyncio
+import json
+import re
+
+from src.config import read_config
+from src.clients import BACKEND_CHAT, get_client_provider
+from src.prompt_builder import PromptBuilder, PromptRecord, prompt_recorder
+from src.scheduler import PRIORITY_BULK
+from src.abstractive_qa import AbstractiveQA
+
+# Question lines of a batched prompt: "[<id>] <question>"
+QUESTION_LINE = "[{id}] {question}"
+QUESTIONS_HEADER = "--- QUESTIONS ---"
+JSON_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+
+def parse_batch(content: str, ids: Sequence[int]) -> Dict[int, Dict]:
+    "Answers by question id from a JSON array response; raises ValueError if it is not a JSON array"
+    text = JSON_FENCE.sub("", content.strip())
+    start, end = text.find("["), text.rfind("]")
+    if start < 0 or end < start:
+        raise ValueError("Batched response has no JSON array")
+    items = json.loads(text[start:end + 1])
+    if not isinstance(items, list):
+        raise ValueError("Batched response is not a JSON array")
+    wanted = set(ids)
+    answers = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        try:
+            item_id = int(item.get("id"))
+        except (TypeError, ValueError):
+            continue
+        if item_id in wanted and "answer" in item:
+            answers[item_id] = item
+    return answers
+
+
+class BatchedQA:
+    """advanced_qa for many (claim, question) pairs with few chat completions.
+
+    Pairs are packed into prompts of at most PROMPT_MAX_TOKENS (each claim's
+    text once, followed by its numbered questions) and at most
+    BATCHED_QA_MAX_ITEMS questions. The model answers with a JSON array of
+    {id, claim_id, answer, reasoning}; a batch whose response does not parse
+    is split in half and retried, and a single question that still fails
+    falls back to a plain AbstractiveQA call.
+    """
+
+    def __init__(self, client_provider=None, prompt_builder=None, max_items: int = None):
+        self.system_prompt = read_config('SYSTEM_PROMPT_BATCHED_QA')
+        if not self.system_prompt:
+            raise ValueError("No System prompt available.")
+        self.model = read_config('LLM_MODEL')
+        self.client_provider = client_provider or get_client_provider()
+        self.prompt_builder = prompt_builder or PromptBuilder.from_config()
+        self.answer_tokens = read_config('BATCHED_QA_ANSWER_TOKENS', 160)
+        self.max_output_tokens = read_config('BATCHED_QA_MAX_OUTPUT_TOKENS', 2048)
+        # The response must fit in max_output_tokens too, so that also caps the batch size
+        self.max_items = min(max_items or read_config('BATCHED_QA_MAX_ITEMS', 8),
+                             max(self.max_output_tokens // self.answer_tokens, 1))
+        self.last_record = None
+        self.batches = 0
+        self.splits = 0
+        self.fallbacks = 0
+        self.failures = 0
+
+    @staticmethod
+    def claim_id_of(claim_data, position: int) -> str:
+        if isinstance(claim_data, dict) and claim_data.get("claim_id"):
+            return str(claim_data["claim_id"])
+        return f"claim-{position}"
+
+    def claim_section(self, claim_data, claim_id: str, questions: Sequence[str]) -> str:
+        "Claim text for the prompt; long notes are narrowed to the chunks relevant to its questions"
+        builder = self.prompt_builder
+        fields = builder.compact_fields(claim_data)
+        note = builder.note_of(claim_data)
+        budget = builder.max_tokens - builder.count(self.system_prompt) - builder.count(fields) - 64
+        budget -= sum(builder.count(question) + 4 for question in questions)
+        if builder.count(note) > budget:
+            note = "\n...\n".join(builder.select_chunks(" ".join(questions), builder.chunk(note), max(budget, 0)))
+        details = f"{fields}\nClinical Note:\n{note}" if fields else note
+        return f"--- CLAIM {claim_id} ---\n{details}"
+
+    def plan(self, claims: Sequence, items: Sequence[Tuple[int, str]]) -> Tuple[Dict[int, str], List[List[int]]]:
+        """Claim sections by claim position and batches of item ids, packed to the token budget.
+
+        items are (claim position, question) pairs; item ids are their positions.
+        """
+        builder = self.prompt_builder
+        questions_by_claim = {}
+        for claim_position, question in items:
+            questions_by_claim.setdefault(claim_position, []).append(question)
+        sections = {position: self.claim_section(claims[position], self.claim_id_of(claims[position], position),
+                                                 questions)
+                    for position, questions in questions_by_claim.items()}
+        # Each claim in a prompt also carries its questions header
+        section_tokens = {position: builder.count(f"{section}\n{QUESTIONS_HEADER}")
+                          for position, section in sections.items()}
+        budget = builder.max_tokens - builder.count(self.system_prompt)
+        batches, current, claims_in_batch, used = [], [], set(), 0
+        for item_id, (claim_position, question) in enumerate(items):
+            cost = builder.count(QUESTION_LINE.format(id=item_id, question=question))
+            if claim_position not in claims_in_batch:
+                cost += section_tokens[claim_position]
+            if current and (used + cost > budget or len(current) >= self.max_items):
+                batches.append(current)
+                current, claims_in_batch, used = [], set(), 0
+                cost = builder.count(QUESTION_LINE.format(id=item_id, question=question)) + section_tokens[claim_position]
+            current.append(item_id)
+            claims_in_batch.add(claim_position)
+            used += cost
+        if current:
+            batches.append(current)
+        return sections, batches
+
+    def build_messages(self, sections: Dict[int, str], items: Sequence[Tuple[int, str]], batch: Sequence[int]):
+        "Chat messages for one batch: each claim once, followed by its numbered questions"
+        parts = []
+        for claim_position in dict.fromkeys(items[item_id][0] for item_id in batch):
+            lines = [QUESTION_LINE.format(id=item_id, question=items[item_id][1])
+                     for item_id in batch if items[item_id][0] == claim_position]
+            parts.append(f"{sections[claim_position]}\n{QUESTIONS_HEADER}\n" + "\n".join(lines))
+        return [
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": "\n\n".join(parts)},
+        ]
+
+    def _request(self, messages, batch):
+        return dict(messages=messages, model=self.model, temperature=0.1,
+                    max_tokens=min(self.answer_tokens * len(batch) + 64, self.max_output_tokens))
+
+    def _note_batch(self, record: PromptRecord, messages):
+        self.batches += 1
+        record.calls += 1
+        record.tokens["system"] = record.tokens.get("system", 0) + self.prompt_builder.count(messages[0]["content"])
+        record.tokens["claims"] = record.tokens.get("claims", 0) + self.prompt_builder.count(messages[1]["content"])
+
+    def _retry_plan(self, batch: List[int], answers: Dict[int, Dict]) -> List[List[int]]:
+        "Sub-batches to retry: the missing ids, split in half when nothing in the batch parsed"
+        missing = [item_id for item_id in batch if item_id not in answers]
+        if not missing or len(batch) == 1:
+            return [missing] if missing else []
+        self.splits += 1
+        if len(missing) == len(batch):
+            middle = len(batch) // 2
+            return [batch[:middle], batch[middle:]]
+        return [missing]
+
+    def _failed(self, batch: List[int], error: Exception) -> Dict[int, Dict]:
+        "No answers for a batch whose call failed (the provider already retried it); other batches keep theirs"
+        self.failures += 1
+        print(f"Batch of {len(batch)} questions failed, leaving them unanswered: {error}")
+        return {}
+
+    def _run(self, claims, items, sections, batch, record) -> Dict[int, Dict]:
+        messages = self.build_messages(sections, items, batch)
+        with record.stage("call"):
+            self._note_batch(record, messages)
+            try:
+                response = self.client_provider.call(BACKEND_CHAT, "chat_completion", priority=PRIORITY_BULK,
+                                                     **self._request(messages, batch))
+            except Exception as e:
+                return self._failed(batch, e)
+        with record.stage("parse"):
+            try:
+                answers = parse_batch(response.choices[0].message.content, batch)
+            except ValueError:
+                answers = {}
+        retries = self._retry_plan(batch, answers)
+        if len(batch) == 1 and retries:
+            answers.update(self._fallback(claims, items, batch[0]))
+        else:
+            for retry in retries:
+                answers.update(self._run(claims, items, sections, retry, record))
+        return answers
+
+    async def _arun(self, claims, items, sections, batch, record) -> Dict[int, Dict]:
+        messages = self.build_messages(sections, items, batch)
+        with record.stage("call"):
+            self._note_batch(record, messages)
+            try:
+                response = await self.client_provider.acall(
+                    BACKEND_CHAT, "chat_completion", priority=PRIORITY_BULK, **self._request(messages, batch))
+            except Exception as e:
+                return self._failed(batch, e)
+        with record.stage("parse"):
+            try:
+                answers = parse_batch(response.choices[0].message.content, batch)
+            except ValueError:
+                answers = {}
+        retries = self._retry_plan(batch, answers)
+        if len(batch) == 1 and retries:
+            answers.update(await asyncio.to_thread(self._fallback, claims, items, batch[0]))
+        elif retries:
+            for result in await asyncio.gather(*(self._arun(claims, items, sections, retry, record)
+                                                 for retry in retries)):
+                answers.update(result)
+        return answers
+
+    def _fallback(self, claims, items, item_id: int) -> Dict[int, Dict]:
+        "Answer one question with a regular single-claim call"
+        self.fallbacks += 1
+        claim_position, question = items[item_id]
+        result = AbstractiveQA(claim_data=claims[claim_position], client_provider=self.client_provider,
+                               prompt_builder=self.prompt_builder).qa(question)
+        answer, reasoning = result if result else (None, None)
+        return {item_id: {"id": item_id, "answer": answer, "reasoning": reasoning}}
+
+    def _results(self, claims, items, answers) -> List[Dict]:
+        results = []
+        for item_id, (claim_position, question) in enumerate(items):
+            answer = answers.get(item_id) or {}
+            results.append({
+                "claim_id": self.claim_id_of(claims[claim_position], claim_position),
+                "question": question,
+                "answer": answer.get("answer"),
+                "reasoning": answer.get("reasoning"),
+            })
+        return results
+
+    def _finish(self, record: PromptRecord):
+        self.last_record = record
+        prompt_recorder.record(record)
+
+    def answer_many(self, claims: Sequence, items: Sequence[Tuple[int, str]]):
+        """Answer (claim position, question) pairs; returns [{claim_id, question, answer, reasoning}]
+        in the order of items"""
+        record = PromptRecord("batched_qa")
+        try:
+            with record.stage("build"):
+                sections, batches = self.plan(claims, items)
+            record.chunks = len(batches)
+            answers = {}
+            for batch in batches:
+                answers.update(self._run(claims, items, sections, batch, record))
+            return self._results(claims, items, answers)
+        except Exception as e:
+            print(f"Raise Exception {e}")
+            return None
+        finally:
+            self._finish(record)
+
+    async def aanswer_many(self, claims: Sequence, items: Sequence[Tuple[int, str]]):
+        "Async version of answer_many(); batches are sent concurrently"
+        record = PromptRecord("batched_qa")
+        try:
+            with record.stage("build"):
+                sections, batches = self.plan(claims, items)
+            record.chunks = len(batches)
+            answers = {}
+            for result in await asyncio.gather(*(self._arun(claims, items, sections, batch, record)
+                                                 for batch in batches)):
+                answers.update(result)
+            return self._results(claims, items, answers)
+        except Exception as e:
+            print(f"Raise Exception {e}")
+            return None
+        finally:
+            self._finish(record)
+
+    def ask_claims(self, claims: Iterable, question: str):
+        "The same question across many claims (e.g. a patient's whole history)"
+        claims = list(claims)
+        return self.answer_many(claims, [(position, question) for position in range(len(claims))])
+
+    def ask_questions(self, claim_data, questions: Sequence[str]):
+        "Many questions about one claim"
+        return self.answer_many([claim_data], [(0, question) for question in questions])
+
+    def stats(self) -> dict:
+        return {"batches": self.batches, "splits": self.splits, "fallbacks": self.fallbacks, "failures": self.failures}
+
+
+if __name__ == "__main__":
+    from src.data_ingestion import DataIngestion
+    claims = DataIngestion(patient_id="PA-12345").ingest_patient_data()
+    batched_qa = BatchedQA()
+    for answer in batched_qa.ask_claims(claims, "What is the diagnosis?") or []:
+        print(answer)
+    print(batched_qa.stats(), batched_qa.last_record)
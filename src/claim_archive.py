@@ -0,0 +1,306 @@
+"""Packed, memory-mapped claim archive: one file per patient instead of two files per claim.
+
+Layout (little endian):
+
+    header   MAGIC(8) | record_count u32 | index_offset u64 | strings_offset u64
+    records  per claim: u32 length | details (DETAILS struct) | u32 length | clinical note (utf-8)
+    index    per claim: claim_id string id u32 | details_offset u64 | note_offset u64 | note_length u32
+    strings  u32 count | per string: u32 length | utf-8 bytes
+
+Structured fields are encoded in a fixed 68-byte DETAILS struct: the four
+financial amounts as float64 and every text field as an id into the
+patient's deduplicated string table (providers, diagnoses and the
+patient_info JSON repeat across claims). Fields that do not fit the
+schema are kept losslessly in an "extra" JSON string.
+"""
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import argparse
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+
+MAGIC = b"IFACLM01"
+ARCHIVE_SUFFIX = ".claims"
+HEADER = struct.Struct("<8sIQQ")
+LENGTH = struct.Struct("<I")
+INDEX_ENTRY = struct.Struct("<IQQI")
+TEXT_FIELDS = ("claim_id", "claim_date", "provider_name", "primary_diagnosis", "icd_code",
+               "procedure_description", "cpt_code")
+AMOUNT_FIELDS = ("billed_amount", "allowed_amount", "copay", "insurance_paid")
+# flags u32 | 4 amounts | text field ids | extra JSON id
+DETAILS = struct.Struct("<I4d" + "I" * len(TEXT_FIELDS) + "I")
+FIELD_ORDER = ("claim_id", "claim_date", "patient_info", "provider_name", "primary_diagnosis", "icd_code",
+               "procedure_description", "cpt_code", "financials")
+FLAG_PACKED_FINANCIALS = 1
+# Details whose key order differs from FIELD_ORDER are stored whole as JSON to round-trip exactly
+FLAG_RAW_JSON = 2
+NO_STRING = 0xFFFFFFFF
+
+
+def archive_path(archive_dir: str, patient_id: str) -> str:
+    return os.path.join(archive_dir, f"{patient_id}{ARCHIVE_SUFFIX}")
+
+
+class _StringTable:
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.strings: List[str] = []
+
+    def add(self, value) -> int:
+        if value is None:
+            return NO_STRING
+        value = str(value)
+        string_id = self.ids.get(value)
+        if string_id is None:
+            string_id = self.ids[value] = len(self.strings)
+            self.strings.append(value)
+        return string_id
+
+
+def _packable_financials(financials) -> bool:
+    return (isinstance(financials, dict) and list(financials) == list(AMOUNT_FIELDS)
+            and all(type(financials[name]) is float for name in AMOUNT_FIELDS))
+
+
+def _canonical_order(details: Dict) -> bool:
+    keys = list(details)
+    known = [key for key in keys if key in FIELD_ORDER]
+    return known == [key for key in FIELD_ORDER if key in details] and keys[:len(known)] == known
+
+
+def _encode_details(details: Dict, strings: _StringTable) -> bytes:
+    if not _canonical_order(details):
+        raw_id = strings.add(json.dumps(details, separators=(",", ":")))
+        return DETAILS.pack(FLAG_RAW_JSON, *([math.nan] * len(AMOUNT_FIELDS)), *([NO_STRING] * len(TEXT_FIELDS)), raw_id)
+    financials = details.get("financials")
+    packed = _packable_financials(financials)
+    text_ids = []
+    extra = {}
+    for key, value in details.items():
+        if key in TEXT_FIELDS and isinstance(value, str):
+            continue
+        if key == "financials" and packed:
+            continue
+        extra[key] = value
+    for name in TEXT_FIELDS:
+        value = details.get(name)
+        text_ids.append(strings.add(value) if isinstance(value, str) else NO_STRING)
+    amounts = [financials[name] if packed else math.nan for name in AMOUNT_FIELDS]
+    extra_id = strings.add(json.dumps(extra, separators=(",", ":"))) if extra else NO_STRING
+    return DETAILS.pack(FLAG_PACKED_FINANCIALS if packed else 0, *amounts, *text_ids, extra_id)
+
+
+def write_archive(path: str, claims: Iterable[Tuple[str, Dict, str]]) -> int:
+    "Write (claim_id, details, clinical note) records to a packed archive atomically; returns the record count"
+    strings = _StringTable()
+    index = []
+    tmp_path = f"{path}.tmp"
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(tmp_path, "wb", buffering=1024 * 1024) as file:
+        file.write(HEADER.pack(MAGIC, 0, 0, 0))
+        offset = HEADER.size
+        for claim_id, details, note in claims:
+            encoded = _encode_details(details, strings)
+            note_bytes = (note or "").encode("utf-8")
+            details_offset = offset + LENGTH.size
+            note_offset = details_offset + len(encoded) + LENGTH.size
+            file.write(LENGTH.pack(len(encoded)))
+            file.write(encoded)
+            file.write(LENGTH.pack(len(note_bytes)))
+            file.write(note_bytes)
+            offset = note_offset + len(note_bytes)
+            index.append((strings.add(claim_id), details_offset, note_offset, len(note_bytes)))
+        index_offset = offset
+        for entry in index:
+            file.write(INDEX_ENTRY.pack(*entry))
+        strings_offset = index_offset + INDEX_ENTRY.size * len(index)
+        file.write(LENGTH.pack(len(strings.strings)))
+        for value in strings.strings:
+            encoded = value.encode("utf-8")
+            file.write(LENGTH.pack(len(encoded)))
+            file.write(encoded)
+        file.seek(0)
+        file.write(HEADER.pack(MAGIC, len(index), index_offset, strings_offset))
+    os.replace(tmp_path, path)
+    return len(index)
+
+
+class ClaimArchive:
+    "Read-only, memory-mapped view of one packed patient archive"
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as file:
+            self.mtime_ns = os.fstat(file.fileno()).st_mtime_ns
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+        magic, count, index_offset, strings_offset = HEADER.unpack_from(self._view, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a claim archive")
+        self.strings = self._read_strings(strings_offset)
+        self.index: Dict[str, Tuple[int, int, int]] = {}
+        for position in range(count):
+            claim_string, details_offset, note_offset, note_length = INDEX_ENTRY.unpack_from(
+                self._view, index_offset + position * INDEX_ENTRY.size)
+            self.index[self.strings[claim_string]] = (details_offset, note_offset, note_length)
+
+    def _read_strings(self, offset: int) -> List[str]:
+        (count,) = LENGTH.unpack_from(self._view, offset)
+        offset += LENGTH.size
+        strings = []
+        for _ in range(count):
+            (length,) = LENGTH.unpack_from(self._view, offset)
+            offset += LENGTH.size
+            strings.append(str(self._view[offset:offset + length], "utf-8"))
+            offset += length
+        return strings
+
+    def claim_ids(self) -> List[str]:
+        return list(self.index)
+
+    def details(self, claim_id: str) -> Optional[Dict]:
+        "Structured fields of a claim, decoded straight from the mapped file (the note is not read)"
+        entry = self.index.get(claim_id)
+        if entry is None:
+            return None
+        flags, *values = DETAILS.unpack_from(self._view, entry[0])
+        amounts = values[:len(AMOUNT_FIELDS)]
+        text_ids = values[len(AMOUNT_FIELDS):-1]
+        extra_id = values[-1]
+        if flags & FLAG_RAW_JSON:
+            return json.loads(self.strings[extra_id])
+        fields = {name: self.strings[string_id]
+                  for name, string_id in zip(TEXT_FIELDS, text_ids) if string_id != NO_STRING}
+        if extra_id != NO_STRING:
+            fields.update(json.loads(self.strings[extra_id]))
+        if flags & FLAG_PACKED_FINANCIALS:
+            fields["financials"] = dict(zip(AMOUNT_FIELDS, amounts))
+        details = {key: fields.pop(key) for key in FIELD_ORDER if key in fields}
+        details.update(fields)
+        return details
+
+    def note(self, claim_id: str) -> Optional[str]:
+        entry = self.index.get(claim_id)
+        if entry is None:
+            return None
+        _, note_offset, note_length = entry
+        return str(self._view[note_offset:note_offset + note_length], "utf-8")
+
+    def claim(self, claim_id: str) -> Optional[Dict]:
+        "Claim details with the clinical note, shaped like DataIngestion.ingest_claim_data()"
+        details = self.details(claim_id)
+        if details is not None:
+            details["Clinical_note"] = self.note(claim_id)
+        return details
+
+    def iter_claims(self, include_note: bool = True) -> Iterator[Dict]:
+        for claim_id in self.index:
+            yield self.claim(claim_id) if include_note else self.details(claim_id)
+
+    def close(self):
+        "Unmap the file; only for a reader no other thread can still be using"
+        self._view.release()
+        self._mmap.close()
+
+
+_archives: Dict[str, ClaimArchive] = {}
+_archives_lock = threading.Lock()
+
+
+def open_archive(path: str) -> Optional[ClaimArchive]:
+    """Shared archive reader for path, reopened when the file is replaced; None if it does not exist.
+
+    The previous reader is only dropped from the cache, not closed: other
+    threads may still be iterating it. write_archive() replaces the file,
+    so the old mapping stays valid and is unmapped when its last reader
+    is garbage collected.
+    """
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    with _archives_lock:
+        archive = _archives.get(path)
+        if archive is None or archive.mtime_ns != mtime_ns:
+            archive = _archives[path] = ClaimArchive(path)
+        return archive
+
+
+def _changed_since(patient_dir: str, mtime_ns: int) -> bool:
+    """Whether the patient folder, a claim folder or a claim file was modified after mtime_ns.
+
+    A stat per entry, like ClaimIndex.refresh_changed(): editing a file in
+    place does not change its folder's mtime.
+    """
+    try:
+        if os.stat(patient_dir).st_mtime_ns > mtime_ns:
+            return True
+        with os.scandir(patient_dir) as claims:
+            for claim in claims:
+                if not claim.is_dir():
+                    continue
+                if claim.stat().st_mtime_ns > mtime_ns:
+                    return True
+                with os.scandir(claim.path) as files:
+                    if any(entry.stat().st_mtime_ns > mtime_ns for entry in files):
+                        return True
+    except FileNotFoundError:
+        pass
+    return False
+
+
+def patient_archive(archive_dir: str, data_path: str, patient_id: str) -> Optional[ClaimArchive]:
+    """Archive of a patient under archive_dir, or None if there is none or it is stale.
+
+    An archive is stale when the patient's folder under data_path changed
+    after packing: claim folders were added or removed, or a claim's
+    details or note were edited in place, so the folders win.
+    """
+    if not archive_dir:
+        return None
+    archive = open_archive(archive_path(archive_dir, patient_id))
+    if archive is None or _changed_since(os.path.join(data_path, patient_id), archive.mtime_ns):
+        return None
+    return archive
+
+
+def convert_directory(data_path: str, archive_dir: str, patient_ids: Optional[Iterable[str]] = None) -> Dict[str, int]:
+    "Pack data/claim/<patient>/<claim>/ folders into one archive per patient"
+    from src.claim_index import find_claim_files
+
+    if patient_ids is None:
+        with os.scandir(data_path) as entries:
+            patient_ids = sorted(entry.name for entry in entries if entry.is_dir())
+    counts = {}
+    for patient_id in patient_ids:
+        patient_dir = os.path.join(data_path, patient_id)
+
+        def claims():
+            with os.scandir(patient_dir) as entries:
+                claim_dirs = sorted(entry.path for entry in entries if entry.is_dir())
+            for claim_dir in claim_dirs:
+                details_path, note_path = find_claim_files(claim_dir)
+                if details_path is None:
+                    continue
+                with open(details_path, "r") as file:
+                    details = json.load(file)
+                note = ""
+                if note_path:
+                    with open(note_path, "r") as file:
+                        note = file.read()
+                yield os.path.basename(claim_dir), details, note
+
+        counts[patient_id] = write_archive(archive_path(archive_dir, patient_id), claims())
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert the claim directory layout into packed archives.")
+    parser.add_argument("--input", default="data/claim", help="Directory with <patient>/<claim>/ folders")
+    parser.add_argument("--out", default="data/archive", help="Directory to write <patient>.claims files to")
+    args = parser.parse_args()
+    for patient_id, count in convert_directory(args.input, args.out).items():
+        print(f"{patient_id}: {count} claims -> {archive_path(args.out, patient_id)}")
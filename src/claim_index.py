@@ -0,0 +1,269 @@
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterator, List, Optional
+
+from src.utils.utils import count_file_read
+from src.utils.tracing import tracer
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS patients (
+    patient_id TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS claims (
+    patient_id TEXT NOT NULL,
+    claim_id TEXT NOT NULL,
+    details_path TEXT NOT NULL,
+    note_path TEXT,
+    note_offset INTEGER NOT NULL DEFAULT 0,
+    note_length INTEGER NOT NULL DEFAULT 0,
+    mtime_ns INTEGER NOT NULL,
+    claim_date TEXT,
+    provider_name TEXT,
+    primary_diagnosis TEXT,
+    icd_code TEXT,
+    cpt_code TEXT,
+    billed_amount REAL,
+    allowed_amount REAL,
+    copay REAL,
+    insurance_paid REAL,
+    details TEXT NOT NULL,
+    PRIMARY KEY (patient_id, claim_id)
+);
+"""
+
+COLUMNS = (
+    "patient_id", "claim_id", "details_path", "note_path", "note_offset", "note_length", "mtime_ns",
+    "claim_date", "provider_name", "primary_diagnosis", "icd_code", "cpt_code",
+    "billed_amount", "allowed_amount", "copay", "insurance_paid", "details",
+)
+
+
+def find_claim_files(claim_dir: str):
+    "Return (details_path, note_path) for a claim folder, scanning it once"
+    details_file, note_file = None, None
+    with os.scandir(claim_dir) as entries:
+        for entry in entries:
+            if details_file is None and '.json' in entry.name:
+                details_file = entry.path
+            elif note_file is None and '.txt' in entry.name:
+                note_file = entry.path
+    return details_file, note_file
+
+
+class ClaimIndex:
+    """SQLite index of data/claim/<patient>/<claim>/ folders.
+
+    Maps patient_id -> claim_id -> file locations plus pre-parsed structured
+    fields, so single-claim lookups never list directories.
+    """
+
+    _shared: Dict[tuple, "ClaimIndex"] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, data_path: str, index_path: Optional[str] = None):
+        self.data_path = data_path
+        self.index_path = index_path or ":memory:"
+        if self.index_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.index_path)), exist_ok=True)
+        self._conn = sqlite3.connect(self.index_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.RLock()
+
+    @classmethod
+    def shared(cls, data_path: str, index_path: Optional[str] = None) -> "ClaimIndex":
+        "Return one long-lived index per (data_path, index_path)"
+        key = (data_path, index_path)
+        with cls._shared_lock:
+            index = cls._shared.get(key)
+            if index is None:
+                index = cls._shared[key] = cls(data_path=data_path, index_path=index_path)
+            return index
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _build_row(self, patient_id: str, claim_id: str, claim_dir: str):
+        details_path, note_path = find_claim_files(claim_dir)
+        if details_path is None:
+            return None
+        mtime_ns = os.stat(details_path).st_mtime_ns
+        with open(details_path, 'r') as file:
+            details = json.load(file)
+        count_file_read()
+        note_length = os.stat(note_path).st_size if note_path else 0
+        financials = details.get('financials') or {}
+        return (
+            patient_id, claim_id, details_path, note_path, 0, note_length, mtime_ns,
+            details.get('claim_date'), details.get('provider_name'), details.get('primary_diagnosis'),
+            details.get('icd_code'), details.get('cpt_code'),
+            financials.get('billed_amount'), financials.get('allowed_amount'),
+            financials.get('copay'), financials.get('insurance_paid'),
+            json.dumps(details, separators=(',', ':')),
+        )
+
+    def _upsert(self, rows):
+        placeholders = ", ".join("?" for _ in COLUMNS)
+        self._conn.executemany(
+            f"INSERT OR REPLACE INTO claims ({', '.join(COLUMNS)}) VALUES ({placeholders})", rows)
+
+    def index_claim(self, patient_id: str, claim_id: str) -> Optional[sqlite3.Row]:
+        "(Re)index a single claim folder"
+        claim_dir = os.path.join(self.data_path, patient_id, claim_id)
+        if not os.path.isdir(claim_dir):
+            return None
+        row = self._build_row(patient_id, claim_id, claim_dir)
+        if row is None:
+            return None
+        with self._lock, self._conn:
+            self._upsert([row])
+        return self._select_claim(patient_id, claim_id)
+
+    def refresh_patient(self, patient_id: str) -> Dict[str, List[str]]:
+        """Index new claim folders, drop deleted ones and reindex details edited in place.
+
+        Added and removed folders are only looked for when the patient folder
+        changed; edits are found with one stat per claim (refresh_changed()).
+        """
+        with tracer.span("index.refresh_patient") as span:
+            changes = self._refresh_patient(patient_id)
+            changes["changed"] = self.refresh_changed(patient_id)
+            span.set(added=len(changes["added"]), removed=len(changes["removed"]), changed=len(changes["changed"]))
+            return changes
+
+    def _refresh_patient(self, patient_id: str) -> Dict[str, List[str]]:
+        patient_dir = os.path.join(self.data_path, patient_id)
+        changes = {"added": [], "removed": []}
+        try:
+            mtime_ns = os.stat(patient_dir).st_mtime_ns
+        except FileNotFoundError:
+            mtime_ns = None
+        with self._lock:
+            stored = self._conn.execute(
+                "SELECT mtime_ns FROM patients WHERE patient_id = ?", (patient_id,)).fetchone()
+            if stored is not None and stored["mtime_ns"] == mtime_ns:
+                return changes
+            known = {row["claim_id"] for row in self._conn.execute(
+                "SELECT claim_id FROM claims WHERE patient_id = ?", (patient_id,))}
+            present = set()
+            if mtime_ns is not None:
+                with os.scandir(patient_dir) as entries:
+                    present = {entry.name for entry in entries if entry.is_dir()}
+            rows = []
+            for claim_id in sorted(present - known):
+                row = self._build_row(patient_id, claim_id, os.path.join(patient_dir, claim_id))
+                if row is not None:
+                    rows.append(row)
+                    changes["added"].append(claim_id)
+            changes["removed"] = sorted(known - present)
+            with self._conn:
+                self._upsert(rows)
+                self._conn.executemany(
+                    "DELETE FROM claims WHERE patient_id = ? AND claim_id = ?",
+                    [(patient_id, claim_id) for claim_id in changes["removed"]])
+                if mtime_ns is None:
+                    self._conn.execute("DELETE FROM patients WHERE patient_id = ?", (patient_id,))
+                else:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO patients (patient_id, mtime_ns) VALUES (?, ?)",
+                        (patient_id, mtime_ns))
+        return changes
+
+    def refresh_changed(self, patient_id: str) -> List[str]:
+        "Reindex claims whose details file was edited in place (a stat per claim, no reads unless changed)"
+        with self._lock:
+            known = self._conn.execute(
+                "SELECT claim_id, details_path, mtime_ns FROM claims WHERE patient_id = ?", (patient_id,)).fetchall()
+        changed = []
+        for row in known:
+            try:
+                if os.stat(row["details_path"]).st_mtime_ns == row["mtime_ns"]:
+                    continue
+            except FileNotFoundError:
+                pass
+            self.get_claim(patient_id, row["claim_id"])
+            changed.append(row["claim_id"])
+        return changed
+
+    def _select_claim(self, patient_id: str, claim_id: str) -> Optional[sqlite3.Row]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT * FROM claims WHERE patient_id = ? AND claim_id = ?",
+                (patient_id, claim_id)).fetchone()
+
+    def get_claim(self, patient_id: str, claim_id: str) -> Optional[sqlite3.Row]:
+        "Look up one claim, indexing it on the fly if it is new or its details changed"
+        row = self._select_claim(patient_id, claim_id)
+        if row is None:
+            return self.index_claim(patient_id, claim_id)
+        try:
+            if os.stat(row["details_path"]).st_mtime_ns != row["mtime_ns"]:
+                return self.index_claim(patient_id, claim_id)
+        except FileNotFoundError:
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "DELETE FROM claims WHERE patient_id = ? AND claim_id = ?", (patient_id, claim_id))
+            return None
+        return row
+
+    def claims(self, patient_id: str) -> List[sqlite3.Row]:
+        "All indexed claims of a patient, refreshed incrementally"
+        self.refresh_patient(patient_id)
+        with self._lock:
+            return self._conn.execute(
+                "SELECT * FROM claims WHERE patient_id = ? ORDER BY claim_id", (patient_id,)).fetchall()
+
+    def iter_claims(self, patient_id: str, columns=COLUMNS, batch_size: int = 256,
+                    refresh: bool = True) -> Iterator[sqlite3.Row]:
+        """Stream a patient's indexed claims in claim_id order, holding at most batch_size rows at a time.
+        refresh=False skips refresh_patient() for callers that just ran it"""
+        unknown = set(columns) - set(COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown claim index columns: {sorted(unknown)}")
+        columns = list(dict.fromkeys(["claim_id", *columns]))
+        if refresh:
+            self.refresh_patient(patient_id)
+        last_claim_id = ""
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT {', '.join(columns)} FROM claims WHERE patient_id = ? AND claim_id > ? "
+                    f"ORDER BY claim_id LIMIT ?", (patient_id, last_claim_id, batch_size)).fetchall()
+            yield from rows
+            if len(rows) < batch_size:
+                return
+            last_claim_id = rows[-1]["claim_id"]
+
+    def select_fields(self, columns, patient_ids: List[str]) -> List[tuple]:
+        "Pre-parsed columns of every claim of the given patients, without reading claim files"
+        unknown = set(columns) - set(COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown claim index columns: {sorted(unknown)}")
+        if not patient_ids:
+            return []
+        for patient_id in patient_ids:
+            self.refresh_patient(patient_id)
+        placeholders = ", ".join("?" for _ in patient_ids)
+        with self._lock:
+            return [tuple(row) for row in self._conn.execute(
+                f"SELECT {', '.join(columns)} FROM claims WHERE patient_id IN ({placeholders}) "
+                f"ORDER BY patient_id, claim_id", list(patient_ids))]
+
+    def claim_ids(self, patient_id: str) -> List[str]:
+        return [row["claim_id"] for row in self.claims(patient_id)]
+
+    def patient_ids(self) -> List[str]:
+        "Patients present under the data path"
+        with os.scandir(self.data_path) as entries:
+            return sorted(entry.name for entry in entries if entry.is_dir())
+
+
+if __name__ == "__main__":
+    from src.config import read_config
+    claim_index = ClaimIndex.shared(read_config('DATA_PATH'), read_config('CLAIM_INDEX_PATH'))
+    for patient_id in claim_index.patient_ids():
+        print(f"{patient_id}: {claim_index.claim_ids(patient_id)}")
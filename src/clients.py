@@ -0,0 +1,433 @@
+from src.config import read_config
+from src.result_cache import ResultCache, make_key
+from src.scheduler import PRIORITY_BULK, PRIORITY_INTERACTIVE, RequestScheduler, retry_after
+from src.utils.tracing import tracer
+import asyncio
+import os
+import random
+import threading
+import time
+import weakref
+
+BACKEND_CHAT = "chat"
+BACKEND_QUESTION_ANSWERING = "question_answering"
+BACKEND_SUMMARIZATION = "summarization"
+
+# Inference provider per backend; None lets huggingface_hub pick one for chat models.
+BACKEND_PROVIDERS = {
+    BACKEND_CHAT: None,
+    BACKEND_QUESTION_ANSWERING: "hf-inference",
+    BACKEND_SUMMARIZATION: "hf-inference",
+}
+DEFAULT_TIMEOUTS = {
+    BACKEND_CHAT: 60.0,
+    BACKEND_QUESTION_ANSWERING: 30.0,
+    BACKEND_SUMMARIZATION: 60.0,
+}
+# Scheduler priority of each backend's calls when the caller does not pass one
+BACKEND_PRIORITIES = {
+    BACKEND_CHAT: PRIORITY_INTERACTIVE,
+    BACKEND_QUESTION_ANSWERING: PRIORITY_INTERACTIVE,
+    BACKEND_SUMMARIZATION: PRIORITY_BULK,
+}
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+
+def is_retryable(error: Exception) -> bool:
+    "Whether a failed inference call is worth retrying"
+    response = getattr(error, 'response', None)
+    status_code = getattr(response, 'status_code', None)
+    if status_code is not None:
+        return status_code in RETRYABLE_STATUS_CODES
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    name = type(error).__name__
+    return "Timeout" in name or "Connect" in name or "RemoteProtocol" in name
+
+
+def install_connection_pool(pool_size: int) -> bool:
+    "Make huggingface_hub share one keep-alive HTTP pool of the given size"
+    try:
+        from huggingface_hub import close_session, set_client_factory
+        try:
+            import httpx2 as httpx
+        except ImportError:
+            import httpx
+    except ImportError:
+        return False
+    try:
+        from huggingface_hub.utils._http import hf_request_event_hook
+        event_hooks = {"request": [hf_request_event_hook]}
+    except ImportError:
+        event_hooks = None
+
+    def client_factory():
+        return httpx.Client(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            event_hooks=event_hooks,
+            follow_redirects=True,
+            timeout=None,
+        )
+
+    set_client_factory(client_factory)
+    close_session()
+    return True
+
+
+def inference_clients():
+    "huggingface_hub's (InferenceClient, AsyncInferenceClient); imported on first use to keep startup fast"
+    from huggingface_hub import AsyncInferenceClient, InferenceClient
+    return InferenceClient, AsyncInferenceClient
+
+
+class ClientProvider:
+    "Long-lived inference clients shared by AbstractiveQA, ExtractiveQA and Summarization"
+
+    def __init__(self, token: str = None, pool_size: int = 10, timeouts: dict = None,
+                 max_retries: int = 3, backoff_seconds: float = 0.5, endpoint_url: str = None,
+                 client_factory=None, async_client_factory=None,
+                 cache: ResultCache = None, scheduler: RequestScheduler = None, max_retry_after: float = 60.0):
+        self.token = token
+        self.pool_size = pool_size
+        self.timeouts = {**DEFAULT_TIMEOUTS, **(timeouts or {})}
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.endpoint_url = endpoint_url.rstrip("/") if endpoint_url else None
+        # None means huggingface_hub's clients (see inference_clients())
+        self.client_factory = client_factory
+        self.async_client_factory = async_client_factory
+        self.cache = cache
+        # Optional admission control of every attempt (rate limits, priorities, adaptive concurrency)
+        self.scheduler = scheduler
+        # Longest Retry-After honoured; a longer one fails the call instead of stalling it
+        self.max_retry_after = max_retry_after
+        self._clients = {}
+        # Async clients hold connections bound to an event loop, so they are cached per loop.
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+
+    @classmethod
+    def from_config(cls) -> "ClientProvider":
+        from dotenv import load_dotenv
+        load_dotenv()
+        pool_size = read_config('INFERENCE_POOL_SIZE', 10)
+        install_connection_pool(pool_size)
+        cache = None
+        if read_config('RESULT_CACHE_ENABLED', False):
+            cache = ResultCache(
+                path=read_config('RESULT_CACHE_PATH'),
+                max_bytes=read_config('RESULT_CACHE_MAX_BYTES', 256 * 1024 * 1024),
+                max_age_seconds=read_config('RESULT_CACHE_MAX_AGE_SECONDS', 7 * 24 * 3600),
+            )
+        return cls(
+            token=os.getenv('HF_TOKEN'),
+            pool_size=pool_size,
+            timeouts=dict(read_config('INFERENCE_TIMEOUTS', {}) or {}),
+            max_retries=read_config('INFERENCE_MAX_RETRIES', 3),
+            backoff_seconds=read_config('INFERENCE_BACKOFF_SECONDS', 0.5),
+            endpoint_url=read_config('INFERENCE_ENDPOINT_URL'),
+            cache=cache,
+            scheduler=RequestScheduler.from_config() if read_config('SCHEDULER_ENABLED', False) else None,
+            max_retry_after=read_config('INFERENCE_MAX_RETRY_AFTER_SECONDS', 60.0),
+        )
+
+    def get_client(self, backend: str):
+        "Return the cached client for a backend, creating it once"
+        client = self._clients.get(backend)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(backend)
+                if client is None:
+                    with tracer.span("client.create", backend=backend):
+                        client_factory = self.client_factory or inference_clients()[0]
+                        client = client_factory(
+                            provider=BACKEND_PROVIDERS.get(backend),
+                            api_key=self.token,
+                            timeout=self.timeouts.get(backend),
+                        )
+                    self._clients[backend] = client
+        return client
+
+    def get_async_client(self, backend: str):
+        "Return the async client for a backend on the running event loop"
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            clients = self._async_clients.setdefault(loop, {})
+            client = clients.get(backend)
+            if client is None:
+                async_client_factory = self.async_client_factory or inference_clients()[1]
+                client = clients[backend] = async_client_factory(
+                    provider=BACKEND_PROVIDERS.get(backend),
+                    api_key=self.token,
+                    timeout=self.timeouts.get(backend),
+                )
+        return client
+
+    def resolve_model(self, backend: str, model: str) -> str:
+        "Point the model at the configured endpoint (e.g. a local stub server) if any"
+        if self.endpoint_url and model and not model.startswith(("http://", "https://")):
+            return f"{self.endpoint_url}/{backend}/{model}"
+        return model
+
+    def backoff(self, attempt: int) -> float:
+        "Exponential backoff with jitter for the given retry attempt"
+        delay = self.backoff_seconds * (2 ** attempt)
+        return delay + random.uniform(0, delay / 2)
+
+    def retry_delay(self, error: Exception, attempt: int) -> float:
+        "Seconds to wait before retrying: the backoff, or longer if the server sent Retry-After"
+        wait = retry_after(error)
+        if wait is not None and self.scheduler is not None:
+            # The scheduler pauses the model's lane for Retry-After, which the retry waits out in line
+            return 0.0
+        return max(self.backoff(attempt), min(wait or 0.0, self.max_retry_after))
+
+    def _should_retry(self, error: Exception, attempt: int) -> bool:
+        if attempt >= self.max_retries or not is_retryable(error):
+            return False
+        wait = retry_after(error)
+        return wait is None or wait <= self.max_retry_after
+
+    def _acquire(self, backend: str, model: str = None, priority: str = None):
+        "Wait for the scheduler to admit one attempt on the model's lane; None without a scheduler"
+        if self.scheduler is None:
+            return None
+        return self.scheduler.acquire(model or backend, priority or BACKEND_PRIORITIES.get(backend))
+
+    async def _aacquire(self, backend: str, model: str = None, priority: str = None):
+        "Async counterpart of _acquire()"
+        if self.scheduler is None:
+            return None
+        return await self.scheduler.aacquire(model or backend, priority or BACKEND_PRIORITIES.get(backend))
+
+    def _release(self, ticket, started: float, error: BaseException = None):
+        "Report an attempt's latency and outcome to the scheduler, pausing the model on Retry-After"
+        if ticket is not None:
+            pause = retry_after(error) if isinstance(error, Exception) else None
+            self.scheduler.release(ticket, time.perf_counter() - started, error,
+                                   min(pause, self.max_retry_after) if pause else None)
+
+    def cache_key(self, backend: str, method: str, kwargs: dict) -> str:
+        "Result cache key of a call, including the resolved model, endpoint and provider"
+        resolved = dict(kwargs)
+        if 'model' in resolved:
+            resolved['model'] = self.resolve_model(backend, resolved['model'])
+        return make_key(backend, method, resolved, self.endpoint_url, BACKEND_PROVIDERS.get(backend))
+
+    def call(self, backend: str, method: str, priority: str = None, **kwargs):
+        """Call a client method through the result cache, if one is configured.
+
+        priority ("interactive" or "bulk") orders the call in the scheduler;
+        it defaults to BACKEND_PRIORITIES and is not part of the cache key.
+        """
+        if self.cache is None:
+            return self._call(backend, method, priority, **kwargs)
+        key = self.cache_key(backend, method, kwargs)
+        return self.cache.get_or_compute(backend, key, lambda: self._call(backend, method, priority, **kwargs))
+
+    async def acall(self, backend: str, method: str, priority: str = None, **kwargs):
+        "Async counterpart of call()"
+        if self.cache is None:
+            return await self._acall(backend, method, priority, **kwargs)
+        key = self.cache_key(backend, method, kwargs)
+        return await self.cache.aget_or_compute(backend, key,
+                                                lambda: self._acall(backend, method, priority, **kwargs))
+
+    def _call(self, backend: str, method: str, priority: str = None, **kwargs):
+        "Call a client method, retrying transient failures with backoff"
+        client = self.get_client(backend)
+        model = kwargs.get('model')
+        if 'model' in kwargs:
+            kwargs['model'] = self.resolve_model(backend, kwargs['model'])
+        self.calls += 1
+        attempt = 0
+        with tracer.span(f"inference.{backend}") as span:
+            while True:
+                ticket = self._acquire(backend, model, priority)
+                started = time.perf_counter()
+                try:
+                    result = getattr(client, method)(**kwargs)
+                except Exception as e:
+                    self._release(ticket, started, e)
+                    if not self._should_retry(e, attempt):
+                        raise
+                    self.retries += 1
+                    time.sleep(self.retry_delay(e, attempt))
+                    attempt += 1
+                    span.set(retries=attempt)
+                except BaseException as e:
+                    # Cancelled or interrupted: free the slot without counting an outcome
+                    self._release(ticket, started, e)
+                    raise
+                else:
+                    self._release(ticket, started)
+                    return result
+
+    async def _acall(self, backend: str, method: str, priority: str = None, **kwargs):
+        "Async counterpart of _call(), retrying transient failures without blocking the loop"
+        client = self.get_async_client(backend)
+        model = kwargs.get('model')
+        if 'model' in kwargs:
+            kwargs['model'] = self.resolve_model(backend, kwargs['model'])
+        self.calls += 1
+        attempt = 0
+        with tracer.span(f"inference.{backend}") as span:
+            while True:
+                ticket = await self._aacquire(backend, model, priority)
+                started = time.perf_counter()
+                try:
+                    result = await getattr(client, method)(**kwargs)
+                except Exception as e:
+                    self._release(ticket, started, e)
+                    if not self._should_retry(e, attempt):
+                        raise
+                    self.retries += 1
+                    await asyncio.sleep(self.retry_delay(e, attempt))
+                    attempt += 1
+                    span.set(retries=attempt)
+                except BaseException as e:
+                    # Cancelled or interrupted: free the slot without counting an outcome
+                    self._release(ticket, started, e)
+                    raise
+                else:
+                    self._release(ticket, started)
+                    return result
+
+    def _open_stream(self, client, method: str, kwargs: dict, backend: str, model: str = None,
+                     priority: str = None):
+        """Start a streamed call and wait for its first chunk, retrying transient failures until then.
+
+        Returns (chunks, first chunk, scheduler ticket, seconds to the first chunk).
+        """
+        self.calls += 1
+        attempt = 0
+        with tracer.span(f"inference.{backend}", stream=True) as span:
+            while True:
+                ticket = self._acquire(backend, model, priority)
+                started = time.perf_counter()
+                try:
+                    chunks = iter(getattr(client, method)(stream=True, **kwargs))
+                    return chunks, next(chunks, None), ticket, time.perf_counter() - started
+                except Exception as e:
+                    self._release(ticket, started, e)
+                    if not self._should_retry(e, attempt):
+                        raise
+                    self.retries += 1
+                    time.sleep(self.retry_delay(e, attempt))
+                    attempt += 1
+                    span.set(retries=attempt)
+                except BaseException as e:
+                    self._release(ticket, started, e)
+                    raise
+
+    def _end_stream(self, ticket, first_latency: float, error: BaseException = None):
+        "Free a stream's scheduler slot; the time to the first chunk is its latency, as generation length varies"
+        self._release(ticket, time.perf_counter() - first_latency, error)
+
+    def stream(self, backend: str, method: str, priority: str = None, **kwargs):
+        """Yield the chunks of a streamed client call (stream=True) as they arrive.
+
+        Only failures before the first chunk are retried, and streams bypass
+        the result cache. The scheduler slot is held until the stream ends.
+        """
+        client = self.get_client(backend)
+        model = kwargs.get('model')
+        if 'model' in kwargs:
+            kwargs['model'] = self.resolve_model(backend, kwargs['model'])
+        chunks, first, ticket, first_latency = self._open_stream(client, method, kwargs, backend, model, priority)
+        error = None
+        try:
+            if first is not None:
+                yield first
+                yield from chunks
+        except GeneratorExit:
+            # The caller stopped reading early, which is not a failure of the call
+            raise
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._end_stream(ticket, first_latency, error)
+
+    async def _aopen_stream(self, client, method: str, kwargs: dict, backend: str, model: str = None,
+                            priority: str = None):
+        "Async counterpart of _open_stream()"
+        self.calls += 1
+        attempt = 0
+        with tracer.span(f"inference.{backend}", stream=True) as span:
+            while True:
+                ticket = await self._aacquire(backend, model, priority)
+                started = time.perf_counter()
+                try:
+                    chunks = (await getattr(client, method)(stream=True, **kwargs)).__aiter__()
+                    try:
+                        first = await chunks.__anext__()
+                    except StopAsyncIteration:
+                        first = None
+                    return chunks, first, ticket, time.perf_counter() - started
+                except Exception as e:
+                    self._release(ticket, started, e)
+                    if not self._should_retry(e, attempt):
+                        raise
+                    self.retries += 1
+                    await asyncio.sleep(self.retry_delay(e, attempt))
+                    attempt += 1
+                    span.set(retries=attempt)
+                except BaseException as e:
+                    self._release(ticket, started, e)
+                    raise
+
+    async def astream(self, backend: str, method: str, priority: str = None, **kwargs):
+        "Async counterpart of stream()"
+        client = self.get_async_client(backend)
+        model = kwargs.get('model')
+        if 'model' in kwargs:
+            kwargs['model'] = self.resolve_model(backend, kwargs['model'])
+        chunks, first, ticket, first_latency = await self._aopen_stream(client, method, kwargs, backend, model,
+                                                                         priority)
+        error = None
+        try:
+            if first is not None:
+                yield first
+                async for chunk in chunks:
+                    yield chunk
+        except GeneratorExit:
+            # The caller stopped reading early, which is not a failure of the call
+            raise
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._end_stream(ticket, first_latency, error)
+
+    async def aclose(self):
+        "Close the async clients opened on the running event loop"
+        with self._lock:
+            clients = self._async_clients.pop(asyncio.get_running_loop(), {})
+        for client in clients.values():
+            close = getattr(client, 'close', None)
+            if close is not None:
+                await close()
+
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def get_client_provider() -> ClientProvider:
+    "Return the process-wide client provider, building it from config on first use"
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                _provider = ClientProvider.from_config()
+    return _provider
+
+
+def set_client_provider(provider: ClientProvider):
+    "Replace the process-wide client provider (e.g. with one pointing at a stub server)"
+    global _provider
+    with _provider_lock:
+        _provider = provider
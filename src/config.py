@@ -1,19 +1,142 @@
+import os
+import threading
+import time
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Mapping, Optional
+
 import yaml
 
 CONFIG_PATH = "config.yaml"
+# Minimum seconds between two mtime checks, so hot lookups never touch the disk.
+MTIME_CHECK_INTERVAL = 1.0
+
+
+def _freeze(value):
+    "Recursively convert parsed YAML into read-only containers"
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+@dataclass(frozen=True)
+class ConfigSnapshot:
+    "Immutable view of config.yaml, parsed once per file version"
+    data_path: Optional[str]
+    extractive_qa_model_name: Optional[str]
+    summarization_model: Optional[str]
+    system_prompt_abstractive_qa: Optional[str]
+    llm_model: Optional[str]
+    values: Mapping[str, Any]
+    mtime: float
+
+    @classmethod
+    def from_mapping(cls, values: dict, mtime: float) -> "ConfigSnapshot":
+        frozen = _freeze(values or {})
+        return cls(
+            data_path=frozen.get("DATA_PATH"),
+            extractive_qa_model_name=frozen.get("EXTRACTIVE_QA_MODEL_NAME"),
+            summarization_model=frozen.get("SUMMARIZATION_MODEL"),
+            system_prompt_abstractive_qa=frozen.get("SYSTEM_PROMPT_ABSTRACIVE_QA"),
+            llm_model=frozen.get("LLM_MODEL"),
+            values=frozen,
+            mtime=mtime,
+        )
+
+    def get(self, key: str, default=None):
+        return self.values.get(key, default)
+
+
+class ConfigStore:
+    "Parses the config file once and reloads it only when its mtime changes"
+
+    def __init__(self, path: str = CONFIG_PATH, check_interval: float = MTIME_CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self.parses = 0
+        self.lookups = 0
+        self.mtime_checks = 0
+
+    def _parse(self) -> ConfigSnapshot:
+        mtime = os.stat(self.path).st_mtime
+        with open(file=self.path, mode='r') as file:
+            values = yaml.safe_load(file)
+        self.parses += 1
+        return ConfigSnapshot.from_mapping(values, mtime)
+
+    def reload(self) -> ConfigSnapshot:
+        "Force a re-parse of the config file"
+        with self._lock:
+            self._snapshot = self._parse()
+            self._last_check = time.monotonic()
+            return self._snapshot
+
+    def snapshot(self) -> ConfigSnapshot:
+        "Return the current snapshot, re-parsing only if the file changed on disk"
+        snapshot = self._snapshot
+        if snapshot is None:
+            return self.reload()
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return snapshot
+        with self._lock:
+            if self._snapshot is not snapshot:
+                return self._snapshot
+            self._last_check = now
+            self.mtime_checks += 1
+            if os.stat(self.path).st_mtime != snapshot.mtime:
+                self._snapshot = self._parse()
+            return self._snapshot
+
+    def get(self, key: str, default=None):
+        self.lookups += 1
+        return self.snapshot().get(key, default)
+
+    def stats(self) -> dict:
+        return {"parses": self.parses, "lookups": self.lookups, "mtime_checks": self.mtime_checks}
+
 
+_store = ConfigStore()
 
-def read_config(key: str):
+
+def get_config() -> Optional[ConfigSnapshot]:
+    "Return the typed config snapshot"
     try:
-        if key is None:
-            return None
-        with open(file=CONFIG_PATH, mode='r') as file:
-            config = yaml.safe_load(file)
-        return config[key]
+        return _store.snapshot()
+    except Exception as e:
+        print(f"Raised exception {e}")
+        return None
+
+
+def reload_config() -> Optional[ConfigSnapshot]:
+    "Explicitly re-parse config.yaml"
+    try:
+        return _store.reload()
     except Exception as e:
         print(f"Raised exception {e}")
         return None
 
 
+def config_stats() -> dict:
+    "Parse and lookup counters of the shared config store"
+    return _store.stats()
+
+
+def read_config(key: str, default=None):
+    try:
+        if key is None:
+            return default
+        return _store.get(key, default)
+    except Exception as e:
+        print(f"Raised exception {e}")
+        return default
+
+
 if __name__ == "__main__":
-    print(read_config("data_path"))
+    print(read_config("DATA_PATH"))
+    print(config_stats())
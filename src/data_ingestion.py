@@ -1,42 +1,91 @@
 from src.config import read_config
+from src.claim_index import ClaimIndex
+from src.claim_archive import patient_archive
+from src.utils.utils import count_file_read
+from src.utils.tracing import tracer
 import os
 import json
 
+NOTE_FIELD = 'Clinical_note'
+
+
+def _project(details, fields):
+    if fields is None:
+        return details
+    return {key: details[key] for key in fields if key in details}
+
+
 class DataIngestion:
     "Class to create data ingestion from given patient id"
 
-    def __init__(self, patient_id):
+    def __init__(self, patient_id, data_path=None):
         self.patient_id = patient_id
-        self.base_dir = read_config('DATA_PATH')
+        self.base_dir = data_path or read_config('DATA_PATH')
         self.patient_dir = os.path.join(self.base_dir, self.patient_id)
+        # The persistent index belongs to DATA_PATH; other roots get an in-memory one.
+        default_root = self.base_dir == read_config('DATA_PATH')
+        index_path = read_config('CLAIM_INDEX_PATH') if default_root else None
+        self.claim_index = ClaimIndex.shared(self.base_dir, index_path)
+        # Packed archives (ARCHIVE_PATH) mirror DATA_PATH; folders stay the fallback
+        self.archive_dir = read_config('ARCHIVE_PATH') if default_root else None
 
-    def ingest_claim_data(self, claim_path: str):
-        "Ingest provided claim data files"
-        try:
+    def _archive(self):
+        "Packed archive of this patient if ARCHIVE_PATH has a fresh one, else None (directory layout)"
+        archive = patient_archive(self.archive_dir, self.base_dir, self.patient_id)
+        if archive is not None:
+            count_file_read()
+        return archive
 
-            if not claim_path:
-                return None
-            full_claim_path = os.path.join(self.patient_dir, claim_path)
-            files = os.listdir(full_claim_path)
+    def uses_archive(self) -> bool:
+        "Whether this patient's claims are read from a packed archive rather than the claim index"
+        return patient_archive(self.archive_dir, self.base_dir, self.patient_id) is not None
 
-            # Extract json path
-            details_file = [file for file in files if '.json' in file][0]
-            # Full path for josn file, combined with parent dir(claim folder)
-            details_file_path = os.path.join(full_claim_path,details_file)
-            # Extract txt file
-            clinical_note_file = [file for file in files if '.txt' in file][0]
-            # Full path for txt file combined with claim folder
-            clinical_note_file_path = os.path.join(full_claim_path,clinical_note_file)
+    def _load_claim(self, record, fields=None):
+        "Build claim details from an index record, reading its clinical note file only if it is wanted"
+        # Per-claim path: check the flag here rather than pay for a no-op span on every claim
+        if tracer.enabled:
+            with tracer.span("ingestion.load_claim"):
+                return self._read_claim(record, fields)
+        return self._read_claim(record, fields)
 
-            with open(details_file_path, 'r') as file:
-                details = json.load(file)
+    def _read_claim(self, record, fields=None):
+        details = _project(json.loads(record['details']), fields)
+        if fields is None or NOTE_FIELD in fields:
+            clinical_note = ""
+            if record['note_path']:
+                with open(record['note_path'], 'r') as file:
+                    clinical_note = file.read()
+                count_file_read()
+            details[NOTE_FIELD] = clinical_note
+        return details
 
-            with open(clinical_note_file_path, 'r') as file:
-                clinical_note = file.read()
+    def _iter_claims(self, fields=None):
+        archive = self._archive()
+        if archive is not None:
+            for claim_id in archive.claim_ids():
+                details = _project(archive.details(claim_id), fields)
+                if fields is None or NOTE_FIELD in fields:
+                    details[NOTE_FIELD] = archive.note(claim_id)
+                yield details
+            return
+        for record in self.claim_index.iter_claims(self.patient_id, columns=("details", "note_path")):
+            yield self._load_claim(record, fields)
 
-            details['Clinical_note'] = clinical_note
+    def ingest_claim_data(self, claim_path: str):
+        "Ingest provided claim data files"
+        try:
 
-            return details
+            if not claim_path:
+                return None
+            with tracer.span("ingestion.claim"):
+                archive = self._archive()
+                if archive is not None and claim_path in archive.index:
+                    return archive.claim(claim_path)
+                with tracer.span("index.get_claim"):
+                    record = self.claim_index.get_claim(self.patient_id, claim_path)
+                if record is None:
+                    raise FileNotFoundError(f"No claim {claim_path} for patient {self.patient_id}")
+                return self._load_claim(record)
 
         except Exception as e:
             print(e)
@@ -45,29 +94,33 @@ class DataIngestion:
     def ingest_patient_data(self):
         "Ingest all claim data from patient"
         try:
-            claim_details = []
-            claim_folders = os.listdir(self.patient_dir)
-            for claim in claim_folders:
-                claim_dif_path = os.path.join(self.patient_dir, claim)
-                files = os.listdir(claim_dif_path)
-                details_file = [file for file in files if '.json' in file][0]
-                details_file_path = os.path.join(claim_dif_path,details_file)
-                clinical_note_file = [file for file in files if '.txt' in file][0]
-                clinical_note_file_path = os.path.join(claim_dif_path,clinical_note_file)
-                with open(details_file_path, 'r') as file:
-                    details = json.load(file)
-                with open(clinical_note_file_path, 'r') as file:
-                    clinical_note = file.read()
-                details['Clinical_note'] = clinical_note
-                claim_details.append(details)
-            return claim_details
+            with tracer.span("ingestion.patient") as span:
+                claims = list(self._iter_claims())
+                span.set(claims=len(claims))
+                return claims
 
         except Exception as e:
             print(e)
             return None
 
+    def iter_patient_claims(self, fields=None):
+        """Yield the patient's claims one at a time.
+
+        With `fields`, each claim holds only those top-level keys and the
+        clinical note is read only if "Clinical_note" is one of them.
+        A read error is re-raised so callers never take a partial stream for the whole history.
+        """
+        try:
+            yield from self._iter_claims(fields)
+
+        except Exception as e:
+            print(e)
+            raise
+
 
 if __name__ == "__main__":
     data_ingestion = DataIngestion(patient_id="PA-12345")
     print(f"Data Ingestion for single claim file(CLM153910000): {data_ingestion.ingest_claim_data(claim_path='CLM153910000')}")
-    print(f"Data Ingestion for all claim files: {data_ingestion.ingest_patient_data()}")
\ No newline at end of file
+    print(f"Data Ingestion for all claim files: {data_ingestion.ingest_patient_data()}")
+    for claim in data_ingestion.iter_patient_claims(fields=("claim_id", "financials")):
+        print(claim)
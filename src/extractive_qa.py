@@ -1,39 +1,58 @@
 from src.config import read_config
-from huggingface_hub import InferenceClient
+from src.clients import get_client_provider
+from src.qa_backends import QABackend, create_backend
+from src.retrieval import top_k_spans
 from src.utils.utils import process_data
-from dotenv import load_dotenv
-import os
-
+from src.utils.tracing import tracer
 
 
 class ExtractiveQA:
-    def __init__(self, claim_data: str):
+    def __init__(self, claim_data: str, client_provider=None, backend=None, top_k: int = None):
         if isinstance(claim_data, dict):
             self.claim_data = process_data(data=claim_data)
         else:
             self.claim_data = claim_data
         self.model_name = read_config('EXTRACTIVE_QA_MODEL_NAME')
+        self.client_provider = client_provider or get_client_provider()
+        # backend: a QABackend, a backend name ('remote', 'rules', 'local') or None for EXTRACTIVE_QA_BACKEND
+        if isinstance(backend, QABackend):
+            self.backend = backend
+        else:
+            self.backend = create_backend(backend, client_provider=self.client_provider)
+        # Number of sentences retrieval keeps from the context; 0 sends the full context
+        self.top_k = top_k if top_k is not None else (read_config('EXTRACTIVE_QA_TOP_K') or 0)
 
+    def context_for(self, question: str) -> str:
+        "The context sent to the backend, narrowed to the top-k relevant sentences if enabled"
+        if self.top_k:
+            return top_k_spans(question, self.claim_data, k=self.top_k)
+        return self.claim_data
 
     def qa(self, question: str):
         try:
             if not self.claim_data or not question:
                 return None
-            load_dotenv()
-            client = InferenceClient(
-                provider="hf-inference",
-                api_key=os.getenv('HF_TOKEN'),
-            )
-            answer = client.question_answering(
-                question=question,
-                context=self.claim_data,
-                model=self.model_name,
-            )
+            with tracer.span("extractive_qa.context"):
+                context = self.context_for(question)
+            with tracer.span("extractive_qa.answer"):
+                answer = self.backend.answer(question=question, context=context)
             return answer
         except Exception as e:
             print(f"Exception: {e}")
             return None
 
+    async def aqa(self, question: str):
+        "Async version of qa()"
+        try:
+            if not self.claim_data or not question:
+                return None
+            with tracer.span("extractive_qa.context"):
+                context = self.context_for(question)
+            with tracer.span("extractive_qa.answer"):
+                return await self.backend.aanswer(question=question, context=context)
+        except Exception as e:
+            print(f"Exception: {e}")
+            return None
 
 if __name__ == "__main__":
     from src.data_ingestion import DataIngestion
@@ -1,27 +1,197 @@
-from collections import defaultdict
+from array import array
+from collections import Counter
+from datetime import date
+import numpy as np
+from src.utils.tracing import tracer
+
+AMOUNT_COLUMNS = ("billed_amount", "allowed_amount", "copay", "insurance_paid")
+PERCENTILES = (50, 90, 95, 99)
+# Robust z-score above which a claim's billed/allowed ratio is an outlier (Iglewicz and Hoaglin)
+OUTLIER_THRESHOLD = 3.5
+# Scales the MAD to the standard deviation of a normal distribution
+MAD_SCALE = 0.6745
+
+# The only claim fields analysis() reads; pass these to DataIngestion.iter_patient_claims
+ANALYSIS_FIELDS = ("claim_id", "claim_date", "patient_info", "provider_name", "primary_diagnosis", "financials")
+
+
+def _round(value: float) -> float:
+    return round(float(value), 2)
+
+
+def _amount(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+def _period(claim_date) -> str:
+    "Calendar month (YYYY-MM) of an ISO claim date, or None"
+    try:
+        return date.fromisoformat(str(claim_date)[:10]).strftime("%Y-%m")
+    except ValueError:
+        return None
+
+
+def amount_percentiles(amounts, percentiles=PERCENTILES):
+    "Percentiles of each amount column (arrays of float64, NaN for missing)"
+    result = {}
+    for name in AMOUNT_COLUMNS:
+        values = np.asarray(amounts[name], dtype="float64")
+        values = values[~np.isnan(values)]
+        result[name] = ({f"p{p}": _round(v) for p, v in zip(percentiles, np.percentile(values, percentiles))}
+                        if values.size else {})
+    return result
+
+
+def ratio_scores(billed, allowed, threshold: float = OUTLIER_THRESHOLD):
+    """(ratio, score, flagged) arrays: billed/allowed ratio, its robust median/MAD z-score,
+    and whether it is an outlier"""
+    billed = np.asarray(billed, dtype="float64")
+    allowed = np.asarray(allowed, dtype="float64")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = billed / allowed
+    valid = np.isfinite(ratio)
+    scores = np.zeros_like(ratio)
+    if valid.any():
+        median = np.median(ratio[valid])
+        mad = np.median(np.abs(ratio[valid] - median))
+        if mad > 0:
+            scores[valid] = MAD_SCALE * (ratio[valid] - median) / mad
+    return ratio, scores, valid & (np.abs(scores) > threshold)
+
+
+def ratio_outliers(billed, allowed, claim_ids, patient_id, threshold: float = OUTLIER_THRESHOLD):
+    "Claims whose billed/allowed ratio is far from the typical ratio (robust median/MAD z-score)"
+    ratio, scores, flagged = ratio_scores(billed, allowed, threshold)
+    return [{"patient_id": patient_id, "claim_id": claim_ids[i], "billed_amount": float(billed[i]),
+             "allowed_amount": float(allowed[i]), "billed_to_allowed": round(float(ratio[i]), 3),
+             "score": round(float(scores[i]), 2)}
+            for i in np.flatnonzero(flagged)]
+
+
+class ClaimAggregator:
+    """Single-pass aggregates over a stream of claims.
+
+    Totals, counts and monthly trends are running sums. Percentiles and
+    outliers need every amount, so those are kept as packed float64 arrays
+    (32 bytes per claim); claim text is never held.
+    """
 
-class HolisticAnalysis:
     def __init__(self):
-        pass
+        self.count = 0
+        self.patient_info = None
+        self.totals = dict.fromkeys(AMOUNT_COLUMNS, 0.0)
+        self.amounts = {name: array("d") for name in AMOUNT_COLUMNS}
+        self.claim_ids = []
+        self.providers = Counter()
+        self.diagnoses = Counter()
+        self.trends = {}
+
+    def add(self, claim):
+        if self.patient_info is None:
+            self.patient_info = claim.get('patient_info') or {}
+        self.count += 1
+        self.claim_ids.append(claim.get('claim_id'))
+        if claim.get('provider_name') is not None:
+            self.providers[claim['provider_name']] += 1
+        if claim.get('primary_diagnosis') is not None:
+            self.diagnoses[claim['primary_diagnosis']] += 1
+        financials = claim.get('financials') or {}
+        values = [_amount(financials.get(name)) for name in AMOUNT_COLUMNS]
+        period = _period(claim.get('claim_date'))
+        trend = None
+        if period is not None:
+            trend = self.trends.setdefault(period, {"claims": 0, **dict.fromkeys(AMOUNT_COLUMNS, 0.0)})
+            trend["claims"] += 1
+        for name, value in zip(AMOUNT_COLUMNS, values):
+            self.amounts[name].append(value)
+            if value == value:
+                self.totals[name] += value
+                if trend is not None:
+                    trend[name] += value
+
+    def consume(self, claims):
+        for claim in claims:
+            self.add(claim)
+        return self
+
+    @staticmethod
+    def _counts(counter):
+        return dict(sorted(counter.items(), key=lambda item: (-item[1], item[0])))
 
-    def analysis(self,patient_data):
-        total_copay = sum(claim['financials']['copay'] for claim in patient_data)
-        total_allowed_amount = sum(claim['financials']['allowed_amount'] for claim  in patient_data)
-        total_insurance_paid = sum(claim['financials']['insurance_paid'] for claim  in patient_data)
-        providers = set(claim['provider_name'] for claim in patient_data)
-        diagnosis_counts = defaultdict(int)
-        total_claims_count = len(patient_data)
-        for claim in patient_data:
-            diagnosis_counts[claim['primary_diagnosis']] += 1
+    def percentiles(self, percentiles=PERCENTILES):
+        return amount_percentiles(self.amounts, percentiles)
 
+    def outliers(self, threshold: float = OUTLIER_THRESHOLD):
+        return ratio_outliers(self.amounts["billed_amount"], self.amounts["allowed_amount"], self.claim_ids,
+                              self.patient_info.get('patient_id'), threshold)
 
-        print(f"Print Holistic Report for Patient {patient_data[0]['patient_info']['first_name']} {patient_data[0]['patient_info']['last_name']} with Patient id {patient_data[0]['patient_info']['patient_id']}")
-        print(f"Total Copay: {total_copay}")
-        print(f"Total Allowed amount: {total_allowed_amount}")
-        print(f"Total Insurance paid: {total_insurance_paid}")
-        print(f"Provider names: {providers}")
-        print(f"Diagnosis count: {diagnosis_counts}")
-        print(f"No of times claim requested: {total_claims_count}")
+    def report(self):
+        if not self.count:
+            return None
+        patient_info = self.patient_info
+        return {
+            "patient_id": patient_info.get('patient_id'),
+            "patient_name": f"{patient_info.get('first_name', '')} {patient_info.get('last_name', '')}".strip(),
+            "total_copay": _round(self.totals["copay"]),
+            "total_allowed_amount": _round(self.totals["allowed_amount"]),
+            "total_insurance_paid": _round(self.totals["insurance_paid"]),
+            "total_billed_amount": _round(self.totals["billed_amount"]),
+            "providers": sorted(self.providers),
+            "diagnosis_counts": self._counts(self.diagnoses),
+            "total_claims_count": self.count,
+            "percentiles": self.percentiles(),
+            "trends": [{"period": period, "claims": trend["claims"],
+                        **{name: _round(trend[name]) for name in AMOUNT_COLUMNS}}
+                       for period, trend in sorted(self.trends.items())],
+            "outliers": self.outliers(),
+        }
+
+
+class HolisticAnalysis:
+    def __init__(self, store=None):
+        # Optional AggregateStore serving materialized reports by patient id
+        self.store = store
+
+    def analysis(self,patient_data=None,patient_id=None):
+        """Structured holistic report over all claims of a patient.
+
+        `patient_data` can be a list or any iterable, e.g.
+        DataIngestion.iter_patient_claims(fields=ANALYSIS_FIELDS); it is read once.
+        With a store, pass `patient_id` instead to read the materialized aggregate.
+        """
+        if patient_data is None and patient_id is not None and self.store is not None:
+            with tracer.span("analysis.store"):
+                return self.store.report(patient_id)
+        if patient_data is None:
+            return None
+        with tracer.span("analysis.aggregate") as span:
+            try:
+                aggregator = ClaimAggregator().consume(patient_data)
+            except Exception as e:
+                # No report rather than totals over the claims read before the error
+                print(e)
+                return None
+            span.set(claims=aggregator.count)
+        with tracer.span("analysis.report"):
+            return aggregator.report()
+
+    @staticmethod
+    def format_report(report):
+        "Human readable text of an analysis() report"
+        if not report:
+            return "No claims found for patient."
+        return "\n".join([
+            f"Holistic Report for Patient {report['patient_name']} with Patient id {report['patient_id']}",
+            f"Total Copay: {report['total_copay']}",
+            f"Total Allowed amount: {report['total_allowed_amount']}",
+            f"Total Insurance paid: {report['total_insurance_paid']}",
+            f"Provider names: {', '.join(report['providers'])}",
+            f"Diagnosis count: {report['diagnosis_counts']}",
+            f"No of times claim requested: {report['total_claims_count']}",
+        ])
 
 
     def analyze_with_llm(self):
@@ -31,8 +201,6 @@ class HolisticAnalysis:
 if __name__ == "__main__":
     from src.data_ingestion import DataIngestion
     data_ingestion = DataIngestion(patient_id="PA-12345")
-    patient_data = data_ingestion.ingest_patient_data()
-    # print(patient_data)
+    patient_data = data_ingestion.iter_patient_claims(fields=ANALYSIS_FIELDS)
     holistic_analysis = HolisticAnalysis()
-    holistic_analysis.analysis(patient_data)
-
+    print(holistic_analysis.format_report(holistic_analysis.analysis(patient_data)))
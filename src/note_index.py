@@ -0,0 +1,277 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from src.claim_archive import patient_archive
+from src.config import read_config
+from src.prompt_builder import NOTE_FIELD, PromptBuilder
+from src.retrieval import bm25_scores, expand_query, tokenize
+from src.utils.utils import count_file_read
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS note_sources (
+    patient_id TEXT NOT NULL,
+    claim_id TEXT NOT NULL,
+    note_mtime_ns INTEGER NOT NULL,
+    embedder TEXT NOT NULL,
+    PRIMARY KEY (patient_id, claim_id)
+);
+CREATE TABLE IF NOT EXISTS note_chunks (
+    patient_id TEXT NOT NULL,
+    claim_id TEXT NOT NULL,
+    chunk_no INTEGER NOT NULL,
+    claim_date TEXT,
+    text TEXT NOT NULL,
+    vector BLOB NOT NULL,
+    PRIMARY KEY (patient_id, claim_id, chunk_no)
+);
+"""
+
+
+class HashingEmbedder:
+    """Feature-hashed unigram and bigram vectors, L2-normalized float32.
+
+    Needs no model download and is stable across processes (crc32, not the
+    salted built-in hash), so stored vectors stay valid.
+    """
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _features(self, text: str) -> List[int]:
+        tokens = tokenize(text)
+        features = tokens + [f"{left} {right}" for left, right in zip(tokens, tokens[1:])]
+        return [zlib.crc32(feature.encode()) for feature in features]
+
+    def embed(self, texts: List[str], batch_size: int = 256) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            rows, columns, signs = [], [], []
+            for row, text in enumerate(texts[start:start + batch_size], start):
+                hashes = np.array(self._features(text), dtype=np.uint32)
+                rows.append(np.full(len(hashes), row))
+                columns.append(hashes % self.dim)
+                signs.append(np.where(hashes & 0x80000000, -1.0, 1.0))
+            if rows:
+                np.add.at(vectors, (np.concatenate(rows), np.concatenate(columns)), np.concatenate(signs))
+        # Sub-linear term frequency, then unit length so a dot product is the cosine
+        vectors = np.sign(vectors) * np.log1p(np.abs(vectors))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1.0, norms)
+
+
+class SentenceEmbedder:
+    "Sentence-transformers model on CPU (optional dependency)"
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.name = model_name
+
+    def embed(self, texts: List[str], batch_size: int = 64) -> np.ndarray:
+        return np.asarray(self.model.encode(list(texts), batch_size=batch_size, normalize_embeddings=True),
+                          dtype=np.float32)
+
+
+def create_embedder(model_name: str = None, dim: int = 512):
+    "The configured embedding model, or HashingEmbedder if none is set or it cannot be loaded"
+    if model_name:
+        try:
+            return SentenceEmbedder(model_name)
+        except Exception as e:
+            print(f"Falling back to hashed embeddings: {e}")
+    return HashingEmbedder(dim)
+
+
+@dataclass
+class NoteHit:
+    claim_id: str
+    chunk_no: int
+    claim_date: Optional[str]
+    text: str
+    score: float
+
+
+class NoteIndex:
+    """Search index over the clinical-note chunks of each patient's claims, kept next to the ClaimIndex.
+
+    Notes are split into sentence-aligned chunks, embedded in batches on CPU
+    and stored as float32 vectors. sync() re-embeds only the claims whose
+    note was added, edited or removed since the last sync. search() ranks a
+    patient's chunks by cosine similarity plus BM25 (weighted by
+    bm25_weight) and returns the top k. With archive_dir, patients that
+    have a fresh packed archive (ARCHIVE_PATH) are indexed from it.
+    """
+
+    _shared: Dict[int, "NoteIndex"] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, claim_index, embedder=None, prompt_builder: PromptBuilder = None,
+                 bm25_weight: float = 0.5, check_interval: float = 5.0, archive_dir: str = None):
+        self.claim_index = claim_index
+        self.archive_dir = archive_dir
+        self.embedder = embedder or HashingEmbedder()
+        self.prompt_builder = prompt_builder or PromptBuilder(chunk_tokens=160, overlap_tokens=32)
+        self.bm25_weight = bm25_weight
+        self.check_interval = check_interval
+        # Lives in the same database file as the index it mirrors
+        self._conn = sqlite3.connect(claim_index.index_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.RLock()
+        self._matrices: Dict[str, Dict] = {}
+        self._checked: Dict[str, float] = {}
+        self.syncs = 0
+        self.claims_embedded = 0
+        self.chunks_embedded = 0
+        self.searches = 0
+
+    @classmethod
+    def from_config(cls, claim_index, archive_dir: str = None) -> "NoteIndex":
+        return cls(
+            claim_index,
+            embedder=create_embedder(read_config('NOTE_EMBEDDING_MODEL'), read_config('NOTE_EMBEDDING_DIM', 512)),
+            prompt_builder=PromptBuilder(chunk_tokens=read_config('NOTE_CHUNK_TOKENS', 160),
+                                         overlap_tokens=read_config('NOTE_CHUNK_OVERLAP_TOKENS', 32)),
+            bm25_weight=read_config('NOTE_INDEX_BM25_WEIGHT', 0.5),
+            check_interval=read_config('NOTE_INDEX_CHECK_INTERVAL_SECONDS', 5.0),
+            archive_dir=archive_dir,
+        )
+
+    @classmethod
+    def shared(cls, claim_index, archive_dir: str = None) -> "NoteIndex":
+        "Return one long-lived note index per claim index, built from config"
+        with cls._shared_lock:
+            index = cls._shared.get(id(claim_index))
+            if index is None or index.claim_index is not claim_index or index.archive_dir != archive_dir:
+                index = cls._shared[id(claim_index)] = cls.from_config(claim_index, archive_dir)
+            return index
+
+    @staticmethod
+    def _note_mtime(note_path) -> int:
+        try:
+            return os.stat(note_path).st_mtime_ns if note_path else 0
+        except FileNotFoundError:
+            return -1
+
+    def _load_notes(self, patient_id: str, claim_ids: List[str], archive=None) -> Dict[str, Dict]:
+        "claim_date and clinical note of the given claims, read from the archive or through the claim index"
+        claims = {}
+        if archive is not None:
+            for claim_id in claim_ids:
+                claims[claim_id] = {"claim_date": archive.details(claim_id).get("claim_date"),
+                                    NOTE_FIELD: archive.note(claim_id)}
+            return claims
+        for claim_id in claim_ids:
+            record = self.claim_index.get_claim(patient_id, claim_id)
+            if record is None:
+                continue
+            note = ""
+            if record["note_path"]:
+                with open(record["note_path"], "r") as file:
+                    note = file.read()
+                count_file_read()
+            claims[claim_id] = {"claim_date": json.loads(record["details"]).get("claim_date"), NOTE_FIELD: note}
+        return claims
+
+    def sync(self, patient_id: str) -> Dict[str, List[str]]:
+        "Embed notes of claims added or edited since the last sync and drop removed ones"
+        with self._lock:
+            stored = {row["claim_id"]: row for row in self._conn.execute(
+                "SELECT claim_id, note_mtime_ns, embedder FROM note_sources WHERE patient_id = ?", (patient_id,))}
+            archive = patient_archive(self.archive_dir, self.claim_index.data_path, patient_id)
+            if archive is not None:
+                # Rewriting the archive re-embeds its claims; its mtime is their version
+                current = dict.fromkeys(archive.claim_ids(), archive.mtime_ns)
+            else:
+                current = {row["claim_id"]: self._note_mtime(row["note_path"])
+                           for row in self.claim_index.iter_claims(patient_id, columns=("note_path",))}
+            changes = {
+                "added": sorted(current.keys() - stored.keys()),
+                "changed": sorted(claim_id for claim_id in current.keys() & stored.keys()
+                                  if current[claim_id] != stored[claim_id]["note_mtime_ns"]
+                                  or stored[claim_id]["embedder"] != self.embedder.name),
+                "removed": sorted(stored.keys() - current.keys()),
+            }
+            claims = self._load_notes(patient_id, changes["added"] + changes["changed"], archive)
+            chunks = [(claim_id, chunk_no, claim.get("claim_date"), text)
+                      for claim_id, claim in claims.items()
+                      for chunk_no, text in enumerate(self.prompt_builder.chunk(claim.get(NOTE_FIELD) or ""))]
+            vectors = self.embedder.embed([text for *_, text in chunks])
+            stale = changes["removed"] + changes["changed"]
+            with self._conn:
+                for table in ("note_sources", "note_chunks"):
+                    self._conn.executemany(f"DELETE FROM {table} WHERE patient_id = ? AND claim_id = ?",
+                                           [(patient_id, claim_id) for claim_id in stale])
+                self._conn.executemany(
+                    "INSERT INTO note_chunks (patient_id, claim_id, chunk_no, claim_date, text, vector) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [(patient_id, *chunk, vector.tobytes()) for chunk, vector in zip(chunks, vectors)])
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO note_sources (patient_id, claim_id, note_mtime_ns, embedder) "
+                    "VALUES (?, ?, ?, ?)",
+                    [(patient_id, claim_id, current[claim_id], self.embedder.name) for claim_id in claims])
+            if claims or stale:
+                self._matrices.pop(patient_id, None)
+            self._checked[patient_id] = time.monotonic()
+            self.syncs += 1
+            self.claims_embedded += len(claims)
+            self.chunks_embedded += len(chunks)
+        return changes
+
+    def _matrix(self, patient_id: str) -> Dict:
+        "The patient's chunk vectors as one matrix, with their texts and tokens, cached until the next change"
+        checked = self._checked.get(patient_id)
+        if checked is None or time.monotonic() - checked >= self.check_interval:
+            self.sync(patient_id)
+        with self._lock:
+            matrix = self._matrices.get(patient_id)
+            if matrix is None:
+                rows = self._conn.execute(
+                    "SELECT claim_id, chunk_no, claim_date, text, vector FROM note_chunks WHERE patient_id = ? "
+                    "ORDER BY claim_id, chunk_no", (patient_id,)).fetchall()
+                vectors = (np.vstack([np.frombuffer(row["vector"], dtype=np.float32) for row in rows]) if rows
+                           else np.zeros((0, 0), dtype=np.float32))
+                matrix = self._matrices[patient_id] = {
+                    "rows": [(row["claim_id"], row["chunk_no"], row["claim_date"], row["text"]) for row in rows],
+                    "tokens": [tokenize(row["text"]) for row in rows],
+                    "vectors": vectors,
+                }
+            return matrix
+
+    def search(self, patient_id: str, question: str, k: int = 4) -> List[NoteHit]:
+        "The k note chunks of the patient most relevant to the question, best first"
+        matrix = self._matrix(patient_id)
+        self.searches += 1
+        if not matrix["rows"] or k <= 0:
+            return []
+        scores = matrix["vectors"] @ self.embedder.embed([question])[0]
+        if self.bm25_weight:
+            bm25 = np.asarray(bm25_scores(expand_query(question), matrix["tokens"]), dtype=np.float32)
+            if bm25.max() > 0:
+                scores = (1 - self.bm25_weight) * scores + self.bm25_weight * bm25 / bm25.max()
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [NoteHit(*matrix["rows"][i], score=round(float(scores[i]), 4)) for i in top]
+
+    def stats(self) -> dict:
+        return {"syncs": self.syncs, "claims_embedded": self.claims_embedded,
+                "chunks_embedded": self.chunks_embedded, "searches": self.searches, "embedder": self.embedder.name}
+
+
+if __name__ == "__main__":
+    from src.data_ingestion import DataIngestion
+    claim_index = DataIngestion(patient_id="PA-12345").claim_index
+    note_index = NoteIndex.from_config(claim_index)
+    for hit in note_index.search("PA-12345", "Which medication was prescribed for blood pressure?"):
+        print(hit)
+    print(note_index.stats())
@@ -0,0 +1,37 @@
+from src.abstractive_qa import AbstractiveQA
+from src.config import read_config
+from src.note_index import NoteIndex
+from src.prompt_builder import NOTE_FIELD, PromptRecord
+
+
+class PatientQA(AbstractiveQA):
+    """Advanced QA over a patient's whole claim history.
+
+    Instead of sending every note, the question is searched in the patient's
+    NoteIndex and only the top_k most relevant note chunks, each labelled
+    with its claim id and date, are sent to the model.
+    """
+
+    def __init__(self, patient_id: str, note_index: NoteIndex, top_k: int = None, client_provider=None,
+                 prompt_builder=None):
+        super().__init__(claim_data=None, client_provider=client_provider, prompt_builder=prompt_builder)
+        self.system_prompt = read_config('SYSTEM_PROMPT_PATIENT_QA') or self.system_prompt
+        self.patient_id = patient_id
+        self.note_index = note_index
+        self.top_k = top_k or read_config('PATIENT_QA_TOP_K', 4)
+        # Note chunks sent with the last question
+        self.last_hits = []
+
+    def build_messages(self, question: str, record: PromptRecord = None):
+        self.last_hits = self.note_index.search(self.patient_id, question, k=self.top_k)
+        notes = "\n\n".join(f"[Claim {hit.claim_id}, {hit.claim_date}] {hit.text}" for hit in self.last_hits)
+        claim_data = {"patient_id": self.patient_id, NOTE_FIELD: notes}
+        return self.prompt_builder.qa_messages(self.system_prompt, claim_data, question, record)
+
+
+if __name__ == "__main__":
+    from src.data_ingestion import DataIngestion
+    claim_index = DataIngestion(patient_id="PA-12345").claim_index
+    patient_qa = PatientQA(patient_id="PA-12345", note_index=NoteIndex.shared(claim_index))
+    print(patient_qa.qa(question="Which medication was prescribed for blood pressure?"))
+    print([hit.claim_id for hit in patient_qa.last_hits])
@@ -1,47 +1,231 @@
+from typing import Callable, Dict
 from src.data_ingestion import DataIngestion
-from src.abstractive_qa import AbstractiveQA
-from src.extractive_qa import ExtractiveQA
-from src.summary import Summarization
-from src.holistic_analysis import HolisticAnalysis
+from src.question_router import question_router
+from src.config import read_config
+from src.utils.utils import files_read
+from src.utils.tracing import tracer
+
+# Option name -> handler(pipeline, question). Handlers import their backend modules when
+# dispatched, so local options like `analysis` never load the inference clients.
+OPTIONS: Dict[str, Callable] = {}
+# Option name -> generator handler(pipeline, question) yielding (field, text) pieces (Pipeline.stream)
+STREAM_OPTIONS: Dict[str, Callable] = {}
+# Options whose handlers have async counterparts (Pipeline._arun)
+ASYNC_OPTIONS = ("qa", "advanced_qa", "summary")
+
+
+def register_option(name: str, stream: bool = False):
+    "Register a Pipeline method as the handler of an option, or with stream=True as its streaming handler"
+    def register(handler):
+        (STREAM_OPTIONS if stream else OPTIONS)[name] = handler
+        return handler
+    return register
 
 
 class Pipeline:
-    def __init__(self,patient_id:str,claim_id:str=None):
-        data_ingestoin = DataIngestion(patient_id=patient_id)
-        if claim_id:
-            self.claim_data = data_ingestoin.ingest_claim_data(claim_path=claim_id)
-        else:
-            self.claim_data = None
-        self.patient_data = data_ingestoin.ingest_patient_data()
+    def __init__(self,patient_id:str,claim_id:str=None,data_path:str=None,router=None,client_provider=None):
+        self.patient_id = patient_id
+        self.claim_id = claim_id
+        self.data_ingestion = DataIngestion(patient_id=patient_id, data_path=data_path)
+        self._claim_data = None
+        self._claim_data_loaded = False
+        self._patient_data = None
+        self._patient_data_loaded = False
+        # Answers factual questions from claim fields before any model call; None disables it
+        self.router = router or (question_router if read_config('QUESTION_ROUTER_ENABLED', True) else None)
+        # Number of claim files read from disk by the last pipeline() or apipeline() call
+        self.files_touched = 0
+        # None uses the process-wide provider (src.clients.get_client_provider)
+        self.client_provider = client_provider
+
+    @property
+    def claim_data(self):
+        "Single claim details, loaded on first access"
+        if not self._claim_data_loaded:
+            if self.claim_id:
+                self._claim_data = self.data_ingestion.ingest_claim_data(claim_path=self.claim_id)
+            self._claim_data_loaded = True
+        return self._claim_data
+
+    @property
+    def patient_data(self):
+        "All claims of the patient, loaded on first access"
+        if not self._patient_data_loaded:
+            self._patient_data = self.data_ingestion.ingest_patient_data()
+            self._patient_data_loaded = True
+        return self._patient_data
 
-    def pipeline(self, option: str, question: str = ""):
+    def pipeline(self, option: str, question: str = "", profiler=None, stream: bool = False):
+        """Run one option; profiler ('cprofile'/'pyinstrument') profiles this call, see src.utils.tracing.
+        With stream=True, returns the generator of stream() instead of the result"""
+        if stream:
+            return self.stream(option, question)
+        start = files_read()
+        try:
+            with tracer.request(f"pipeline.{option}", profiler=profiler,
+                                patient_id=self.patient_id, claim_id=self.claim_id):
+                return self._run(option=option, question=question)
+        finally:
+            self.files_touched = files_read() - start
+
+    def stream(self, option: str, question: str = ""):
+        """Yield the result in (field, text) pieces as it is generated: advanced_qa streams "answer"
+        then "reasoning", summary streams "partial" chunk summaries then "summary". Other options
+        yield ("result", result) once"""
+        handler = STREAM_OPTIONS.get(option)
+        if handler is None:
+            yield "result", self.pipeline(option, question)
+            return
+        start = files_read()
+        try:
+            yield from handler(self, question)
+        finally:
+            self.files_touched = files_read() - start
+
+    async def apipeline(self, option: str, question: str = ""):
+        "Async version of pipeline(): model calls use the async clients, disk reads run in a thread"
+        # Profilers follow one thread, so async requests only get spans
+        self.files_touched = 0
+        start = files_read()
+        try:
+            with tracer.request(f"pipeline.{option}", profiler=False,
+                                patient_id=self.patient_id, claim_id=self.claim_id):
+                return await self._arun(option, question)
+        finally:
+            self.files_touched += files_read() - start
+
+    def _counted(self, function, *args):
+        "Run function, adding the claim files it reads on this thread to files_touched (for asyncio.to_thread)"
+        start = files_read()
+        try:
+            return function(*args)
+        finally:
+            self.files_touched += files_read() - start
+
+    async def _arun(self, option: str, question: str = ""):
+        # Imported here: asyncio alone is a third of the CLI's import time
+        import asyncio
+        if option not in ASYNC_OPTIONS:
+            return await asyncio.to_thread(self._counted, self._run, option, question)
+        claim_data = await asyncio.to_thread(self._counted, lambda: self.claim_data)
+        if option == "summary":
+            from src.summary import Summarization
+            return await Summarization(client_provider=self.client_provider).asummarize(claim_data=claim_data)
+        if not question:
+            return "No question received."
+        routed = self._route(question)
+        if routed is not None:
+            return routed if option == "qa" else (routed.answer, routed.reasoning())
         if option == "qa":
-            extractive_qa = ExtractiveQA(claim_data=self.claim_data)
-            if question:
-                return extractive_qa.qa(question=question)
-            else:
-                return "No question received."
-
-        elif option == "advanced_qa":
-            abstractive_qa = AbstractiveQA(claim_data=self.claim_data)
-            if question:
-                return abstractive_qa.qa(question=question)
-            else:
-                return "No question received."
-        elif option == "summary":
-            summarization = Summarization()
-            return summarization.summarize(claim_data=self.claim_data)
-
-        elif option == "analysis":
-            holistic_analysis = HolisticAnalysis()
-            holistic_analysis.analysis(patient_data=self.patient_data)
-        else:
+            from src.extractive_qa import ExtractiveQA
+            return await ExtractiveQA(claim_data=claim_data, client_provider=self.client_provider).aqa(question)
+        from src.abstractive_qa import AbstractiveQA
+        return await AbstractiveQA(claim_data=claim_data, client_provider=self.client_provider).aqa(question)
+
+    def _route(self, question: str):
+        "Fast-path answer from structured claim fields, if the router is confident"
+        if self.router is None or not question:
+            return None
+        return self.router.route(question, self.claim_data)
+
+    def _run(self, option: str, question: str = ""):
+        handler = OPTIONS.get(option)
+        if handler is None:
             print(f"Option {option} not available")
+            return None
+        return handler(self, question)
+
+    @register_option("qa")
+    def _qa(self, question: str):
+        routed = self._route(question)
+        if routed is not None:
+            return routed
+        from src.extractive_qa import ExtractiveQA
+        extractive_qa = ExtractiveQA(claim_data=self.claim_data, client_provider=self.client_provider)
+        if question:
+            return extractive_qa.qa(question=question)
+        else:
+            return "No question received."
+
+    @register_option("advanced_qa")
+    def _advanced_qa(self, question: str):
+        routed = self._route(question)
+        if routed is not None:
+            return routed.answer, routed.reasoning()
+        from src.abstractive_qa import AbstractiveQA
+        abstractive_qa = AbstractiveQA(claim_data=self.claim_data, client_provider=self.client_provider)
+        if question:
+            return abstractive_qa.qa(question=question)
+        else:
+            return "No question received."
+
+    @register_option("advanced_qa", stream=True)
+    def _advanced_qa_stream(self, question: str):
+        routed = self._route(question)
+        if routed is not None:
+            yield "answer", routed.answer
+            yield "reasoning", routed.reasoning()
+            return
+        if not question:
+            yield "result", "No question received."
+            return
+        from src.abstractive_qa import AbstractiveQA
+        abstractive_qa = AbstractiveQA(claim_data=self.claim_data, client_provider=self.client_provider)
+        yield from abstractive_qa.qa_stream(question=question)
+
+    @register_option("summary")
+    def _summary(self, question: str = ""):
+        from src.summary import Summarization
+        summarization = Summarization(client_provider=self.client_provider)
+        return summarization.summarize(claim_data=self.claim_data)
+
+    @register_option("summary", stream=True)
+    def _summary_stream(self, question: str = ""):
+        from src.summary import Summarization
+        summarization = Summarization(client_provider=self.client_provider)
+        yield from summarization.summarize_stream(claim_data=self.claim_data)
+
+    @register_option("history_qa")
+    def _history_qa(self, question: str):
+        # The same question over every claim of the patient, packed into few chat completions
+        if not question:
+            return "No question received."
+        from src.batched_qa import BatchedQA
+        return BatchedQA(client_provider=self.client_provider).ask_claims(self.data_ingestion.iter_patient_claims(), question)
+
+    @register_option("patient_qa")
+    def _patient_qa(self, question: str):
+        # Questions about the patient's whole history, answered from the most relevant note chunks
+        if not question:
+            return "No question received."
+        from src.note_index import NoteIndex
+        from src.patient_qa import PatientQA
+        note_index = NoteIndex.shared(self.data_ingestion.claim_index, self.data_ingestion.archive_dir)
+        return PatientQA(patient_id=self.patient_id, note_index=note_index,
+                         client_provider=self.client_provider).qa(question=question)
+
+    @register_option("analysis")
+    def _analysis(self, question: str = ""):
+        from src.holistic_analysis import ANALYSIS_FIELDS, HolisticAnalysis
+        # The aggregate store mirrors the claim index, so archived patients are streamed instead
+        if read_config('AGGREGATE_STORE_ENABLED', False) and not self.data_ingestion.uses_archive():
+            from src.aggregate_store import AggregateStore
+            store = AggregateStore.shared(self.data_ingestion.claim_index,
+                                          check_interval=read_config('AGGREGATE_CHECK_INTERVAL_SECONDS', 5.0),
+                                          verify_interval=read_config('AGGREGATE_VERIFY_INTERVAL_SECONDS', 3600.0))
+            return HolisticAnalysis(store=store).analysis(patient_id=self.patient_id)
+        holistic_analysis = HolisticAnalysis()
+        # Stream only the fields the report needs unless every claim is already in memory
+        patient_data = (self._patient_data if self._patient_data_loaded
+                        else self.data_ingestion.iter_patient_claims(fields=ANALYSIS_FIELDS))
+        return holistic_analysis.analysis(patient_data=patient_data)
 
 
 if __name__ == "__main__":
     pipeline = Pipeline(patient_id="PA-12345",claim_id="CLM153910000")
     print(pipeline.pipeline(option="summary"))
+    print(f"Files touched: {pipeline.files_touched}")
     print(f"\n")
-    pipeline.pipeline(option="analysis")
+    print(pipeline.pipeline(option="analysis"))
+    print(f"Files touched: {pipeline.files_touched}")
     # print(pipeline.pipeline(option="advanced_qa",question="Who is the patient?"))
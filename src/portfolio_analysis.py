@@ -0,0 +1,127 @@
+from typing import Dict, Iterable, List, Optional, Sequence
+import numpy as np
+import pandas as pd
+# Shared with the per-patient report, which must not pay for importing pandas
+from src.holistic_analysis import AMOUNT_COLUMNS, OUTLIER_THRESHOLD, PERCENTILES, _round, amount_percentiles, ratio_scores
+
+CATEGORY_COLUMNS = ("patient_id", "provider_name", "primary_diagnosis", "icd_code", "cpt_code")
+
+
+def claims_to_frame(claims: Iterable[Dict]) -> pd.DataFrame:
+    "Load claim dicts (as returned by DataIngestion) into typed columns in one pass"
+    columns = {name: [] for name in ("claim_id", "claim_date") + CATEGORY_COLUMNS + AMOUNT_COLUMNS}
+    for claim in claims:
+        financials = claim.get("financials") or {}
+        columns["claim_id"].append(claim.get("claim_id"))
+        columns["claim_date"].append(claim.get("claim_date"))
+        columns["patient_id"].append((claim.get("patient_info") or {}).get("patient_id"))
+        for name in CATEGORY_COLUMNS[1:]:
+            columns[name].append(claim.get(name))
+        for name in AMOUNT_COLUMNS:
+            columns[name].append(financials.get(name))
+    return _typed(pd.DataFrame(columns))
+
+
+def index_to_frame(claim_index, patient_ids: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    "Load pre-parsed claim fields straight from a ClaimIndex, without reading claim files"
+    patient_ids = list(patient_ids) if patient_ids is not None else claim_index.patient_ids()
+    columns = ("claim_id", "claim_date") + CATEGORY_COLUMNS + AMOUNT_COLUMNS
+    rows = claim_index.select_fields(columns, patient_ids)
+    return _typed(pd.DataFrame(rows, columns=list(columns)))
+
+
+def _typed(frame: pd.DataFrame) -> pd.DataFrame:
+    for name in AMOUNT_COLUMNS:
+        frame[name] = pd.to_numeric(frame[name], errors="coerce").astype("float64")
+    for name in CATEGORY_COLUMNS:
+        frame[name] = frame[name].astype("category")
+    frame["claim_date"] = pd.to_datetime(frame["claim_date"], errors="coerce")
+    return frame
+
+
+class PortfolioAnalysis:
+    """Vectorized aggregates over a claim frame of one or many patients.
+
+    Every method returns plain dicts/lists (or DataFrames for tabular
+    results) instead of printing, so reports can be served or stored.
+    """
+
+    def __init__(self, frame: pd.DataFrame):
+        self.frame = frame
+
+    @classmethod
+    def from_claims(cls, claims: Iterable[Dict]) -> "PortfolioAnalysis":
+        return cls(claims_to_frame(claims))
+
+    @classmethod
+    def from_index(cls, claim_index, patient_ids: Optional[Sequence[str]] = None) -> "PortfolioAnalysis":
+        return cls(index_to_frame(claim_index, patient_ids))
+
+    def totals(self) -> Dict[str, float]:
+        sums = self.frame[list(AMOUNT_COLUMNS)].to_numpy(dtype="float64")
+        return {f"total_{name}": _round(total) for name, total in zip(AMOUNT_COLUMNS, np.nansum(sums, axis=0))}
+
+    def percentiles(self, percentiles: Sequence[int] = PERCENTILES) -> Dict[str, Dict[str, float]]:
+        return amount_percentiles({name: self.frame[name].to_numpy(dtype="float64") for name in AMOUNT_COLUMNS},
+                                  percentiles)
+
+    def value_counts(self, column: str) -> Dict[str, int]:
+        counts = self.frame[column].value_counts(sort=True)
+        return {str(key): int(count) for key, count in counts.items() if count}
+
+    def patient_summary(self) -> pd.DataFrame:
+        "One row per patient: claim count, amount totals, distinct providers and diagnoses"
+        grouped = self.frame.groupby("patient_id", observed=True)
+        summary = grouped[list(AMOUNT_COLUMNS)].sum().round(2)
+        summary.insert(0, "claims", grouped.size())
+        summary["providers"] = grouped["provider_name"].nunique()
+        summary["diagnoses"] = grouped["primary_diagnosis"].nunique()
+        return summary
+
+    def trends(self, freq: str = "M") -> pd.DataFrame:
+        "Claim count and amount totals per time bucket (default: calendar month)"
+        dated = self.frame.dropna(subset=["claim_date"])
+        buckets = dated["claim_date"].dt.to_period(freq)
+        grouped = dated.groupby(buckets)
+        trend = grouped[list(AMOUNT_COLUMNS)].sum().round(2)
+        trend.insert(0, "claims", grouped.size())
+        trend.index = trend.index.astype(str)
+        return trend
+
+    def outliers(self, threshold: float = OUTLIER_THRESHOLD) -> pd.DataFrame:
+        """Claims whose billed/allowed ratio is far from the portfolio's typical ratio.
+
+        Uses the robust (median/MAD) z-score so a few extreme claims do not
+        mask each other; scored by the same ratio_scores() as the per-patient report.
+        """
+        ratio, scores, flagged = ratio_scores(self.frame["billed_amount"].to_numpy(dtype="float64"),
+                                              self.frame["allowed_amount"].to_numpy(dtype="float64"), threshold)
+        result = self.frame.loc[flagged, ["patient_id", "claim_id", "billed_amount", "allowed_amount"]].copy()
+        result["billed_to_allowed"] = ratio[flagged].round(3)
+        result["score"] = scores[flagged].round(2)
+        return result
+
+    def report(self) -> Dict:
+        "Structured report of the whole frame"
+        return {
+            "claims_count": int(len(self.frame)),
+            "patients_count": int(self.frame["patient_id"].nunique()),
+            **self.totals(),
+            "percentiles": self.percentiles(),
+            "providers": self.value_counts("provider_name"),
+            "diagnosis_counts": self.value_counts("primary_diagnosis"),
+            "trends": self.trends().reset_index(names="period").to_dict(orient="records"),
+            "outliers": self.outliers().to_dict(orient="records"),
+        }
+
+    def patient_reports(self) -> List[Dict]:
+        "Per-patient summaries as records"
+        return self.patient_summary().reset_index().to_dict(orient="records")
+
+
+if __name__ == "__main__":
+    from src.config import read_config
+    from src.claim_index import ClaimIndex
+    portfolio = PortfolioAnalysis.from_index(ClaimIndex.shared(read_config('DATA_PATH'), read_config('CLAIM_INDEX_PATH')))
+    print(portfolio.patient_summary())
+    print(portfolio.report())
@@ -0,0 +1,313 @@
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+import math
+import re
+import threading
+import time
+
+from src.config import read_config
+from src.retrieval import bm25_scores, expand_query, split_sentences, tokenize
+from src.utils.tracing import tracer
+
+NOTE_FIELD = "Clinical_note"
+# Rough BPE estimate: punctuation and short words are one token, longer words about one per 4 characters
+PIECE_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+class TokenCounter:
+    "Counts tokens with a Hugging Face tokenizer when `transformers` is installed, else a word-piece estimate"
+    _tokenizers = {}
+    _lock = threading.Lock()
+
+    def __init__(self, tokenizer_name: str = None):
+        self.tokenizer_name = tokenizer_name
+        self.tokenizer = self._load(tokenizer_name) if tokenizer_name else None
+
+    @classmethod
+    def _load(cls, tokenizer_name: str):
+        with cls._lock:
+            if tokenizer_name not in cls._tokenizers:
+                try:
+                    from transformers import AutoTokenizer
+                    cls._tokenizers[tokenizer_name] = AutoTokenizer.from_pretrained(tokenizer_name)
+                except Exception as e:
+                    print(f"Falling back to estimated token counts: {e}")
+                    cls._tokenizers[tokenizer_name] = None
+            return cls._tokenizers[tokenizer_name]
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self.tokenizer is not None:
+            return len(self.tokenizer.encode(text, add_special_tokens=False))
+        return sum(1 if len(piece) <= 4 else math.ceil(len(piece) / 4) for piece in PIECE_PATTERN.findall(text))
+
+    def prefix(self, text: str, max_tokens: int) -> str:
+        "Longest prefix of text, cut at a word boundary, within max_tokens"
+        kept, used = [], 0
+        for match in re.finditer(r"\S+\s*", text):
+            cost = self.count(match.group())
+            if used + cost > max_tokens:
+                break
+            kept.append(match.group())
+            used += cost
+        return "".join(kept).rstrip()
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        "text, cut to max_tokens with a trailing ellipsis if it is longer"
+        if self.count(text) <= max_tokens:
+            return text
+        return self.prefix(text, max_tokens) + " ..."
+
+
+@dataclass
+class PromptRecord:
+    "Token counts and per-stage timings (seconds) of one QA or summarization call"
+    kind: str
+    tokens: Dict[str, int] = field(default_factory=dict)
+    timings: Dict[str, float] = field(default_factory=dict)
+    chunks: int = 1
+    calls: int = 0
+    # Parts of the input cut to fit the token budget: "fields", "note"
+    truncated: List[str] = field(default_factory=list)
+    completion_tokens: int = 0
+    # Streamed calls only: seconds until the first token, and tokens per second after it
+    time_to_first_token: Optional[float] = None
+    tokens_per_second: Optional[float] = None
+
+    @property
+    def prompt_tokens(self) -> int:
+        return sum(self.tokens.values())
+
+    @contextmanager
+    def stage(self, name: str):
+        "Time a stage; also a '<kind>.<stage>' span when tracing is enabled"
+        start = time.perf_counter()
+        try:
+            with tracer.span(f"{self.kind}.{name}"):
+                yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - start
+
+
+class PromptRecorder:
+    "Aggregates PromptRecords per kind ('qa', 'summary')"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, record: PromptRecord):
+        with self._lock:
+            stats = self._stats.setdefault(record.kind, {
+                "calls": 0, "model_calls": 0, "chunks": 0, "prompt_tokens": 0, "max_prompt_tokens": 0,
+                "completion_tokens": 0, "streams": 0, "time_to_first_token": 0.0, "max_time_to_first_token": 0.0,
+                "rated_streams": 0, "mean_tokens_per_second": 0.0, "truncated": 0, "timings": {}})
+            stats["calls"] += 1
+            stats["truncated"] += bool(record.truncated)
+            stats["model_calls"] += record.calls
+            stats["chunks"] += record.chunks
+            stats["prompt_tokens"] += record.prompt_tokens
+            stats["max_prompt_tokens"] = max(stats["max_prompt_tokens"], record.prompt_tokens)
+            stats["completion_tokens"] += record.completion_tokens
+            if record.time_to_first_token is not None:
+                stats["streams"] += 1
+                stats["time_to_first_token"] += record.time_to_first_token
+                stats["max_time_to_first_token"] = max(stats["max_time_to_first_token"], record.time_to_first_token)
+            if record.tokens_per_second is not None:
+                stats["rated_streams"] += 1
+                stats["mean_tokens_per_second"] += (
+                    (record.tokens_per_second - stats["mean_tokens_per_second"]) / stats["rated_streams"])
+            for stage, seconds in record.timings.items():
+                stats["timings"][stage] = stats["timings"].get(stage, 0.0) + seconds
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {kind: {**stats, "timings": dict(stats["timings"])} for kind, stats in self._stats.items()}
+
+
+prompt_recorder = PromptRecorder()
+
+
+class PromptBuilder:
+    """Builds model inputs from claim data within a token budget.
+
+    Structured fields are flattened to one "key: value" line each, with
+    empty fields dropped and long values trimmed. Clinical notes longer
+    than the budget are split into overlapping sentence-aligned chunks.
+    """
+
+    def __init__(self, max_tokens: int = 3000, chunk_tokens: int = 700, overlap_tokens: int = 64,
+                 field_max_tokens: int = 48, counter: Optional[TokenCounter] = None):
+        self.max_tokens = max_tokens
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.field_max_tokens = field_max_tokens
+        self.counter = counter or TokenCounter()
+
+    @classmethod
+    def from_config(cls) -> "PromptBuilder":
+        return cls(
+            max_tokens=read_config('PROMPT_MAX_TOKENS', 3000),
+            chunk_tokens=read_config('SUMMARY_CHUNK_TOKENS', 700),
+            overlap_tokens=read_config('SUMMARY_CHUNK_OVERLAP_TOKENS', 64),
+            field_max_tokens=read_config('PROMPT_FIELD_MAX_TOKENS', 48),
+            counter=TokenCounter(read_config('PROMPT_TOKENIZER')),
+        )
+
+    def count(self, text: str) -> int:
+        return self.counter.count(text)
+
+    def compact_fields(self, claim_data) -> str:
+        "Structured claim fields as 'key: value' lines, nested dicts flattened, empty values dropped"
+        if not isinstance(claim_data, dict):
+            return ""
+        lines = []
+
+        def add(prefix, value):
+            if isinstance(value, dict):
+                for key, item in value.items():
+                    add(f"{prefix}.{key}", item)
+            elif value not in (None, "", [], {}):
+                lines.append(f"{prefix}: {self.counter.truncate(str(value), self.field_max_tokens)}")
+
+        for key, value in claim_data.items():
+            if key != NOTE_FIELD:
+                add(key, value)
+        return "\n".join(lines)
+
+    def trim_lines(self, text: str, max_tokens: int) -> str:
+        "Leading whole lines of text within max_tokens"
+        kept, used = [], 0
+        for line in text.splitlines():
+            cost = self.count(line)
+            if used + cost > max_tokens:
+                break
+            kept.append(line)
+            used += cost
+        return "\n".join(kept)
+
+    @staticmethod
+    def note_of(claim_data) -> str:
+        if isinstance(claim_data, dict):
+            return claim_data.get(NOTE_FIELD) or ""
+        return str(claim_data or "")
+
+    def chunk(self, text: str, chunk_tokens: int = None, overlap_tokens: int = None) -> List[str]:
+        "Sentence-aligned chunks of at most chunk_tokens, each repeating ~overlap_tokens of the previous one"
+        chunk_tokens = chunk_tokens or self.chunk_tokens
+        overlap_tokens = self.overlap_tokens if overlap_tokens is None else overlap_tokens
+        pieces = []
+        for start, end in split_sentences(text):
+            sentence = text[start:end].strip()
+            cost = self.count(sentence)
+            while cost > chunk_tokens:
+                head = self.counter.prefix(sentence, chunk_tokens)
+                if not head:
+                    break
+                pieces.append((head, self.count(head)))
+                sentence = sentence[len(head):].strip()
+                cost = self.count(sentence)
+            if sentence:
+                pieces.append((sentence, cost))
+        chunks, current, used = [], [], 0
+        for sentence, cost in pieces:
+            if current and used + cost > chunk_tokens:
+                chunks.append("\n".join(piece for piece, _ in current))
+                overlap, overlap_used = [], 0
+                for piece, piece_cost in reversed(current):
+                    if overlap_used + piece_cost > overlap_tokens or overlap_used + piece_cost + cost > chunk_tokens:
+                        break
+                    overlap.insert(0, (piece, piece_cost))
+                    overlap_used += piece_cost
+                current, used = overlap, overlap_used
+            current.append((sentence, cost))
+            used += cost
+        if current:
+            chunks.append("\n".join(piece for piece, _ in current))
+        return chunks
+
+    def select_chunks(self, question: str, chunks: List[str], budget: int, keep_best: bool = False) -> List[str]:
+        "Chunks most relevant to the question (BM25) that fit in budget, in their original order"
+        scores = bm25_scores(expand_query(question), [tokenize(chunk) for chunk in chunks])
+        selected, used = set(), 0
+        for index in sorted(range(len(chunks)), key=lambda index: scores[index], reverse=True):
+            cost = self.count(chunks[index])
+            # keep_best: the top-ranked chunk is kept even when it alone exceeds budget
+            if used + cost <= budget or (keep_best and not selected):
+                selected.add(index)
+                used += cost
+        return [chunks[index] for index in sorted(selected)]
+
+    def qa_messages(self, system_prompt: str, claim_data, question: str, record: PromptRecord = None) -> List[Dict]:
+        "Chat messages for a question about a claim, with the note narrowed to fit max_tokens"
+        fields = self.compact_fields(claim_data)
+        note = self.note_of(claim_data)
+        header = "Based on the following clinical note, please answer my question.\n\n"
+        fixed = self.count(system_prompt) + self.count(header) + self.count(question) + 16
+        truncated = []
+        # Leave room for at least one note chunk: trim the fields block (whole lines) first
+        note_reserve = min(self.count(note), self.chunk_tokens)
+        if fixed + self.count(fields) + note_reserve > self.max_tokens:
+            fields = self.trim_lines(fields, max(self.max_tokens - fixed - note_reserve, 0))
+            truncated.append("fields")
+        note_budget = max(self.max_tokens - fixed - self.count(fields), 0)
+        chunks = 1
+        if self.count(note) > note_budget:
+            note_chunks = self.chunk(note)
+            chunks = len(note_chunks)
+            note = "\n...\n".join(self.select_chunks(question, note_chunks, note_budget, keep_best=True))
+            truncated.append("note")
+        details = f"{fields}\nClinical Note:\n{note}" if fields else note
+        user_query = (
+            f"{header}"
+            f"--- CLAIM DETAILS ---\n"
+            f"{details}\n\n"
+            f"--- QUESTION ---\n"
+            f"{question}"
+        )
+        if record is not None:
+            record.tokens.update(system=self.count(system_prompt), fields=self.count(fields),
+                                 note=self.count(note), question=self.count(question))
+            record.chunks = chunks
+            record.truncated = truncated
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_query}
+        ]
+
+    def summary_inputs(self, claim_data, record: PromptRecord = None) -> List[str]:
+        "Texts for the map step: one input if it fits chunk_tokens, else overlapping chunks"
+        fields = self.compact_fields(claim_data)
+        note = self.note_of(claim_data)
+        text = f"{fields}\nClinical Note:\n{note}" if fields else note
+        inputs = [text] if self.count(text) <= self.chunk_tokens else self.chunk(text)
+        if record is not None:
+            record.tokens.update(fields=self.count(fields), note=self.count(note))
+            record.chunks = len(inputs)
+        return inputs
+
+    def reduce_groups(self, summaries: List[str]) -> List[str]:
+        "Join partial summaries into as few inputs of at most chunk_tokens as possible"
+        groups, current, used = [], [], 0
+        for summary in summaries:
+            cost = self.count(summary)
+            if current and used + cost > self.chunk_tokens:
+                groups.append("\n".join(current))
+                current, used = [], 0
+            current.append(summary)
+            used += cost
+        if current:
+            groups.append("\n".join(current))
+        return groups
+
+
+if __name__ == "__main__":
+    from src.data_ingestion import DataIngestion
+    claim_data = DataIngestion(patient_id="PA-12345").ingest_claim_data(claim_path='CLM153910000')
+    builder = PromptBuilder.from_config()
+    record = PromptRecord("qa")
+    builder.qa_messages(read_config('SYSTEM_PROMPT_ABSTRACIVE_QA'), claim_data, "Who is the doctor?", record)
+    print(record)
+    print(builder.chunk(builder.note_of(claim_data), chunk_tokens=60, overlap_tokens=15))
@@ -0,0 +1,160 @@
+from src.config import read_config
+from src.clients import BACKEND_QUESTION_ANSWERING, get_client_provider
+from huggingface_hub import QuestionAnsweringOutputElement
+import asyncio
+import re
+import threading
+
+# (question keyword groups, structured fields, note patterns) in priority order. A rule applies
+# when every word of one keyword group is in the question. The first of its fields present as a
+# "field: value" line of the context wins (process_data() flattens nested fields to dotted keys);
+# otherwise the first note pattern found in the free text does.
+RULES = (
+    ((("icd",), ("diagnosis", "code")), ("icd_code",),
+     (r"\b(?i:ICD(?:-10)?(?: code)?|diagnosis code|coded as)\b[^A-Z\n]{0,20}([A-TV-Z]\d{2}(?:\.\w{1,4})?)\b",
+      r"\b([A-TV-Z]\d{2}\.\w{1,4})\b")),
+    ((("cpt",), ("procedure", "code")), ("cpt_code",),
+     (r"\b(?i:CPT|procedure code|procedure)\b[^\d\n]{0,20}(\d{5})\b",)),
+    ((("insurance",), ("paid",)), ("financials.insurance_paid",),
+     (r"\b(?i:(?:insurance|insurer|plan|payer) (?:paid|covered|pays|reimbursed))\D{0,20}\$\s?(\d[\d,]*(?:\.\d+)?)",)),
+    ((("copay",), ("co", "pay")), ("financials.copay",),
+     (r"\b(?i:co-?pay(?:ment)?)\b\D{0,20}\$\s?(\d[\d,]*(?:\.\d+)?)",)),
+    ((("allowed",),), ("financials.allowed_amount",), ()),
+    ((("billed",), ("bill",), ("charges",), ("charged",), ("cost",)), ("financials.billed_amount",),
+     (r"\b(?i:billed|charges?|charged|total cost)\b\D{0,40}\$\s?(\d[\d,]*(?:\.\d+)?)",
+      r"\b(?i:billed|charges?|charged|total cost)\b\D{0,40}?(\d[\d,]*(?:\.\d+)?) (?i:dollars|USD)\b")),
+    ((("policy",),), ("patient_info.policy_number", "policy_number"),
+     (r"\b(?i:policy(?: number| no\.?)?)\b[:#\s]{1,3}([A-Z0-9][\w-]{3,})",)),
+    ((("medication",), ("drug",), ("prescribed",), ("medicine",)), (),
+     (r"\b(?i:prescribed|started(?: on)?|medication:?|given|recommended)\s+(?i:a new medication,\s*)?"
+      r"([A-Z][a-z]+(?:\s\d+\s?mg)?)",
+      r"\bRx:\s*([A-Za-z][a-z]+(?:\s\d+\s?mg)?)")),
+    ((("doctor",), ("physician",), ("provider",), ("treated",), ("seen",)), ("provider_name",),
+     (r"\b(Dr\.? [A-Z][a-z]+(?: [A-Z][a-z]+)?(?: \([^)\n]*\))?)",
+      r"\b([A-Z][a-z]+ [A-Z][a-z]+,? (?:MD|DO|NP|PA-C))\b")),
+    ((("diagnosis",), ("diagnosed",), ("condition",)), ("primary_diagnosis",),
+     (r"\b(?i:diagnosed with|diagnosis(?: of|:)|impression:|assessment:)\s+([a-zA-Z][\w -]{2,40}?)(?=[.,;\n]|$)",)),
+    ((("procedure",), ("test",)), ("procedure_description",), ()),
+    ((("date",), ("when",)), ("claim_date",), (r"\b(\d{4}-\d{2}-\d{2})\b", r"\b(\d{1,2}/\d{1,2}/\d{4})\b")),
+    ((("patient", "name"), ("patient",)), (),
+     (r"\bPatient(?: name)?:? ([A-Z][a-z]+ [A-Z][a-z]+)",)),
+)
+WORD_PATTERN = re.compile(r"[a-z]+")
+
+
+class QABackend:
+    "Answers a question from a context string with an extractive span"
+    name = "base"
+
+    def answer(self, question: str, context: str):
+        raise NotImplementedError
+
+    async def aanswer(self, question: str, context: str):
+        return await asyncio.to_thread(self.answer, question, context)
+
+
+class RemoteQABackend(QABackend):
+    "The hosted question_answering endpoint (EXTRACTIVE_QA_MODEL_NAME)"
+    name = "remote"
+
+    def __init__(self, client_provider=None, model_name: str = None):
+        self.client_provider = client_provider or get_client_provider()
+        self.model_name = model_name or read_config('EXTRACTIVE_QA_MODEL_NAME')
+
+    def answer(self, question: str, context: str):
+        return self.client_provider.call(
+            BACKEND_QUESTION_ANSWERING,
+            "question_answering",
+            question=question,
+            context=context,
+            model=self.model_name,
+        )
+
+    async def aanswer(self, question: str, context: str):
+        return await self.client_provider.acall(
+            BACKEND_QUESTION_ANSWERING,
+            "question_answering",
+            question=question,
+            context=context,
+            model=self.model_name,
+        )
+
+
+class RuleBasedQABackend(QABackend):
+    "Regex answers for structured facts (provider, ICD/CPT codes, amounts, dates); works offline in microseconds"
+    name = "rules"
+
+    def __init__(self, rules=RULES):
+        self.rules = [
+            (keywords,
+             [re.compile(rf"^{re.escape(field)}: (.+)$", re.MULTILINE) for field in fields]
+             + [re.compile(pattern) for pattern in patterns])
+            for keywords, fields, patterns in rules]
+
+    def answer(self, question: str, context: str):
+        words = set(WORD_PATTERN.findall(question.lower()))
+        for keyword_groups, patterns in self.rules:
+            if not any(all(word in words for word in group) for group in keyword_groups):
+                continue
+            for pattern in patterns:
+                match = pattern.search(context)
+                if match:
+                    start, end = match.span(1)
+                    return QuestionAnsweringOutputElement(
+                        answer=match.group(1).strip(), score=1.0, start=start, end=end)
+        return None
+
+
+class LocalModelQABackend(QABackend):
+    """Small extractive model (LOCAL_QA_MODEL) run on CPU with transformers.
+
+    With LOCAL_QA_ONNX set, the model is exported to ONNX and run through
+    optimum/onnxruntime instead of PyTorch.
+    """
+    name = "local"
+    _pipelines = {}
+    _lock = threading.Lock()
+
+    def __init__(self, model_name: str = None, use_onnx: bool = None):
+        self.model_name = model_name or read_config('LOCAL_QA_MODEL')
+        self.use_onnx = read_config('LOCAL_QA_ONNX', False) if use_onnx is None else use_onnx
+        key = (self.model_name, self.use_onnx)
+        with self._lock:
+            if key not in self._pipelines:
+                self._pipelines[key] = self._load()
+            self._pipeline = self._pipelines[key]
+
+    def _load(self):
+        try:
+            from transformers import pipeline
+        except ImportError as e:
+            raise ImportError("The local QA backend needs `transformers` (and `torch` or `optimum[onnxruntime]`).") from e
+        if not self.use_onnx:
+            return pipeline("question-answering", model=self.model_name, device=-1)
+        from optimum.onnxruntime import ORTModelForQuestionAnswering
+        from transformers import AutoTokenizer
+        model = ORTModelForQuestionAnswering.from_pretrained(self.model_name, export=True)
+        tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        return pipeline("question-answering", model=model, tokenizer=tokenizer)
+
+    def answer(self, question: str, context: str):
+        result = self._pipeline(question=question, context=context)
+        return QuestionAnsweringOutputElement(
+            answer=result["answer"], score=float(result["score"]), start=result["start"], end=result["end"])
+
+
+BACKENDS = {
+    RemoteQABackend.name: RemoteQABackend,
+    RuleBasedQABackend.name: RuleBasedQABackend,
+    LocalModelQABackend.name: LocalModelQABackend,
+}
+
+
+def create_backend(name: str = None, client_provider=None) -> QABackend:
+    "Build the extractive QA backend called `name` (default: EXTRACTIVE_QA_BACKEND)"
+    name = name or read_config('EXTRACTIVE_QA_BACKEND', RemoteQABackend.name)
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown extractive QA backend {name}. Available: {', '.join(BACKENDS)}")
+    if name == RemoteQABackend.name:
+        return RemoteQABackend(client_provider=client_provider)
+    return BACKENDS[name]()
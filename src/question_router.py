@@ -0,0 +1,151 @@
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple
+import re
+import threading
+
+# Claim field (dotted path into claim_details.json) -> phrases that ask for it
+FIELD_SYNONYMS = {
+    "provider_name": ("doctor", "physician", "provider", "treated", "seen by", "treating doctor"),
+    "icd_code": ("icd", "icd code", "diagnosis code", "icd 10"),
+    "cpt_code": ("cpt", "cpt code", "procedure code"),
+    "primary_diagnosis": ("diagnosis", "condition", "diagnosed", "primary diagnosis"),
+    "procedure_description": ("procedure", "test performed", "procedure performed"),
+    "claim_date": ("claim date", "visit date", "date of visit", "date of service", "when seen", "date"),
+    "claim_id": ("claim id", "claim number"),
+    "financials.billed_amount": ("billed", "billed amount", "charged", "charges", "bill", "total cost"),
+    "financials.allowed_amount": ("allowed", "allowed amount"),
+    "financials.copay": ("copay", "co pay", "copayment"),
+    "financials.insurance_paid": ("insurance paid", "insurance pay", "paid by insurance", "insurer pay", "insurance"),
+    "patient_info.patient_id": ("patient id",),
+    "patient_info.first_name": ("first name",),
+    "patient_info.last_name": ("last name", "surname"),
+    "patient_info.date_of_birth": ("date of birth", "dob", "born", "birthday"),
+    "patient_info.policy_number": ("policy", "policy number"),
+    "patient_name": ("patient", "patient name", "name of patient"),
+}
+# Questions that need reasoning rather than a field lookup always go to the model
+FALLTHROUGH_WORDS = {"why", "explain", "summarize", "summary", "should", "compare", "reason", "recommend", "and"}
+# Yes/no questions ("Is the doctor a cardiologist?") ask to judge a field, not to read it
+YES_NO_STARTS = {"is", "was", "were", "are", "did", "does", "do", "can", "could", "has", "have", "had", "will"}
+STOP_WORDS = {
+    "a", "an", "the", "is", "was", "were", "are", "of", "for", "to", "in", "on", "what", "who", "which",
+    "how", "much", "did", "does", "do", "this", "that", "by", "be", "it", "as", "at", "me", "tell", "please",
+    "claim's", "patient's",
+}
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def _tokens(text: str) -> Tuple[str, ...]:
+    return tuple(WORD_PATTERN.findall(text.lower()))
+
+
+@dataclass(frozen=True)
+class RoutedAnswer:
+    "An answer read straight from a claim field, with where it came from"
+    answer: Any
+    field: str
+    score: float
+    matched: str
+
+    @property
+    def provenance(self) -> str:
+        return f"claim_details.json:{self.field}"
+
+    def reasoning(self) -> str:
+        return (f"Taken directly from the '{self.field}' field of the claim details "
+                f"(matched '{self.matched}' in the question): '{self.field}': {self.answer!r}.")
+
+
+class QuestionRouter:
+    """Answers factual questions from structured claim fields without a model call.
+
+    Questions are matched against a precomputed keyword index of field
+    synonyms. The longest fully matched phrase wins and must explain every
+    content word of the question; ties between different fields, partial
+    matches, yes/no and reasoning questions fall through to the model.
+    """
+
+    def __init__(self, field_synonyms: Dict[str, Tuple[str, ...]] = None):
+        field_synonyms = field_synonyms or FIELD_SYNONYMS
+        # phrase tokens -> field, longest phrases first
+        self.index = sorted(
+            ((_tokens(phrase), field, phrase) for field, phrases in field_synonyms.items() for phrase in phrases),
+            key=lambda entry: len(entry[0]), reverse=True)
+        self._lock = threading.Lock()
+        self.fast_path = 0
+        self.fallthrough = 0
+        self.match_field = lru_cache(maxsize=4096)(self._match_field)
+
+    def _match_field(self, question: str) -> Optional[Tuple[str, str]]:
+        "(field, matched phrase) for a question, or None if it is not a confident single-field lookup"
+        words = _tokens(question)
+        if not words or words[0] in YES_NO_STARTS or FALLTHROUGH_WORDS.intersection(words):
+            return None
+        content = [word for word in words if word not in STOP_WORDS]
+        best_length, matches = 0, {}
+        for phrase_tokens, field, phrase in self.index:
+            if len(phrase_tokens) < best_length:
+                break
+            if all(token in words for token in phrase_tokens):
+                best_length = len(phrase_tokens)
+                matches.setdefault(field, phrase)
+        if len(matches) != 1:
+            return None
+        field, phrase = next(iter(matches.items()))
+        # Every content word of the question must be explained by the matched phrase, so
+        # "What is the patient age?" does not read patient_name
+        phrase_tokens = _tokens(phrase)
+        if any(word not in phrase_tokens for word in content):
+            return None
+        return field, phrase
+
+    @staticmethod
+    def lookup(claim: Dict, field: str):
+        if field == "patient_name":
+            patient = claim.get("patient_info") or {}
+            if patient.get("first_name") or patient.get("last_name"):
+                return f"{patient.get('first_name', '')} {patient.get('last_name', '')}".strip()
+            return None
+        value = claim
+        for key in field.split("."):
+            if not isinstance(value, dict) or key not in value:
+                return None
+            value = value[key]
+        return value
+
+    def route(self, question: str, claim: Dict) -> Optional[RoutedAnswer]:
+        "Answer from claim fields, or None to let the model handle the question"
+        routed = None
+        if question and isinstance(claim, dict):
+            match = self.match_field(question)
+            if match is not None:
+                value = self.lookup(claim, match[0])
+                if value is not None:
+                    routed = RoutedAnswer(answer=value, field=match[0], score=1.0, matched=match[1])
+        with self._lock:
+            if routed is None:
+                self.fallthrough += 1
+            else:
+                self.fast_path += 1
+        return routed
+
+    def stats(self) -> dict:
+        total = self.fast_path + self.fallthrough
+        return {
+            "fast_path": self.fast_path,
+            "fallthrough": self.fallthrough,
+            "fast_path_ratio": self.fast_path / total if total else 0.0,
+        }
+
+
+question_router = QuestionRouter()
+
+
+if __name__ == "__main__":
+    from src.data_ingestion import DataIngestion
+    claim_data = DataIngestion(patient_id="PA-12345").ingest_claim_data(claim_path='CLM153910000')
+    for question in ("Who is the doctor?", "What is the ICD code?", "How much did insurance pay?",
+                     "Why was the MRI ordered?"):
+        print(question, question_router.route(question, claim_data))
+    print(question_router.stats())
@@ -0,0 +1,188 @@
+from collections import defaultdict
+from typing import Callable, Optional
+import asyncio
+import hashlib
+import importlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    backend TEXT NOT NULL,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    latency REAL NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed);
+"""
+
+
+# Response classes rebuilt on read; anything else is returned as plain JSON
+TRUSTED_TYPE_PREFIX = "huggingface_hub."
+
+
+def make_key(backend: str, method: str, kwargs: dict, endpoint_url: str = None, provider: str = None) -> str:
+    """Content hash of everything that determines a model response.
+
+    kwargs should hold the resolved model; endpoint_url and provider keep
+    answers of a stub server or another provider apart from production ones.
+    """
+    payload = json.dumps({"backend": backend, "method": method, "kwargs": kwargs,
+                          "endpoint_url": endpoint_url, "provider": provider}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def encode_value(value) -> bytes:
+    "JSON form of a model response; huggingface_hub output types (dict subclasses) keep their class name"
+    sample = value[0] if isinstance(value, list) and value else value
+    cls = type(sample)
+    type_name = f"{cls.__module__}.{cls.__qualname__}" if cls.__module__.startswith(TRUSTED_TYPE_PREFIX) else None
+    return json.dumps({"type": type_name, "value": value}).encode()
+
+
+def decode_value(blob: bytes):
+    "Inverse of encode_value(); only huggingface_hub classes are imported, through their parse_obj()"
+    data = json.loads(blob)
+    type_name = data.get("type")
+    if type_name and type_name.startswith(TRUSTED_TYPE_PREFIX):
+        module, _, name = type_name.rpartition(".")
+        return getattr(importlib.import_module(module), name).parse_obj(data["value"])
+    return data["value"]
+
+
+class ResultCache:
+    """Persistent, content-addressed cache of model responses, stored as JSON.
+
+    Entries are evicted by age (max_age_seconds) and, least recently used
+    first, once the stored values exceed max_bytes. Concurrent requests for
+    the same key wait for the first one instead of calling the model again.
+    """
+
+    def __init__(self, path: str = None, max_bytes: int = 256 * 1024 * 1024, max_age_seconds: float = 7 * 24 * 3600):
+        self.path = path or ":memory:"
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.RLock()
+        self._in_flight = {}
+        self._stats = defaultdict(lambda: {"hits": 0, "misses": 0, "latency_saved": 0.0})
+
+    def get(self, key: str, backend: str = None):
+        "Return (True, value) for a fresh entry, else (False, None)"
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, latency, created FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[2] > self.max_age_seconds:
+                return False, None
+            try:
+                value = decode_value(row[0])
+            except (ValueError, TypeError, ImportError, AttributeError):
+                # Unreadable, e.g. written by an older version in another format
+                return False, None
+            with self._conn:
+                self._conn.execute("UPDATE results SET accessed = ? WHERE key = ?", (now, key))
+            if backend is not None:
+                stats = self._stats[backend]
+                stats["hits"] += 1
+                stats["latency_saved"] += row[1]
+        return True, value
+
+    def put(self, key: str, backend: str, value, latency: float):
+        try:
+            blob = encode_value(value)
+        except (TypeError, ValueError) as e:
+            # Not JSON serializable: served uncached
+            print(e)
+            return
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, backend, value, size, latency, created, accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", (key, backend, blob, len(blob), latency, now, now))
+            self._evict(now)
+
+    def _evict(self, now: float):
+        self._conn.execute("DELETE FROM results WHERE created < ?", (now - self.max_age_seconds,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute("SELECT key, size FROM results ORDER BY accessed").fetchall():
+            self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def get_or_compute(self, backend: str, key: str, compute: Callable):
+        "Return the cached value or compute it once, even under concurrent callers"
+        hit, value = self.get(key, backend)
+        if hit:
+            return value
+        with self._lock:
+            waiter = self._in_flight.get(key)
+            owner = waiter is None
+            if owner:
+                waiter = self._in_flight[key] = threading.Event()
+        if not owner:
+            if isinstance(waiter, threading.Event):
+                waiter.wait()
+                return self.get_or_compute(backend, key, compute)
+            # The owner runs on an event loop we cannot block on; compute independently.
+            return compute()
+        try:
+            self._stats[backend]["misses"] += 1
+            start = time.perf_counter()
+            value = compute()
+            self.put(key, backend, value, time.perf_counter() - start)
+            return value
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            waiter.set()
+
+    async def aget_or_compute(self, backend: str, key: str, compute: Callable):
+        "Async version of get_or_compute(); compute is a coroutine function"
+        hit, value = self.get(key, backend)
+        if hit:
+            return value
+        with self._lock:
+            waiter = self._in_flight.get(key)
+            owner = waiter is None
+            if owner:
+                waiter = self._in_flight[key] = asyncio.Event()
+        if not owner:
+            if isinstance(waiter, asyncio.Event):
+                await waiter.wait()
+            else:
+                await asyncio.to_thread(waiter.wait)
+            return await self.aget_or_compute(backend, key, compute)
+        try:
+            self._stats[backend]["misses"] += 1
+            start = time.perf_counter()
+            value = await compute()
+            self.put(key, backend, value, time.perf_counter() - start)
+            return value
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            waiter.set()
+
+    def stats(self, backend: Optional[str] = None) -> dict:
+        "Hit/miss counts and model latency saved (seconds) per backend"
+        with self._lock:
+            if backend is not None:
+                return dict(self._stats[backend])
+            return {name: dict(stats) for name, stats in self._stats.items()}
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM results")
@@ -0,0 +1,98 @@
+from collections import Counter
+from typing import List, Tuple
+import math
+import re
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?")
+# Sentence ends: newlines, or terminal punctuation followed by whitespace (but not after titles like "Dr.")
+SENTENCE_BOUNDARY = re.compile(r"\n+|(?<![A-Z][a-z]\.)(?<!\b[A-Z]\.)(?<=[.!?])\s+")
+STOP_WORDS = {
+    "a", "an", "the", "is", "was", "were", "are", "of", "for", "to", "in", "on", "and", "or", "what", "who",
+    "which", "how", "much", "many", "did", "does", "do", "this", "that", "with", "by", "be", "it", "as", "at",
+}
+# Claim vocabulary a question may use for terms that appear differently in the claim text
+QUERY_EXPANSIONS = {
+    "doctor": ["dr", "provider", "physician"],
+    "physician": ["dr", "provider"],
+    "provider": ["dr"],
+    "icd": ["diagnosis", "code"],
+    "diagnosis": ["icd", "diagnosis"],
+    "condition": ["diagnosis"],
+    "cpt": ["procedure"],
+    "procedure": ["cpt"],
+    "medication": ["medication", "drug"],
+    "drug": ["medication"],
+    "cost": ["billed", "amount", "charges"],
+    "charged": ["billed", "charges"],
+    "billed": ["charges"],
+    "insurance": ["insurance", "paid"],
+    "date": ["seen", "claim"],
+    "when": ["date", "seen"],
+    "patient": ["patient", "name"],
+    "policy": ["policy", "number"],
+}
+
+
+def tokenize(text: str) -> List[str]:
+    "Lower-cased word tokens without stop words"
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOP_WORDS]
+
+
+def expand_query(question: str) -> List[str]:
+    "Question tokens plus claim-vocabulary synonyms"
+    tokens = tokenize(question)
+    return tokens + [synonym for token in tokens for synonym in QUERY_EXPANSIONS.get(token, ())]
+
+
+def split_sentences(text: str) -> List[Tuple[int, int]]:
+    "Character spans of sentences and lines in text"
+    spans = []
+    start = 0
+    for match in SENTENCE_BOUNDARY.finditer(text):
+        if match.start() > start:
+            spans.append((start, match.start()))
+        start = match.end()
+    if start < len(text):
+        spans.append((start, len(text)))
+    return spans
+
+
+def bm25_scores(query_tokens: List[str], documents: List[List[str]], k1: float = 1.5, b: float = 0.75) -> List[float]:
+    "Okapi BM25 score of every tokenized document for the query"
+    if not documents:
+        return []
+    average_length = sum(len(document) for document in documents) / len(documents) or 1.0
+    document_frequency = Counter(token for document in documents for token in set(document))
+    scores = []
+    for document in documents:
+        counts = Counter(document)
+        score = 0.0
+        for token in query_tokens:
+            frequency = counts.get(token)
+            if not frequency:
+                continue
+            idf = math.log(1 + (len(documents) - document_frequency[token] + 0.5) / (document_frequency[token] + 0.5))
+            score += idf * frequency * (k1 + 1) / (frequency + k1 * (1 - b + b * len(document) / average_length))
+        scores.append(score)
+    return scores
+
+
+def top_k_spans(question: str, text: str, k: int = 3, window: int = 0) -> str:
+    """Keep only the k sentences of text most relevant to the question.
+
+    Each selected sentence brings `window` neighbours on both sides. The
+    result keeps the original sentence order so spans still read naturally.
+    """
+    spans = split_sentences(text)
+    if len(spans) <= k:
+        return text
+    query_tokens = expand_query(question)
+    scores = bm25_scores(query_tokens, [tokenize(text[start:end]) for start, end in spans])
+    ranked = [index for index in sorted(range(len(spans)), key=lambda index: scores[index], reverse=True)[:k]
+              if scores[index] > 0]
+    if not ranked:
+        return text
+    selected = set()
+    for index in ranked:
+        selected.update(range(max(0, index - window), min(len(spans), index + window + 1)))
+    return "\n".join(text[spans[index][0]:spans[index][1]].strip() for index in sorted(selected))
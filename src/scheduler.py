@@ -0,0 +1,299 @@
+from src.config import read_config
+from src.utils.tracing import tracer
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BULK = "bulk"
+# Highest priority first
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_BULK)
+# Status codes meaning the model is overloaded: the concurrency limit is halved
+OVERLOAD_STATUS_CODES = {429, 502, 503, 504}
+# Recent waits and latencies kept per model for the percentiles in stats()
+WINDOW = 1024
+
+
+def status_code(error: Exception) -> Optional[int]:
+    response = getattr(error, 'response', None)
+    return getattr(response, 'status_code', None)
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    "Seconds asked for by the Retry-After header of a failed call (delay in seconds or an HTTP date)"
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    value = headers.get('Retry-After') if headers is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def percentile(values, q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 4)
+
+
+class TokenBucket:
+    "Allows `rate` calls per second on average and bursts of up to `burst`; rate None is unlimited"
+
+    def __init__(self, rate: float = None, burst: float = 1.0):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        if self.rate:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        "Seconds until a call may start"
+        if not self.rate:
+            return 0.0
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        if self.rate:
+            self._refill(now)
+            self.tokens -= 1
+
+
+class Ticket:
+    "A call waiting for, then holding, a slot of a model lane"
+
+    def __init__(self, lane: "ModelLane", priority: str, seq: int):
+        self.lane = lane
+        self.priority = priority
+        self.key = (PRIORITIES.index(priority) if priority in PRIORITIES else len(PRIORITIES), seq)
+        self.enqueued = time.monotonic()
+        self.started = None
+
+    def __lt__(self, other: "Ticket") -> bool:
+        return self.key < other.key
+
+
+class ModelLane:
+    """Scheduling state of one model.
+
+    Calls start in priority order (then arrival order) once the token bucket
+    has a token, fewer than `limit` calls are in flight and no Retry-After
+    pause is active. The limit grows by about one per `limit` calls that
+    finish within the target latency and shrinks when calls are slow or the
+    model reports overload (AIMD, as in TCP congestion control).
+    """
+
+    def __init__(self, name: str, rate: float = None, burst: float = 1.0, initial_limit: float = 4,
+                 max_limit: float = 32, target_latency: float = 20.0):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.limit = float(min(initial_limit, max_limit))
+        self.max_limit = max_limit
+        self.target_latency = target_latency
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.decreased_at = 0.0
+        self.waiters = []
+        self.waits = deque(maxlen=WINDOW)
+        self.latencies = deque(maxlen=WINDOW)
+        self.error_rate = 0.0
+        self.completed = 0
+        self.errors = 0
+        self.throttled = 0
+
+    def start_delay(self, ticket: Ticket, now: float) -> Optional[float]:
+        "0 when ticket may start now, seconds to wait, or None to wait for another call to finish or start"
+        if self.waiters[0] is not ticket or self.in_flight >= int(self.limit):
+            return None
+        return max(self.blocked_until - now, self.bucket.delay(now), 0.0)
+
+    def start(self, ticket: Ticket, now: float):
+        heapq.heappop(self.waiters)
+        self.bucket.take(now)
+        self.in_flight += 1
+        ticket.started = now
+        self.waits.append(now - ticket.enqueued)
+
+    def _decrease(self, ticket: Ticket, factor: float, now: float):
+        # At most once per round of calls: only calls started after the last decrease count
+        if ticket.started >= self.decreased_at:
+            self.limit = max(1.0, self.limit * factor)
+            self.decreased_at = now
+
+    def finish(self, ticket: Ticket, latency: float, error: BaseException = None, pause: float = None):
+        now = time.monotonic()
+        self.in_flight -= 1
+        if error is not None and not isinstance(error, Exception):
+            # Cancelled or interrupted: says nothing about the model
+            return
+        self.error_rate += 0.1 * ((error is not None) - self.error_rate)
+        if pause:
+            self.blocked_until = max(self.blocked_until, now + pause)
+        if error is None:
+            self.completed += 1
+            self.latencies.append(latency)
+            if latency <= self.target_latency:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            else:
+                self._decrease(ticket, 0.9, now)
+        elif status_code(error) in OVERLOAD_STATUS_CODES or pause:
+            self.throttled += 1
+            self._decrease(ticket, 0.5, now)
+        else:
+            self.errors += 1
+
+    def stats(self) -> Dict:
+        queued = {priority: 0 for priority in PRIORITIES}
+        for ticket in self.waiters:
+            queued[ticket.priority] = queued.get(ticket.priority, 0) + 1
+        return {
+            "queue_depth": queued,
+            "in_flight": self.in_flight,
+            "concurrency_limit": round(self.limit, 2),
+            "rate": self.bucket.rate,
+            "paused_seconds": round(max(0.0, self.blocked_until - time.monotonic()), 3),
+            "completed": self.completed,
+            "throttled": self.throttled,
+            "errors": self.errors,
+            "error_rate": round(self.error_rate, 4),
+            "wait_p50": percentile(self.waits, 0.5),
+            "wait_p95": percentile(self.waits, 0.95),
+            "max_wait": round(max(self.waits), 4) if self.waits else None,
+            "latency_p50": percentile(self.latencies, 0.5),
+        }
+
+
+class RequestScheduler:
+    """Admission control for remote model calls, one ModelLane per model.
+
+    ClientProvider acquires a ticket before every attempt of a call and
+    releases it with the outcome, so per-model rate limits, priorities,
+    adaptive concurrency and Retry-After pauses apply to every wrapper.
+    rate_limits maps a model name (or "default") to {"rate": calls per
+    second, "burst": calls}.
+    """
+
+    def __init__(self, rate_limits: Dict = None, initial_concurrency: int = 4, max_concurrency: int = 32,
+                 target_latency: float = 20.0):
+        self.rate_limits = dict(rate_limits or {})
+        self.initial_concurrency = initial_concurrency
+        self.max_concurrency = max_concurrency
+        self.target_latency = target_latency
+        self.lanes: Dict[str, ModelLane] = {}
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        self._async_waiters = []
+        self._seq = itertools.count()
+
+    @classmethod
+    def from_config(cls) -> "RequestScheduler":
+        return cls(
+            rate_limits=read_config('SCHEDULER_RATE_LIMITS', {}) or {},
+            initial_concurrency=read_config('SCHEDULER_INITIAL_CONCURRENCY', 4),
+            max_concurrency=read_config('SCHEDULER_MAX_CONCURRENCY', 32),
+            target_latency=read_config('SCHEDULER_TARGET_LATENCY_SECONDS', 20.0),
+        )
+
+    def lane(self, model: str) -> ModelLane:
+        "Return the lane of a model, creating it with its configured rate limit (call with the lock held)"
+        lane = self.lanes.get(model)
+        if lane is None:
+            limits = self.rate_limits.get(model) or self.rate_limits.get("default") or {}
+            lane = self.lanes[model] = ModelLane(model, rate=limits.get("rate"), burst=limits.get("burst", 1.0),
+                                                 initial_limit=self.initial_concurrency,
+                                                 max_limit=self.max_concurrency,
+                                                 target_latency=self.target_latency)
+        return lane
+
+    def _enqueue(self, model: str, priority: str) -> Ticket:
+        lane = self.lane(model)
+        ticket = Ticket(lane, priority, next(self._seq))
+        heapq.heappush(lane.waiters, ticket)
+        return ticket
+
+    def _notify(self):
+        "Wake every waiter to re-check its lane (call with the lock held)"
+        self._condition.notify_all()
+        for loop, waiter in self._async_waiters:
+            loop.call_soon_threadsafe(_wake, waiter)
+        self._async_waiters = []
+
+    def acquire(self, model: str, priority: str = PRIORITY_INTERACTIVE) -> Ticket:
+        "Block until a call to model may start"
+        with tracer.span("scheduler.wait", model=model, priority=priority), self._condition:
+            ticket = self._enqueue(model, priority)
+            try:
+                while True:
+                    now = time.monotonic()
+                    delay = ticket.lane.start_delay(ticket, now)
+                    if delay == 0:
+                        ticket.lane.start(ticket, now)
+                        self._notify()
+                        return ticket
+                    self._condition.wait(timeout=delay)
+            except BaseException:
+                self._abandon(ticket)
+                raise
+
+    async def aacquire(self, model: str, priority: str = PRIORITY_INTERACTIVE) -> Ticket:
+        "Async counterpart of acquire(); waits without blocking the event loop"
+        loop = asyncio.get_running_loop()
+        with tracer.span("scheduler.wait", model=model, priority=priority):
+            with self._lock:
+                ticket = self._enqueue(model, priority)
+            try:
+                while True:
+                    with self._lock:
+                        now = time.monotonic()
+                        delay = ticket.lane.start_delay(ticket, now)
+                        if delay == 0:
+                            ticket.lane.start(ticket, now)
+                            self._notify()
+                            return ticket
+                        waiter = loop.create_future()
+                        self._async_waiters.append((loop, waiter))
+                    try:
+                        await asyncio.wait_for(waiter, timeout=delay)
+                    except asyncio.TimeoutError:
+                        pass
+            except BaseException:
+                with self._lock:
+                    self._abandon(ticket)
+                raise
+
+    def _abandon(self, ticket: Ticket):
+        "Give up the place in line of a ticket that stopped waiting, e.g. a cancelled task (call with the lock held)"
+        if ticket.started is None and ticket in ticket.lane.waiters:
+            ticket.lane.waiters.remove(ticket)
+            heapq.heapify(ticket.lane.waiters)
+            self._notify()
+
+    def release(self, ticket: Ticket, latency: float, error: BaseException = None, pause: float = None):
+        "Record how a call went and free its slot; pause holds the model's lane for that many seconds"
+        with self._lock:
+            ticket.lane.finish(ticket, latency, error, pause)
+            self._notify()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {name: lane.stats() for name, lane in self.lanes.items()}
+
+
+def _wake(waiter: asyncio.Future):
+    if not waiter.done():
+        waiter.set_result(None)
@@ -0,0 +1,315 @@
+from collections import deque
+from http import HTTPStatus
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+import asyncio
+import json
+import re
+import threading
+import time
+
+from src.batch import to_jsonable
+from src.claim_index import ClaimIndex
+from src.clients import get_client_provider
+from src.config import config_stats, read_config
+from src.pipeline import Pipeline
+from src.prompt_builder import prompt_recorder
+from src.question_router import question_router
+from src.utils.tracing import PROFILERS, tracer
+
+# Route -> (pipeline option, needs claim_id, needs question)
+ROUTES = {
+    "/qa": ("qa", True, True),
+    "/advanced_qa": ("advanced_qa", True, True),
+    "/summary": ("summary", True, False),
+    "/analysis": ("analysis", False, False),
+    "/history_qa": ("history_qa", False, True),
+    "/patient_qa": ("patient_qa", False, True),
+}
+MAX_BODY_BYTES = 1024 * 1024
+# patient_id and claim_id name directories under the data root: no separators, dots or other types
+ID_PATTERN = re.compile(r"[A-Za-z0-9_-]+")
+# Latencies kept per route for the percentiles in /metrics
+LATENCY_WINDOW = 1024
+
+
+class RequestError(Exception):
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class ServerMetrics:
+    "Request counters and recent latencies per route"
+
+    def __init__(self):
+        self.started = time.time()
+        self.routes: Dict[str, Dict] = {}
+
+    def route(self, path: str) -> Dict:
+        return self.routes.setdefault(path, {
+            "requests": 0, "ok": 0, "errors": 0, "rejected": 0, "timeouts": 0,
+            "latencies": deque(maxlen=LATENCY_WINDOW)})
+
+    def observe(self, path: str, outcome: str, latency: float):
+        stats = self.route(path)
+        stats["requests"] += 1
+        stats[outcome] += 1
+        if outcome == "ok":
+            stats["latencies"].append(latency)
+
+    def snapshot(self) -> Dict:
+        routes = {}
+        for path, stats in self.routes.items():
+            latencies = sorted(stats["latencies"])
+            percentile = (lambda p: round(latencies[min(int(p * len(latencies)), len(latencies) - 1)] * 1000, 2)
+                          if latencies else None)
+            routes[path] = {**{key: value for key, value in stats.items() if key != "latencies"},
+                            "latency_ms_p50": percentile(0.5), "latency_ms_p95": percentile(0.95)}
+        return {"uptime_seconds": round(time.time() - self.started, 1), "routes": routes}
+
+
+class AgentServer:
+    """Resident HTTP API over the pipeline: /qa, /advanced_qa, /summary, /analysis, /history_qa, /patient_qa,
+    /metrics.
+
+    Config, the claim index, inference clients and caches stay warm across
+    requests. Requests are queued for a fixed pool of async workers; when the
+    queue is full new requests are rejected with 503 and Retry-After instead
+    of piling up.
+    """
+
+    def __init__(self, host: str = None, port: int = None, workers: int = None, queue_size: int = None,
+                 request_timeout: float = None, client_provider=None, data_path: str = None):
+        self.host = host or read_config('SERVER_HOST', "127.0.0.1")
+        self.port = read_config('SERVER_PORT', 8000) if port is None else port
+        self.workers = workers or read_config('SERVER_WORKERS', 8)
+        self.queue_size = queue_size or read_config('SERVER_QUEUE_SIZE', 64)
+        self.request_timeout = request_timeout or read_config('SERVER_REQUEST_TIMEOUT_SECONDS', 120)
+        self.client_provider = client_provider
+        self.data_path = data_path
+        self.metrics = ServerMetrics()
+        self.in_flight = 0
+        # Requests queued or running; a burst is admitted up to workers + queue_size even before
+        # idle workers have taken their first items off the queue
+        self.admitted = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._server = None
+        self._worker_tasks = []
+        self._loop = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._stopped = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def warm_up(self):
+        "Load config, the inference clients and the claim index once, before the first request"
+        self.client_provider = self.client_provider or get_client_provider()
+        data_path = self.data_path or read_config('DATA_PATH')
+        index_path = read_config('CLAIM_INDEX_PATH') if data_path == read_config('DATA_PATH') else None
+        ClaimIndex.shared(data_path, index_path)
+
+    async def execute(self, option: str, params: Dict):
+        pipeline = Pipeline(patient_id=params["patient_id"], claim_id=params.get("claim_id"),
+                            data_path=self.data_path, client_provider=self.client_provider)
+        if params.get("profile"):
+            # Profilers follow one thread, so a profiled request runs the sync pipeline in a worker thread
+            return await asyncio.to_thread(pipeline.pipeline, option, params.get("question", ""),
+                                           params["profile"])
+        return await pipeline.apipeline(option=option, question=params.get("question", ""))
+
+    async def _worker(self):
+        while True:
+            option, params, future = await self._queue.get()
+            try:
+                if future.done():
+                    continue
+                self.in_flight += 1
+                try:
+                    result = await self.execute(option, params)
+                finally:
+                    self.in_flight -= 1
+                if not future.done():
+                    future.set_result(result)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                self.admitted -= 1
+                self._queue.task_done()
+
+    def metrics_snapshot(self) -> Dict:
+        provider = self.client_provider
+        cache = getattr(provider, "cache", None)
+        scheduler = getattr(provider, "scheduler", None)
+        return {
+            **self.metrics.snapshot(),
+            "queue": {"depth": self._queue.qsize() if self._queue else 0, "capacity": self.queue_size,
+                      "in_flight": self.in_flight, "workers": self.workers},
+            "inference": {"calls": getattr(provider, "calls", 0), "retries": getattr(provider, "retries", 0)},
+            "scheduler": scheduler.stats() if scheduler is not None else None,
+            "result_cache": cache.stats() if cache is not None else None,
+            "router": question_router.stats(),
+            "prompts": prompt_recorder.stats(),
+            "config": config_stats(),
+            "stages": tracer.snapshot()["stages"],
+        }
+
+    @staticmethod
+    def _params(method: str, target: str, body: bytes) -> Tuple[str, Dict]:
+        url = urlsplit(target)
+        params = dict(parse_qsl(url.query))
+        if method == "POST" and body:
+            try:
+                payload = json.loads(body)
+            except ValueError:
+                raise RequestError(HTTPStatus.BAD_REQUEST, "Body must be JSON")
+            if not isinstance(payload, dict):
+                raise RequestError(HTTPStatus.BAD_REQUEST, "Body must be a JSON object")
+            params.update(payload)
+        return url.path, params
+
+    async def dispatch(self, method: str, target: str, body: bytes) -> Tuple[HTTPStatus, Dict, Dict]:
+        "(status, JSON payload, extra headers) for one request"
+        path, params = self._params(method, target, body)
+        if path == "/metrics" and method == "GET":
+            if params.get("format") == "prometheus":
+                return HTTPStatus.OK, tracer.to_prometheus(), {}
+            return HTTPStatus.OK, self.metrics_snapshot(), {}
+        if path == "/health" and method == "GET":
+            return HTTPStatus.OK, {"status": "ok"}, {}
+        if path not in ROUTES:
+            raise RequestError(HTTPStatus.NOT_FOUND, f"Unknown path {path}")
+        if method not in ("GET", "POST"):
+            raise RequestError(HTTPStatus.METHOD_NOT_ALLOWED, f"{method} not allowed")
+        option, needs_claim, needs_question = ROUTES[path]
+        missing = [name for name, needed in (("patient_id", True), ("claim_id", needs_claim),
+                                             ("question", needs_question)) if needed and not params.get(name)]
+        if missing:
+            raise RequestError(HTTPStatus.BAD_REQUEST, f"Missing parameters: {', '.join(missing)}")
+        for name in ("patient_id", "claim_id"):
+            value = params.get(name)
+            if value is not None and not (isinstance(value, str) and ID_PATTERN.fullmatch(value)):
+                raise RequestError(HTTPStatus.BAD_REQUEST, f"{name} may only contain letters, digits, '_' and '-'")
+        if not isinstance(params.get("question", ""), str):
+            raise RequestError(HTTPStatus.BAD_REQUEST, "question must be a string")
+        if params.get("profile") and params["profile"] not in PROFILERS:
+            raise RequestError(HTTPStatus.BAD_REQUEST, f"profile must be one of {', '.join(PROFILERS)}")
+
+        start = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        if self.admitted >= self.workers + self.queue_size:
+            self.metrics.observe(path, "rejected", 0.0)
+            return (HTTPStatus.SERVICE_UNAVAILABLE, {"error": "Server busy, retry later"},
+                    {"Retry-After": "1"})
+        self.admitted += 1
+        self._queue.put_nowait((option, params, future))
+        try:
+            result = await asyncio.wait_for(future, self.request_timeout)
+        except asyncio.TimeoutError:
+            self.metrics.observe(path, "timeouts", time.perf_counter() - start)
+            return HTTPStatus.GATEWAY_TIMEOUT, {"error": "Request timed out"}, {}
+        except Exception as e:
+            self.metrics.observe(path, "errors", time.perf_counter() - start)
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(e)}, {}
+        latency = time.perf_counter() - start
+        self.metrics.observe(path, "ok", latency)
+        return HTTPStatus.OK, {"result": to_jsonable(result), "latency_ms": round(latency * 1000, 2)}, {}
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        "HTTP/1.1 with keep-alive; one request at a time per connection"
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, version = request_line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length") or 0)
+                extra_headers = {}
+                if length > MAX_BODY_BYTES:
+                    status, payload = HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": "Body too large"}
+                    headers["connection"] = "close"
+                else:
+                    body = await reader.readexactly(length) if length else b""
+                    try:
+                        status, payload, extra_headers = await self.dispatch(method, target, body)
+                    except RequestError as e:
+                        status, payload = e.status, {"error": str(e)}
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                if isinstance(payload, str):
+                    data, content_type = payload.encode(), "text/plain; version=0.0.4"
+                else:
+                    data, content_type = json.dumps(payload, default=str).encode(), "application/json"
+                head = [f"HTTP/1.1 {status.value} {status.phrase}", f"Content-Type: {content_type}",
+                        f"Content-Length: {len(data)}", f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+                head += [f"{name}: {value}" for name, value in extra_headers.items()]
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self):
+        "Run until stop() is called"
+        self.warm_up()
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        self._queue = asyncio.Queue()
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._ready.set()
+        try:
+            await self._stopped.wait()
+        finally:
+            self._server.close()
+            await self._server.wait_closed()
+            for task in self._worker_tasks:
+                task.cancel()
+            await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+            await self.client_provider.aclose()
+
+    def serve_forever(self):
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            pass
+
+    def start(self) -> "AgentServer":
+        "Serve from a background thread (tests, notebooks)"
+        self._thread = threading.Thread(target=lambda: asyncio.run(self.serve()), daemon=True)
+        self._thread.start()
+        if not self._ready.wait(timeout=10):
+            raise RuntimeError("Server did not start")
+        return self
+
+    def stop(self):
+        if self._loop is not None and self._stopped is not None:
+            self._loop.call_soon_threadsafe(self._stopped.set)
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    server = AgentServer()
+    print(f"Serving on {server.url}")
+    server.serve_forever()
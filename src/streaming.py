@@ -0,0 +1,176 @@
+from typing import Any, Dict, List, Optional, Tuple
+import json
+import time
+
+ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+def delta_text(chunk) -> str:
+    "Text of one streamed chat completion chunk (ChatCompletionStreamOutput or its dict form)"
+    choices = chunk.get("choices") if isinstance(chunk, dict) else getattr(chunk, "choices", None)
+    if not choices:
+        return ""
+    delta = choices[0].get("delta") if isinstance(choices[0], dict) else getattr(choices[0], "delta", None)
+    content = delta.get("content") if isinstance(delta, dict) else getattr(delta, "content", None)
+    return content or ""
+
+
+class JSONFieldStream:
+    """Incremental parser for a JSON object that arrives in arbitrary pieces.
+
+    feed() returns (field, text) deltas of the object's top-level string
+    values as soon as their characters arrive, so "answer" can be shown
+    while "reasoning" is still being generated. Other values are parsed
+    whole once complete. Anything before the first "{" (e.g. a ```json
+    fence) is skipped. Finished fields are collected in `values`.
+    """
+
+    def __init__(self):
+        self.values: Dict[str, Any] = {}
+        self.complete = False
+        self._state = "start"
+        self._key = ""
+        self._buffer = []
+        self._escape = None
+        self._high_surrogate = None
+        # Nesting depth and string state inside a non-string value
+        self._depth = 0
+        self._in_string = False
+
+    def feed(self, text: str) -> List[Tuple[str, str]]:
+        deltas = []
+        for char in text:
+            delta = self._step(char)
+            if delta:
+                if deltas and deltas[-1][0] == self._key:
+                    deltas[-1] = (self._key, deltas[-1][1] + delta)
+                else:
+                    deltas.append((self._key, delta))
+        return deltas
+
+    def _string_char(self, char: str) -> Optional[str]:
+        "Decode one character of a JSON string; returns decoded text, '' for none yet, None at the closing quote"
+        if self._escape is not None:
+            self._escape += char
+            if self._escape[0] != "u":
+                decoded, self._escape = ESCAPES.get(char, char), None
+            elif len(self._escape) < 5:
+                return ""
+            else:
+                code, self._escape = int(self._escape[1:], 16), None
+                if 0xD800 <= code < 0xDC00:
+                    self._high_surrogate = code
+                    return ""
+                if 0xDC00 <= code < 0xE000 and self._high_surrogate is not None:
+                    code = 0x10000 + ((self._high_surrogate - 0xD800) << 10) + (code - 0xDC00)
+                decoded = chr(code)
+            self._high_surrogate = None
+            return decoded
+        if char == "\\":
+            self._escape = ""
+            return ""
+        if char == '"':
+            return None
+        return char
+
+    def _step(self, char: str) -> str:
+        state = self._state
+        if state == "start":
+            if char == "{":
+                self._state = "key_wait"
+        elif state == "key_wait":
+            if char == '"':
+                self._state, self._buffer = "key", []
+            elif char == "}":
+                self._state, self.complete = "end", True
+        elif state == "key":
+            decoded = self._string_char(char)
+            if decoded is None:
+                self._key, self._state = "".join(self._buffer), "colon"
+            else:
+                self._buffer.append(decoded)
+        elif state == "colon":
+            if char == ":":
+                self._state = "value_wait"
+        elif state == "value_wait":
+            if char == '"':
+                self._state, self._buffer = "string", []
+            elif not char.isspace():
+                self._state, self._buffer, self._depth, self._in_string = "value", [], 0, False
+                return self._value_char(char)
+        elif state == "string":
+            decoded = self._string_char(char)
+            if decoded is None:
+                self.values[self._key] = "".join(self._buffer)
+                self._state = "key_wait"
+                return ""
+            self._buffer.append(decoded)
+            return decoded
+        elif state == "value":
+            return self._value_char(char)
+        return ""
+
+    def _value_char(self, char: str) -> str:
+        "Collect a number, literal, array or nested object until the top-level ',' or '}'"
+        if self._in_string:
+            if self._escape is not None:
+                self._escape = None
+            elif char == "\\":
+                self._escape = ""
+            elif char == '"':
+                self._in_string = False
+        elif char == '"':
+            self._in_string = True
+        elif char in "[{":
+            self._depth += 1
+        elif char in "]}" and self._depth > 0:
+            self._depth -= 1
+        elif char in ",}" and self._depth == 0:
+            raw = "".join(self._buffer).strip()
+            try:
+                self.values[self._key] = json.loads(raw)
+            except ValueError:
+                self.values[self._key] = raw
+            self._state = "key_wait"
+            if char == "}":
+                self._state, self.complete = "end", True
+            return ""
+        self._buffer.append(char)
+        return ""
+
+
+class StreamMeter:
+    "Time to first token and token rate of one streamed model call"
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first = None
+        self.last = None
+        self.tokens = 0
+
+    def tick(self, tokens: int = 1):
+        "Count tokens received now"
+        now = time.perf_counter()
+        if self.first is None:
+            self.first = now
+        self.last = now
+        self.tokens += tokens
+
+    @property
+    def time_to_first_token(self) -> Optional[float]:
+        return None if self.first is None else self.first - self.start
+
+    @property
+    def tokens_per_second(self) -> Optional[float]:
+        "Rate of the tokens after the first, which only measures generation speed"
+        if self.tokens < 2 or self.last <= self.first:
+            return None
+        return (self.tokens - 1) / (self.last - self.first)
+
+    def apply(self, record, stage: str = "call"):
+        "Store the measurements on a PromptRecord"
+        record.timings[stage] = record.timings.get(stage, 0.0) + time.perf_counter() - self.start
+        record.time_to_first_token = self.time_to_first_token
+        record.tokens_per_second = self.tokens_per_second
+        if not record.completion_tokens:
+            record.completion_tokens = self.tokens
@@ -1,37 +1,189 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from src.config import read_config
-from src.utils.utils import process_data
-from huggingface_hub import InferenceClient
-import os
+from src.clients import BACKEND_SUMMARIZATION, get_client_provider
+from src.prompt_builder import PromptBuilder, PromptRecord, prompt_recorder
+from src.streaming import StreamMeter
+import asyncio
+import time
+
+# Reduce rounds before the remaining partial summaries are cut to one input
+MAX_REDUCE_ROUNDS = 3
+
+
+def summary_text(result) -> str:
+    "Text of a summarization result (SummarizationOutput or its dict form)"
+    if isinstance(result, dict):
+        return result.get("summary_text", "")
+    return getattr(result, "summary_text", None) or str(result)
 
 
 class Summarization:
 
-    def __init__(self):
+    def __init__(self, client_provider=None, prompt_builder=None):
         self.summarization_model = read_config("SUMMARIZATION_MODEL")
         if not self.summarization_model:
             raise "Summarization model is not loaded properly."
+        self.client_provider = client_provider or get_client_provider()
+        self.prompt_builder = prompt_builder or PromptBuilder.from_config()
+        self.map_workers = read_config('SUMMARY_MAP_WORKERS', 4)
+        # Token counts and stage timings of the last summarize()/asummarize() call
+        self.last_record = None
+        # Final summary text of the last summarize_stream()/asummarize_stream() call
+        self.last_result = None
+
+    def _call(self, text):
+        return self.client_provider.call(
+            BACKEND_SUMMARIZATION,
+            "summarization",
+            text=text,
+            model=self.summarization_model,
+        )
+
+    async def _acall(self, text):
+        return await self.client_provider.acall(
+            BACKEND_SUMMARIZATION,
+            "summarization",
+            text=text,
+            model=self.summarization_model,
+        )
+
+    def _map(self, texts):
+        if len(texts) == 1:
+            return [self._call(texts[0])]
+        with ThreadPoolExecutor(max_workers=min(self.map_workers, len(texts))) as pool:
+            return list(pool.map(self._call, texts))
+
+    def _reduce_inputs(self, partials, record: PromptRecord, round_number: int):
+        "Group partial summaries for the next reduce call(s)"
+        groups = self.prompt_builder.reduce_groups([summary_text(partial) for partial in partials])
+        if len(groups) > 1 and round_number >= MAX_REDUCE_ROUNDS:
+            groups = [self.prompt_builder.counter.prefix("\n".join(groups), self.prompt_builder.chunk_tokens)]
+        record.tokens["reduce"] = record.tokens.get("reduce", 0) + sum(map(self.prompt_builder.count, groups))
+        record.calls += len(groups)
+        return groups
+
+    def _finish(self, record: PromptRecord):
+        self.last_record = record
+        prompt_recorder.record(record)
 
     def summarize(self, claim_data):
+        """Summary of a claim; long inputs are summarized chunk by chunk in parallel (map) and the
+        partial summaries are summarized again (reduce) until one remains"""
+        record = PromptRecord("summary")
         try:
-            if isinstance(claim_data, dict):
-                self.claim_data = process_data(data=claim_data)
-            else:
-                self.claim_data = claim_data
+            with record.stage("build"):
+                inputs = self.prompt_builder.summary_inputs(claim_data, record)
+            with record.stage("map"):
+                record.calls += len(inputs)
+                partials = self._map(inputs)
+            if len(partials) == 1:
+                return partials[0]
+            return self._reduce(partials, record)
+        except Exception as e:
+            print(f"Raise Exception {e}")
+            return None
+        finally:
+            self._finish(record)
 
-            client = InferenceClient(
-                provider="hf-inference",
-                api_key=os.getenv('HF_TOKEN'),
-            )
+    def _reduce(self, partials, record: PromptRecord):
+        "Summarize partial summaries again until one remains"
+        with record.stage("reduce"):
+            round_number = 0
+            while len(partials) > 1:
+                round_number += 1
+                partials = self._map(self._reduce_inputs(partials, record, round_number))
+        return partials[0]
 
-            result = client.summarization(
-                text=self.claim_data,
-                model=self.summarization_model,
-            )
+    def summarize_stream(self, claim_data):
+        """Like summarize(), but yields results as they are ready: ("partial", text) for each chunk
+        summary of a long input as it completes, then ("summary", text). The summarization
+        endpoint does not stream tokens, so a chunk summary is the smallest unit; the final
+        text is kept in last_result"""
+        record = PromptRecord("summary")
+        self.last_result = None
+        meter = StreamMeter()
+        try:
+            with record.stage("build"):
+                inputs = self.prompt_builder.summary_inputs(claim_data, record)
+            record.calls += len(inputs)
+            if len(inputs) == 1:
+                with record.stage("map"):
+                    result = self._call(inputs[0])
+            else:
+                with ThreadPoolExecutor(max_workers=min(self.map_workers, len(inputs))) as pool:
+                    futures = [pool.submit(self._call, text) for text in inputs]
+                    for future in as_completed(futures):
+                        meter.tick()
+                        yield "partial", summary_text(future.result())
+                record.timings["map"] = record.timings.get("map", 0.0) + meter.last - meter.start
+                result = self._reduce([future.result() for future in futures], record)
+            meter.tick()
+            self.last_result = summary_text(result)
+            record.time_to_first_token = meter.time_to_first_token
+            yield "summary", self.last_result
+        except Exception as e:
+            print(f"Raise Exception {e}")
+        finally:
+            self._finish(record)
 
-            return result
+    async def asummarize(self, claim_data):
+        "Async version of summarize()"
+        record = PromptRecord("summary")
+        try:
+            with record.stage("build"):
+                inputs = self.prompt_builder.summary_inputs(claim_data, record)
+            with record.stage("map"):
+                record.calls += len(inputs)
+                partials = await asyncio.gather(*(self._acall(text) for text in inputs))
+            with record.stage("reduce"):
+                round_number = 0
+                while len(partials) > 1:
+                    round_number += 1
+                    groups = self._reduce_inputs(partials, record, round_number)
+                    partials = await asyncio.gather(*(self._acall(text) for text in groups))
+            return partials[0]
         except Exception as e:
             print(f"Raise Exception {e}")
             return None
+        finally:
+            self._finish(record)
+
+
+    async def asummarize_stream(self, claim_data):
+        "Async version of summarize_stream()"
+        record = PromptRecord("summary")
+        self.last_result = None
+        meter = StreamMeter()
+        try:
+            with record.stage("build"):
+                inputs = self.prompt_builder.summary_inputs(claim_data, record)
+            record.calls += len(inputs)
+            tasks = [asyncio.ensure_future(self._acall(text)) for text in inputs]
+            try:
+                if len(tasks) > 1:
+                    for next_done in asyncio.as_completed(tasks):
+                        partial = await next_done
+                        meter.tick()
+                        yield "partial", summary_text(partial)
+                partials = list(await asyncio.gather(*tasks))
+            finally:
+                for task in tasks:
+                    task.cancel()
+            record.timings["map"] = record.timings.get("map", 0.0) + time.perf_counter() - meter.start
+            with record.stage("reduce"):
+                round_number = 0
+                while len(partials) > 1:
+                    round_number += 1
+                    groups = self._reduce_inputs(partials, record, round_number)
+                    partials = await asyncio.gather(*(self._acall(text) for text in groups))
+            meter.tick()
+            self.last_result = summary_text(partials[0])
+            record.time_to_first_token = meter.time_to_first_token
+            yield "summary", self.last_result
+        except Exception as e:
+            print(f"Raise Exception {e}")
+        finally:
+            self._finish(record)
 
 
 if __name__ == "__main__":
@@ -40,3 +192,4 @@ if __name__ == "__main__":
     claim_data = data_ingestion.ingest_claim_data(claim_path='CLM153910000')
     summarization = Summarization()
     print(f"Summarization is: {summarization.summarize(claim_data=claim_data)}")
+    print(summarization.last_record)
@@ -0,0 +1,204 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import json
+import random
+import re
+import threading
+import time
+
+STUB_ANSWER = {"answer": "stub answer", "reasoning": "stub reasoning"}
+# Numbered question lines of a batched advanced_qa prompt (src.batched_qa)
+BATCH_QUESTION = re.compile(r"^\[(\d+)\] ", re.MULTILINE)
+# Streamed responses are sent in word-sized pieces, roughly one token each
+STREAM_PIECE = re.compile(r"\s*\S+")
+
+
+class StubInferenceHandler(BaseHTTPRequestHandler):
+    "Answers chat, question answering and summarization requests with canned payloads"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_stream(self, content: str, token_latency: float):
+        "Send a chat completion as server-sent events, one piece per event, like TGI with stream=True"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        self.close_connection = True
+        pieces = STREAM_PIECE.findall(content)
+        for index, piece in enumerate(pieces):
+            if index and token_latency > 0:
+                time.sleep(token_latency)
+            chunk = {
+                "id": "stub", "object": "chat.completion.chunk", "created": int(time.time()), "model": "stub",
+                "system_fingerprint": "stub",
+                "choices": [{"index": 0, "delta": {"role": "assistant", "content": piece}, "logprobs": None,
+                             "finish_reason": "stop" if index == len(pieces) - 1 else None}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, payload))
+            delay = server.latency + server.random.uniform(0.0, server.jitter) if server.jitter else server.latency
+            wait = server.throttle()
+            failed = wait is None and server.error_rate > 0 and server.random.random() < server.error_rate
+        if wait is not None:
+            self._send_json({"error": "Rate limit reached"}, status=429, headers={"Retry-After": f"{wait:.3f}"})
+            return
+        if failed:
+            self._send_json({"error": "Model is overloaded"}, status=503)
+            return
+        if delay > 0:
+            time.sleep(delay)
+
+        if "/chat/completions" in self.path:
+            content = json.dumps(server.chat_answer)
+            user_content = (payload.get("messages") or [{}])[-1].get("content") or ""
+            if "--- QUESTIONS ---" in user_content:
+                content = json.dumps([{"id": int(item_id), **server.chat_answer}
+                                      for item_id in BATCH_QUESTION.findall(user_content)])
+            if payload.get("stream"):
+                self._send_stream(content, server.token_latency)
+                return
+            self._send_json({
+                "id": "stub", "object": "chat.completion", "created": int(time.time()), "model": "stub",
+                "choices": [{
+                    "index": 0, "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": content},
+                }],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            })
+        elif self.path.startswith("/question_answering"):
+            self._send_json({"answer": server.chat_answer["answer"], "score": 0.99, "start": 0, "end": 0})
+        elif self.path.startswith("/summarization"):
+            self._send_json([{"summary_text": "stub summary"}])
+        else:
+            self._send_json({"error": f"Unknown path {self.path}"}, status=404)
+
+
+class StubHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default listen backlog of 5 drops connections under concurrent load tests
+    request_queue_size = 128
+    rate_limit = None
+    retry_after = None
+    error_rate = 0.0
+
+    def throttle(self):
+        "None if a request may be served now, else the Retry-After seconds of a 429 (call with lock held)"
+        if not self.rate_limit:
+            return None
+        now = time.monotonic()
+        self.allowance = min(self.rate_limit, self.allowance + (now - self.checked) * self.rate_limit)
+        self.checked = now
+        if self.allowance >= 1:
+            self.allowance -= 1
+            return None
+        self.throttled += 1
+        if self.retry_after is not None:
+            return self.retry_after
+        return (1 - self.allowance) / self.rate_limit
+
+
+class StubInferenceServer:
+    """Local stand-in for the Hugging Face inference endpoints.
+
+    Point ClientProvider(endpoint_url=server.url) at it to run the model
+    wrappers without network access. latency (+ up to jitter) seconds are
+    slept before each response to stand in for model time in load tests.
+    Chat requests with stream=True are answered as server-sent events,
+    token_latency seconds apart.
+
+    To test behaviour under throttling, rate_limit (requests per second,
+    with bursts of as many) answers excess requests with 429 and a
+    Retry-After header (retry_after seconds, or the time until the next
+    request is allowed), and error_rate answers that fraction of requests
+    with 503.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, chat_answer: dict = None,
+                 latency: float = 0.0, jitter: float = 0.0, seed: int = None, token_latency: float = 0.0,
+                 rate_limit: float = None, retry_after: float = None, error_rate: float = 0.0):
+        self.httpd = StubHTTPServer((host, port), StubInferenceHandler)
+        self.httpd.lock = threading.Lock()
+        self.httpd.requests = []
+        self.httpd.chat_answer = chat_answer or STUB_ANSWER
+        self.httpd.latency = latency
+        self.httpd.jitter = jitter
+        self.httpd.token_latency = token_latency
+        self.httpd.random = random.Random(seed)
+        self.httpd.rate_limit = rate_limit
+        self.httpd.retry_after = retry_after
+        self.httpd.error_rate = error_rate
+        self.httpd.allowance = rate_limit or 0.0
+        self.httpd.checked = time.monotonic()
+        self.httpd.throttled = 0
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def requests(self):
+        return self.httpd.requests
+
+    @property
+    def throttled(self) -> int:
+        "Requests answered with 429"
+        return self.httpd.throttled
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stub of the inference endpoints")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds slept before each response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random delay of up to this many seconds")
+    parser.add_argument("--token-latency", type=float, default=0.0,
+                        help="Seconds between the pieces of a streamed chat completion")
+    parser.add_argument("--rate-limit", type=float, help="Requests per second served; the rest get 429")
+    parser.add_argument("--retry-after", type=float, help="Retry-After seconds sent with a 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 503")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+    server = StubInferenceServer(port=args.port, latency=args.latency, jitter=args.jitter, seed=args.seed,
+                                 token_latency=args.token_latency, rate_limit=args.rate_limit,
+                                 retry_after=args.retry_after, error_rate=args.error_rate).start()
+    print(f"Stub inference server listening on {server.url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,239 @@
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Optional
+import contextvars
+import json
+import os
+import threading
+import time
+
+from src.config import read_config
+
+# Histogram bucket upper bounds in seconds (Prometheus "le" labels)
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Finished root spans (request traces) kept for export
+TRACE_WINDOW = 100
+PROFILERS = ("cprofile", "pyinstrument")
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class _NullSpan:
+    "Returned by a disabled tracer: entering and leaving it does nothing"
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Histogram:
+    "Cumulative-bucket latency histogram"
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, fraction: float) -> Optional[float]:
+        "Upper bound of the bucket holding the given fraction of observations"
+        if not self.count:
+            return None
+        rank, seen = fraction * self.count, 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def to_dict(self) -> Dict:
+        return {"count": self.count, "sum_seconds": round(self.sum, 6),
+                "p50_seconds": self.quantile(0.5), "p95_seconds": self.quantile(0.95),
+                "buckets": dict(zip([str(bound) for bound in self.buckets] + ["+Inf"], self.counts))}
+
+
+class Span:
+    "One timed stage; nested spans become its children"
+    __slots__ = ("tracer", "name", "attributes", "start", "duration", "children", "parent", "_token")
+
+    def __init__(self, tracer: "Tracer", name: str, attributes: Dict):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.children = []
+        self.duration = None
+
+    def __enter__(self):
+        self.parent = _current_span.get()
+        if self.parent is not None:
+            self.parent.children.append(self)
+        self._token = _current_span.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.start
+        _current_span.reset(self._token)
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        self.tracer._finish(self)
+        return False
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> Dict:
+        return {"name": self.name, "ms": round((self.duration or 0.0) * 1000, 3),
+                **({"attributes": self.attributes} if self.attributes else {}),
+                **({"children": [child.to_dict() for child in self.children]} if self.children else {})}
+
+
+class Tracer:
+    """Spans with per-stage latency histograms, exported as JSON or Prometheus text.
+
+    Disabled tracers hand out a shared no-op span, so instrumented code costs
+    one attribute check. request() wraps a whole pipeline call and can also
+    profile it with cProfile or pyinstrument, writing one file per request.
+    """
+
+    def __init__(self, enabled: bool = False, profiler: str = None, profile_dir: str = "traces",
+                 max_traces: int = TRACE_WINDOW):
+        if profiler and profiler not in PROFILERS:
+            raise ValueError(f"Unknown profiler {profiler}, expected one of {PROFILERS}")
+        self.enabled = enabled
+        self.profiler = profiler
+        self.profile_dir = profile_dir
+        self.histograms: Dict[str, Histogram] = {}
+        self.traces = deque(maxlen=max_traces)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls) -> "Tracer":
+        return cls(
+            enabled=bool(read_config('TRACING_ENABLED', False)),
+            profiler=read_config('TRACE_PROFILER'),
+            profile_dir=read_config('TRACE_DIR', "traces"),
+        )
+
+    def span(self, name: str, **attributes):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, attributes)
+
+    def _finish(self, span: Span):
+        with self._lock:
+            histogram = self.histograms.get(span.name)
+            if histogram is None:
+                histogram = self.histograms[span.name] = Histogram()
+            histogram.observe(span.duration)
+            if span.parent is None:
+                self.traces.append(span)
+
+    @contextmanager
+    def request(self, name: str, profiler=None, **attributes):
+        """Root span of one request.
+
+        profiler: 'cprofile' or 'pyinstrument' to profile this request, None
+        for the configured TRACE_PROFILER, False for no profile.
+        """
+        profiler = self.profiler if profiler is None else profiler
+        if profiler and profiler not in PROFILERS:
+            raise ValueError(f"Unknown profiler {profiler}, expected one of {PROFILERS}")
+        if not self.enabled and not profiler:
+            yield NULL_SPAN
+            return
+        span = Span(self, name, attributes) if self.enabled else NULL_SPAN
+        if profiler:
+            with self._profile(name, profiler), span:
+                yield span
+        else:
+            with span:
+                yield span
+
+    @contextmanager
+    def _profile(self, name: str, profiler: str):
+        "Profile the block (current thread only) into profile_dir/<name>-<time>.prof or .txt"
+        os.makedirs(self.profile_dir, exist_ok=True)
+        path = os.path.join(self.profile_dir, f"{name}-{int(time.time() * 1000)}-{threading.get_ident()}")
+        if profiler == "pyinstrument":
+            try:
+                from pyinstrument import Profiler
+            except ImportError as e:
+                print(f"Falling back to cProfile: {e}")
+            else:
+                session = Profiler()
+                session.start()
+                try:
+                    yield
+                finally:
+                    session.stop()
+                    with open(f"{path}.txt", "w") as f:
+                        f.write(session.output_text())
+                return
+        import cProfile
+        session = cProfile.Profile()
+        session.enable()
+        try:
+            yield
+        finally:
+            session.disable()
+            session.dump_stats(f"{path}.prof")
+
+    def snapshot(self, traces: bool = False) -> Dict:
+        with self._lock:
+            stages = {name: histogram.to_dict() for name, histogram in sorted(self.histograms.items())}
+            recent = [span.to_dict() for span in self.traces] if traces else None
+        return {"enabled": self.enabled, "stages": stages, **({"traces": recent} if traces else {})}
+
+    def to_prometheus(self, metric: str = "form_agent_stage_seconds") -> str:
+        "Stage histograms in the Prometheus text exposition format"
+        lines = [f"# HELP {metric} Time spent per pipeline stage", f"# TYPE {metric} histogram"]
+        with self._lock:
+            for name, histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip([str(bound) for bound in histogram.buckets] + ["+Inf"], histogram.counts):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_sum{{stage="{name}"}} {histogram.sum:.6f}')
+                lines.append(f'{metric}_count{{stage="{name}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+    def export(self, path: str):
+        "Write the histograms (and recent traces) to path: Prometheus text for .prom/.txt, else JSON"
+        with open(path, "w") as f:
+            if path.endswith((".prom", ".txt")):
+                f.write(self.to_prometheus())
+            else:
+                json.dump(self.snapshot(traces=True), f, indent=2)
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.traces.clear()
+
+
+tracer = Tracer.from_config()
+
+
+if __name__ == "__main__":
+    demo = Tracer(enabled=True)
+    with demo.request("pipeline.demo"):
+        with demo.span("ingestion.claim"):
+            time.sleep(0.01)
+    print(json.dumps(demo.snapshot(traces=True), indent=2))
+    print(demo.to_prometheus())
@@ -1,11 +1,35 @@
 from typing import Dict
+import threading
+
+from src.utils.tracing import tracer
+
+_file_reads = threading.local()
+
+
+def count_file_read(count: int = 1):
+    "Record claim files opened by the current thread"
+    _file_reads.count = getattr(_file_reads, 'count', 0) + count
+
+
+def files_read() -> int:
+    "Number of claim files opened so far by the current thread"
+    return getattr(_file_reads, 'count', 0)
+
+
+def field_lines(data: Dict, prefix: str = ""):
+    "'key: value' lines of claim fields, nested dicts flattened to dotted keys (financials.copay: 25.0)"
+    for key, value in data.items():
+        if isinstance(value, dict):
+            yield from field_lines(value, f"{prefix}{key}.")
+        else:
+            yield f"{prefix}{key}: {value}"
 
 
 def process_data(data: Dict):
     try:
-        details_str = "\n".join(
-            f"{key}: {value}" for key, value in data.items() if key != "Clinical_note")
-        context = f"{details_str}\nClinical Note:\n{data.get('Clinical_note', '')}"
+        with tracer.span("process_data"):
+            details_str = "\n".join(field_lines({key: value for key, value in data.items() if key != "Clinical_note"}))
+            context = f"{details_str}\nClinical Note:\n{data.get('Clinical_note', '')}"
         return context
     except Exception as e:
         print(f"Raise Exception {e}")
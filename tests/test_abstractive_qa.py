@@ -18,9 +18,9 @@ def mock_read_config():
 
 
 @pytest.fixture
-def mock_inference_client():
-    with patch("src.abstractive_qa.InferenceClient") as mock_client:
-        yield mock_client
+def mock_client_provider():
+    with patch("src.abstractive_qa.get_client_provider") as mock_provider:
+        yield mock_provider.return_value
 
 
 def test_init_reads_config_success(mock_read_config):
@@ -38,25 +38,34 @@ def test_init_raises_error_if_no_system_prompt():
             AbstractiveQA(claim_data="Test claim data")
 
 
-@patch("os.getenv", return_value="fake_token")
-def test_qa_returns_answer_and_reasoning(mock_env, mock_read_config, mock_inference_client):
+def test_qa_returns_answer_and_reasoning(mock_read_config, mock_client_provider):
     """Test qa() returns tuple (answer, reasoning) when client works."""
-    # Mock client.chat_completion response
-    mock_instance = MagicMock()
-    mock_instance.chat_completion.return_value.choices = [
+    # Mock chat_completion response returned through the shared provider
+    mock_client_provider.call.return_value.choices = [
         MagicMock(message=MagicMock(content='{"answer": "Dr. Smith", "reasoning": "Found in text"}'))
     ]
-    mock_inference_client.return_value = mock_instance
 
     qa = AbstractiveQA(claim_data="Claim: treated by Dr. Smith.")
     result = qa.qa("Who treated the patient?")
     assert result == ("Dr. Smith", "Found in text")
 
 
-@patch("os.getenv", return_value="fake_token")
-def test_qa_returns_none_on_exception(mock_env, mock_read_config):
+def test_qa_returns_none_on_exception(mock_read_config, mock_client_provider):
     """Ensure qa() gracefully returns None when an exception occurs."""
-    with patch("src.abstractive_qa.InferenceClient", side_effect=Exception("Connection failed")):
-        qa = AbstractiveQA(claim_data="Sample claim")
-        result = qa.qa("What happened?")
-        assert result is None
+    mock_client_provider.call.side_effect = Exception("Connection failed")
+    qa = AbstractiveQA(claim_data="Sample claim")
+    result = qa.qa("What happened?")
+    assert result is None
+
+
+def test_qa_records_prompt_tokens_and_timings(mock_read_config, mock_client_provider):
+    """Each call records the prompt size by part and a per-stage timing breakdown."""
+    mock_client_provider.call.return_value.choices = [
+        MagicMock(message=MagicMock(content='{"answer": "Dr. Smith", "reasoning": "Found in text"}'))
+    ]
+    qa = AbstractiveQA(claim_data={"provider_name": "Dr. Smith", "Clinical_note": "Seen by Dr. Smith."})
+    qa.qa("Who treated the patient?")
+    record = qa.last_record
+    assert record.tokens["fields"] > 0 and record.tokens["note"] > 0
+    assert record.calls == 1
+    assert set(record.timings) == {"build", "call", "parse"}
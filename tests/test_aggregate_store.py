@@ -0,0 +1,146 @@
+import json
+import os
+import pytest
+import threading
+from pathlib import Path
+from unittest.mock import patch
+from src.aggregate_store import AggregateStore
+from src.claim_index import ClaimIndex
+from src.data_ingestion import DataIngestion
+from src.holistic_analysis import ANALYSIS_FIELDS, HolisticAnalysis
+
+
+def write_claim(root, claim_id, paid, provider="Dr. A", diagnosis="Asthma", date="2025-07-01"):
+    claim_dir = root / "P-1" / claim_id
+    claim_dir.mkdir(parents=True, exist_ok=True)
+    details = {
+        "claim_id": claim_id,
+        "claim_date": date,
+        "patient_info": {"patient_id": "P-1", "first_name": "Ann", "last_name": "Lee"},
+        "provider_name": provider,
+        "primary_diagnosis": diagnosis,
+        "financials": {"billed_amount": paid * 2, "allowed_amount": paid * 1.5, "copay": 10.0, "insurance_paid": paid},
+    }
+    details_path = claim_dir / "claim_details.json"
+    if details_path.exists():
+        # Make an in-place edit visible even on filesystems with coarse mtimes
+        stat = os.stat(details_path)
+        details_path.write_text(json.dumps(details))
+        os.utime(details_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    else:
+        details_path.write_text(json.dumps(details))
+    (claim_dir / "claim_text_data.txt").write_text(f"Note for {claim_id}")
+
+
+@pytest.fixture
+def store(tmp_path):
+    root = tmp_path / "claim"
+    write_claim(root, "CLM1", 100.0, date="2025-06-03")
+    write_claim(root, "CLM2", 200.0, provider="Dr. B")
+    index = ClaimIndex(str(root), str(tmp_path / "index.sqlite"))
+    return AggregateStore(index, check_interval=0)
+
+
+def streamed_report(store):
+    config = {"DATA_PATH": store.claim_index.data_path}
+    with patch("src.data_ingestion.read_config", side_effect=lambda key, default=None: config.get(key, default)):
+        claims = DataIngestion(patient_id="P-1").iter_patient_claims(fields=ANALYSIS_FIELDS)
+        return HolisticAnalysis().analysis(claims)
+
+
+def test_report_matches_full_analysis(store):
+    """The materialized report equals a streamed recompute."""
+    report = HolisticAnalysis(store=store).analysis(patient_id="P-1")
+    assert report["total_insurance_paid"] == 300.0
+    assert report["providers"] == ["Dr. A", "Dr. B"]
+    assert report == streamed_report(store)
+
+
+def test_added_changed_and_removed_claims_are_applied_incrementally(store):
+    """Only the claims that changed are applied to the aggregate."""
+    root = Path(store.claim_index.data_path)
+    store.report("P-1")
+    write_claim(root, "CLM3", 50.0, diagnosis="Migraine")
+    write_claim(root, "CLM1", 150.0)
+    changes = store.sync("P-1")
+    assert changes == {"added": ["CLM3"], "changed": ["CLM1"], "removed": []}
+
+    for path in (root / "P-1" / "CLM2").iterdir():
+        path.unlink()
+    (root / "P-1" / "CLM2").rmdir()
+    report = store.report("P-1")
+    assert report["total_claims_count"] == 2
+    assert report["total_insurance_paid"] == 200.0
+    assert report["providers"] == ["Dr. A"]
+    assert report["diagnosis_counts"] == {"Asthma": 1, "Migraine": 1}
+    assert report == streamed_report(store)
+    assert store.stats()["claims_applied"] == 2 + 2 + 1
+
+
+def test_reads_within_check_interval_do_not_touch_the_index(store):
+    """Dashboard polls are served from memory between checks."""
+    store.check_interval = 3600
+    store.report("P-1")
+    with patch.object(store, "sync") as sync:
+        for _ in range(100):
+            store.report("P-1", distributions=False)
+        sync.assert_not_called()
+
+
+def test_reads_do_not_recompute_distributions_or_refresh_twice(store):
+    """Percentiles and outliers are kept by sync(); a read without changes stats each claim once."""
+    store.report("P-1")
+    with patch("src.aggregate_store.amount_percentiles") as percentiles, \
+            patch.object(store.claim_index, "refresh_patient", wraps=store.claim_index.refresh_patient) as refresh:
+        report = store.report("P-1")
+        percentiles.assert_not_called()
+        assert refresh.call_count == 1
+    assert report["percentiles"] == streamed_report(store)["percentiles"]
+
+
+def test_verification_runs_outside_the_request(store):
+    """A due verification starts on a background thread and the read returns without waiting for it."""
+    store.report("P-1")
+    store.verify_interval = 0
+    started, release = threading.Event(), threading.Event()
+
+    def slow_verify(patient_id):
+        started.set()
+        release.wait(5)
+
+    with patch.object(store, "verify", side_effect=slow_verify) as verify:
+        assert store.report("P-1")["total_claims_count"] == 2
+        assert started.wait(5)
+        assert store.report("P-1")["total_claims_count"] == 2
+        release.set()
+    assert verify.call_count == 1
+
+
+def test_verify_rebuilds_a_drifted_aggregate(store):
+    """Periodic verification against a full recompute repairs drift."""
+    assert store.verify("P-1") is True
+    aggregate = store.aggregate("P-1")
+    aggregate["totals"]["copay"] += 999
+    store._save("P-1", aggregate, 0.0, [], [])
+    assert store.verify("P-1") is False
+    assert store.stats()["mismatches"] == 1
+    assert store.report("P-1")["total_copay"] == 20.0
+
+
+def test_archived_patients_are_analysed_from_the_archive(store, tmp_path):
+    """A patient packed into ARCHIVE_PATH (and absent from DATA_PATH) is streamed instead of read from the store."""
+    from src.claim_archive import convert_directory
+    from src.config import read_config
+    from src.pipeline import Pipeline
+    convert_directory(store.claim_index.data_path, str(tmp_path / "archive"))
+    (tmp_path / "empty").mkdir()
+    config = {"DATA_PATH": str(tmp_path / "empty"), "ARCHIVE_PATH": str(tmp_path / "archive"),
+              "AGGREGATE_STORE_ENABLED": True, "CLAIM_INDEX_PATH": None}
+
+    def fake_config(key, default=None):
+        return config[key] if key in config else read_config(key, default)
+
+    with patch("src.data_ingestion.read_config", side_effect=fake_config), \
+            patch("src.pipeline.read_config", side_effect=fake_config):
+        report = Pipeline(patient_id="P-1").pipeline("analysis")
+    assert report["total_insurance_paid"] == 300.0 and report == streamed_report(store)
@@ -0,0 +1,53 @@
+import asyncio
+import pytest
+from src.async_pipeline import AsyncPipeline
+from src.clients import ClientProvider
+from src.utils.stub_server import StubInferenceServer
+
+CLAIM = {"claim_id": "CLM1", "provider_name": "Dr. Test", "Clinical_note": "Seen by Dr. Test."}
+
+
+@pytest.fixture
+def stub_server():
+    with StubInferenceServer() as server:
+        yield server
+
+
+def test_answer_many_returns_results_in_input_order(stub_server):
+    """Every question gets both QA answers, in the order asked, plus one summary."""
+    provider = ClientProvider(endpoint_url=stub_server.url, max_retries=0)
+    async_pipeline = AsyncPipeline(patient_id="PA-12345", concurrency=4, client_provider=provider)
+    questions = [f"Question {i}?" for i in range(6)]
+
+    result = async_pipeline.answer_many_sync(CLAIM, questions)
+
+    assert [answer["question"] for answer in result["answers"]] == questions
+    assert all(answer["advanced_qa"] == ("stub answer", "stub reasoning") for answer in result["answers"])
+    assert all(answer["qa"].answer == "stub answer" for answer in result["answers"])
+    assert result["summary"].summary_text == "stub summary"
+    assert len(stub_server.requests) == 6 * 2 + 1
+
+
+def test_concurrency_limit_is_respected():
+    """No more than `concurrency` calls are in flight at once."""
+    in_flight, peak = 0, 0
+
+    class SlowClient:
+        def __init__(self, **kwargs):
+            pass
+
+        async def question_answering(self, **kwargs):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return kwargs["question"]
+
+    provider = ClientProvider(async_client_factory=SlowClient)
+    async_pipeline = AsyncPipeline(patient_id="PA-12345", concurrency=3, client_provider=provider)
+    questions = [str(i) for i in range(10)]
+    result = async_pipeline.answer_many_sync(CLAIM, questions, options=("qa",), summary=False)
+
+    assert [answer["qa"] for answer in result["answers"]] == questions
+    assert peak == 3
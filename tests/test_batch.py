@@ -0,0 +1,89 @@
+import json
+import pytest
+from src import clients
+from src.batch import iter_units, run_batch
+from src.clients import ClientProvider
+from src.utils.stub_server import StubInferenceServer
+
+DATA_PATH = "data/claim"
+
+
+@pytest.fixture
+def stub_provider():
+    previous = clients._provider
+    with StubInferenceServer() as server:
+        clients.set_client_provider(ClientProvider(endpoint_url=server.url, max_retries=0))
+        yield server
+    clients.set_client_provider(previous)
+
+
+def read_records(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_batch_writes_one_record_per_claim(stub_provider, tmp_path):
+    """Every claim under the input directory gets a JSONL result."""
+    out = tmp_path / "results.jsonl"
+    counts = run_batch(option="summary", input_dir=DATA_PATH, out_path=str(out), workers=4)
+
+    records = read_records(out)
+    total = len(list(iter_units(DATA_PATH, "summary")))
+    assert counts == {"processed": total, "failed": 0, "skipped": 0}
+    assert len(records) == total
+    assert records[0]["result"] == {"summary_text": "stub summary"}
+
+
+def test_batch_resumes_after_crash(stub_provider, tmp_path):
+    """Completed claims are skipped and a torn last line is discarded."""
+    out = tmp_path / "results.jsonl"
+    run_batch(option="summary", input_dir=DATA_PATH, out_path=str(out), workers=2)
+    lines = out.read_text().splitlines(keepends=True)
+    out.write_text("".join(lines[:5]) + lines[5][:10])
+
+    requests_before = len(stub_provider.requests)
+    counts = run_batch(option="summary", input_dir=DATA_PATH, out_path=str(out), workers=2)
+
+    assert counts["skipped"] == 5
+    assert len(stub_provider.requests) - requests_before == len(lines) - 5
+    records = read_records(out)
+    assert len(records) == len(lines)
+    assert len({(r["patient_id"], r["claim_id"]) for r in records}) == len(lines)
+
+
+def test_resume_replaces_failure_records(stub_provider, tmp_path):
+    """A failed unit is retried on resume and keeps a single record."""
+    out = tmp_path / "results.jsonl"
+    run_batch(option="summary", input_dir=DATA_PATH, out_path=str(out), workers=2)
+    records = read_records(out)
+    failed = dict(records[0], result=None, error="HTTP 503")
+    out.write_text("".join(json.dumps(record) + "\n" for record in [failed] + records[1:]))
+
+    counts = run_batch(option="summary", input_dir=DATA_PATH, out_path=str(out), workers=2)
+
+    assert counts == {"processed": 1, "failed": 0, "skipped": len(records) - 1}
+    resumed = read_records(out)
+    assert len(resumed) == len(records)
+    assert all(record["error"] is None for record in resumed)
+    assert not (tmp_path / "results.jsonl.tmp").exists()
+
+
+def test_resume_is_keyed_by_option_and_question(stub_provider, tmp_path):
+    """Another option or question into the same out file runs every unit; only a true rerun skips them."""
+    out = tmp_path / "results.jsonl"
+    total = len(list(iter_units(DATA_PATH, "summary")))
+    run_batch(option="summary", input_dir=DATA_PATH, out_path=str(out), workers=2)
+    first = dict(read_records(out)[0], result=None, error="HTTP 503")
+    with out.open("a") as file:
+        file.write(json.dumps(first) + "\n")
+
+    for question in ("Why was the visit needed?", "Was a follow up planned?"):
+        counts = run_batch(option="qa", input_dir=DATA_PATH, out_path=str(out), question=question, workers=2)
+        assert counts == {"processed": total, "failed": 0, "skipped": 0}
+    counts = run_batch(option="qa", input_dir=DATA_PATH, out_path=str(out), question="Was a follow up planned?")
+    assert counts == {"processed": 0, "failed": 0, "skipped": total}
+
+    records = read_records(out)
+    # The summary failure record belongs to another run and is kept until a summary run retries it
+    assert len(records) == 3 * total + 1
+    assert {(r["option"], r["question"]) for r in records} == {
+        ("summary", None), ("qa", "Why was the visit needed?"), ("qa", "Was a follow up planned?")}
@@ -0,0 +1,109 @@
+import asyncio
+import json
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from src.async_pipeline import AsyncPipeline
+from src.batched_qa import BatchedQA, parse_batch
+from src.clients import ClientProvider
+from src.prompt_builder import PromptBuilder
+from src.utils.stub_server import StubInferenceServer
+
+CLAIMS = [{"claim_id": f"CLM{i}", "primary_diagnosis": "Asthma", "Clinical_note": f"Visit {i} for asthma."}
+          for i in range(20)]
+
+
+def chat_response(content):
+    return MagicMock(choices=[MagicMock(message=MagicMock(content=content))])
+
+
+def answer_every_question(backend, method, messages, **kwargs):
+    "A model that answers each numbered question of the batch with its claim's diagnosis"
+    ids = [int(line[1:line.index("]")]) for line in messages[1]["content"].splitlines() if line.startswith("[")]
+    return chat_response(json.dumps([{"id": i, "answer": f"answer {i}", "reasoning": "from claim"} for i in ids]))
+
+
+@pytest.fixture
+def provider():
+    provider = MagicMock()
+    provider.call.side_effect = answer_every_question
+    return provider
+
+
+def test_same_question_across_claims_uses_few_calls(provider):
+    """Twenty claims are answered in ceil(20 / max_items) chat completions, in input order."""
+    batched_qa = BatchedQA(client_provider=provider, max_items=8)
+    results = batched_qa.ask_claims(CLAIMS, "What is the diagnosis?")
+    assert provider.call.call_count == 3
+    assert [result["claim_id"] for result in results] == [claim["claim_id"] for claim in CLAIMS]
+    assert results[5] == {"claim_id": "CLM5", "question": "What is the diagnosis?",
+                          "answer": "answer 5", "reasoning": "from claim"}
+
+
+def test_batches_adapt_to_the_token_budget(provider):
+    """A smaller prompt budget packs fewer claims per call."""
+    small = BatchedQA(client_provider=provider, max_items=8,
+                      prompt_builder=PromptBuilder(max_tokens=400))
+    sections, batches = small.plan(CLAIMS, [(i, "What is the diagnosis?") for i in range(20)])
+    assert len(batches) > 3
+    for batch in batches:
+        messages = small.build_messages(sections, [(i, "What is the diagnosis?") for i in range(20)], batch)
+        assert small.prompt_builder.count(messages[0]["content"] + messages[1]["content"]) <= 400
+
+
+def test_unparseable_batch_is_split_and_retried(provider):
+    """A response that is not a JSON array splits the batch in half and retries both halves."""
+    responses = iter([chat_response("Sorry, here are the answers: ...")])
+    provider.call.side_effect = lambda *args, **kwargs: next(responses, None) or answer_every_question(*args, **kwargs)
+    batched_qa = BatchedQA(client_provider=provider, max_items=8)
+    results = batched_qa.ask_claims(CLAIMS[:8], "What is the diagnosis?")
+    assert all(result["answer"] == f"answer {i}" for i, result in enumerate(results))
+    assert provider.call.call_count == 3
+    assert batched_qa.stats() == {"batches": 3, "splits": 1, "fallbacks": 0, "failures": 0}
+
+
+def test_a_failed_batch_keeps_the_other_answers(provider):
+    """A call that still fails after retries leaves only its own batch unanswered, sync and async."""
+    def fail_second_batch(backend, method, messages, **kwargs):
+        if "CLM8" in messages[1]["content"]:
+            raise RuntimeError("HTTP 503")
+        return answer_every_question(backend, method, messages, **kwargs)
+
+    provider.call.side_effect = fail_second_batch
+    provider.acall = AsyncMock(side_effect=fail_second_batch)
+    batched_qa = BatchedQA(client_provider=provider, max_items=8)
+    items = [(position, "What is the diagnosis?") for position in range(20)]
+    for results in (batched_qa.answer_many(CLAIMS, items), asyncio.run(batched_qa.aanswer_many(CLAIMS, items))):
+        assert [result["answer"] for result in results[:8] + results[16:]] == [
+            f"answer {i}" for i in list(range(8)) + list(range(16, 20))]
+        assert all(result["answer"] is None for result in results[8:16])
+    assert batched_qa.stats()["failures"] == 2
+
+
+def test_single_question_falls_back_to_plain_call():
+    """A lone question whose batched answer never parses is asked the regular way."""
+    provider = MagicMock()
+    provider.call.side_effect = [chat_response("not json"),
+                                 chat_response('{"answer": "Asthma", "reasoning": "diagnosis field"}')]
+    batched_qa = BatchedQA(client_provider=provider)
+    results = batched_qa.ask_questions(CLAIMS[0], ["What is the diagnosis?"])
+    assert results[0]["answer"] == "Asthma"
+    assert batched_qa.stats()["fallbacks"] == 1
+
+
+def test_parse_batch_accepts_fenced_json_and_ignores_unknown_ids():
+    content = '```json\n[{"id": 0, "answer": "a"}, {"id": 7, "answer": "b"}, "junk"]\n```'
+    assert parse_batch(content, [0, 1]) == {0: {"id": 0, "answer": "a"}}
+    with pytest.raises(ValueError):
+        parse_batch('{"answer": "a"}', [0])
+
+
+def test_async_pipeline_batches_advanced_qa_questions():
+    """Batched mode answers many questions about a claim in one chat completion."""
+    with StubInferenceServer() as server:
+        provider = ClientProvider(endpoint_url=server.url, max_retries=0)
+        async_pipeline = AsyncPipeline(patient_id="PA-12345", client_provider=provider)
+        questions = [f"Question {i}?" for i in range(6)]
+        result = async_pipeline.answer_many_sync(CLAIMS[0], questions, options=("advanced_qa",),
+                                                 summary=False, batched=True)
+        assert all(answer["advanced_qa"] == ("stub answer", "stub reasoning") for answer in result["answers"])
+        assert len(server.requests) == 1
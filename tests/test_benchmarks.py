@@ -0,0 +1,82 @@
+import json
+import os
+import time
+import pytest
+from urllib.request import Request, urlopen
+from benchmarks.bench_pipeline import compare, run_suite
+from benchmarks.bench_startup import LOCAL_OPTIONS, STARTUP_BUDGET_MS, import_times, startup_profile
+from benchmarks.corpus import build_corpus, patient_ids
+from src.pipeline import OPTIONS
+from src.utils.stub_server import StubInferenceServer
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    pytest.importorskip("faker")
+    path = str(tmp_path / "corpus")
+    build_corpus(path, 12, claims_per_patient=4, seed=7)
+    return path
+
+
+def claim_details(path):
+    details = {}
+    for patient_id in patient_ids(path):
+        for claim_id in os.listdir(os.path.join(path, patient_id)):
+            with open(os.path.join(path, patient_id, claim_id, "claim_details.json")) as f:
+                details[(patient_id, claim_id)] = json.load(f)
+    return details
+
+
+def test_corpus_is_deterministic_per_seed(corpus, tmp_path):
+    """The same seed gives the same claims; a second build of the same directory is reused."""
+    assert len(claim_details(corpus)) == 12 and len(patient_ids(corpus)) == 3
+    other = str(tmp_path / "other")
+    build_corpus(other, 12, claims_per_patient=4, seed=7)
+    assert claim_details(other) == claim_details(corpus)
+    assert build_corpus(corpus, 12, claims_per_patient=4, seed=7)["patients"] == 3
+
+
+def test_suite_runs_end_to_end(corpus):
+    """Every stage reports metrics against the stub on a tiny corpus."""
+    metrics = run_suite(corpus, samples=2, concurrency=(1, 2), requests=4)
+    assert metrics["ingest_cold_claims_per_s"] > 0
+    for option in ("qa", "advanced_qa", "summary", "analysis", "history_qa"):
+        assert metrics[f"{option}_p95_ms"] >= metrics[f"{option}_p50_ms"] > 0
+    assert metrics["concurrency_2_requests_per_s"] > 0
+
+
+def test_compare_flags_regressions_beyond_tolerance():
+    baseline = {"ingest_cold_claims_per_s": 1000.0, "qa_p95_ms": 100.0, "analysis_p50_ms": 1.0}
+    assert compare({"ingest_cold_claims_per_s": 900.0, "qa_p95_ms": 120.0, "analysis_p50_ms": 2.5},
+                   baseline, tolerance=0.25) == []
+    regressions = compare({"ingest_cold_claims_per_s": 700.0, "qa_p95_ms": 130.0, "analysis_p50_ms": 1.0},
+                          baseline, tolerance=0.25)
+    assert [regression.split(":")[0] for regression in regressions] == ["ingest_cold_claims_per_s", "qa_p95_ms"]
+
+
+def test_stub_latency_delays_responses():
+    with StubInferenceServer(latency=0.05, jitter=0.01, seed=1) as stub:
+        request = Request(f"{stub.url}/summarization", data=b"{}", headers={"Content-Type": "application/json"})
+        start = time.perf_counter()
+        with urlopen(request, timeout=5) as response:
+            assert json.loads(response.read())[0]["summary_text"] == "stub summary"
+        assert time.perf_counter() - start >= 0.05
+
+
+def test_local_options_start_without_backends(tmp_path):
+    """Local options never import the inference backends and stay within the startup budget."""
+    claim_dir = tmp_path / "claim" / "P-1" / "CLM1"
+    claim_dir.mkdir(parents=True)
+    (claim_dir / "claim_details.json").write_text(json.dumps({"claim_id": "CLM1", "claim_date": "2025-01-01"}))
+    for option in LOCAL_OPTIONS:
+        profile = startup_profile(option, "P-1", str(tmp_path / "claim"))
+        assert profile["backend_modules"] == [], option
+        assert profile["import_ms"] < STARTUP_BUDGET_MS, profile
+
+
+def test_backends_load_only_when_dispatched():
+    """Importing the CLI registers every option without importing a model backend."""
+    times = import_times("import main")
+    assert "src.pipeline" in times
+    assert set(OPTIONS) == {"qa", "advanced_qa", "summary", "history_qa", "patient_qa", "analysis"}
+    assert not {"src.clients", "src.abstractive_qa", "src.summary", "huggingface_hub"} & times.keys()
@@ -0,0 +1,144 @@
+import json
+import os
+import pytest
+from unittest.mock import patch
+from src.claim_archive import ClaimArchive, archive_path, convert_directory, open_archive, write_archive
+from src.data_ingestion import DataIngestion
+
+DETAILS = {
+    "claim_id": "CLM1",
+    "claim_date": "2025-07-17",
+    "patient_info": {"patient_id": "P-1", "first_name": "Katelyn"},
+    "provider_name": "Dr. David Chen (Pulmonology)",
+    "primary_diagnosis": "Asthma",
+    "icd_code": "J45.909",
+    "procedure_description": "Spirometry",
+    "cpt_code": "94010",
+    "financials": {"billed_amount": 2662.08, "allowed_amount": 2004.7, "copay": 50.0, "insurance_paid": 1954.7},
+}
+
+
+@pytest.fixture
+def data_root(tmp_path):
+    root = tmp_path / "claim"
+    unusual = {"claim_id": "CLM2", "financials": {"copay": 25}, "notes": ["x"], "provider_name": None}
+    for details in (DETAILS, unusual):
+        claim_dir = root / "P-1" / details["claim_id"]
+        claim_dir.mkdir(parents=True)
+        (claim_dir / "claim_details.json").write_text(json.dumps(details))
+        (claim_dir / "claim_text_data.txt").write_text(f"Note for {details['claim_id']} – café")
+    return root
+
+
+def test_round_trip_preserves_claims(data_root, tmp_path):
+    """Archived claims decode to exactly what the folders contain, including odd fields."""
+    convert_directory(str(data_root), str(tmp_path / "archive"))
+    archive = ClaimArchive(archive_path(str(tmp_path / "archive"), "P-1"))
+    folders = DataIngestion(patient_id="P-1", data_path=str(data_root))
+
+    assert archive.claim_ids() == ["CLM1", "CLM2"]
+    for claim_id in archive.claim_ids():
+        expected = folders.ingest_claim_data(claim_id)
+        assert archive.claim(claim_id) == expected
+        assert list(archive.claim(claim_id)) == list(expected)
+    assert "Clinical_note" not in archive.details("CLM1")
+
+
+def test_repeated_strings_are_stored_once(tmp_path):
+    path = str(tmp_path / "P-1.claims")
+    claims = [(f"CLM{i}", dict(DETAILS, claim_id=f"CLM{i}"), "note") for i in range(50)]
+    write_archive(path, claims)
+    archive = ClaimArchive(path)
+    assert archive.strings.count("Dr. David Chen (Pulmonology)") == 1
+    assert archive.details("CLM49")["financials"]["insurance_paid"] == 1954.7
+
+
+def test_data_ingestion_prefers_archive_and_falls_back_to_folders(data_root, tmp_path):
+    archive_dir = tmp_path / "archive"
+    config = {"DATA_PATH": str(data_root), "ARCHIVE_PATH": str(archive_dir)}
+    with patch("src.data_ingestion.read_config", side_effect=lambda key, default=None: config.get(key, default)):
+        folders_only = DataIngestion(patient_id="P-1").ingest_patient_data()
+        convert_directory(str(data_root), str(archive_dir))
+        ingestion = DataIngestion(patient_id="P-1")
+        with patch.object(ingestion.claim_index, "iter_claims") as index_claims:
+            assert ingestion.ingest_patient_data() == folders_only
+            index_claims.assert_not_called()
+        assert DataIngestion(patient_id="P-2").ingest_patient_data() == []
+
+
+def test_folders_changed_after_packing_make_the_archive_stale(data_root, tmp_path):
+    """A claim folder added after conversion is seen by patient-level and single-claim reads alike."""
+    archive_dir = tmp_path / "archive"
+    config = {"DATA_PATH": str(data_root), "ARCHIVE_PATH": str(archive_dir)}
+    with patch("src.data_ingestion.read_config", side_effect=lambda key, default=None: config.get(key, default)):
+        convert_directory(str(data_root), str(archive_dir))
+        claim_dir = data_root / "P-1" / "CLM3"
+        claim_dir.mkdir()
+        (claim_dir / "claim_details.json").write_text(json.dumps(dict(DETAILS, claim_id="CLM3")))
+        (claim_dir / "claim_text_data.txt").write_text("Note for CLM3")
+        archive_mtime = os.stat(archive_path(str(archive_dir), "P-1")).st_mtime_ns
+        os.utime(data_root / "P-1", ns=(archive_mtime, archive_mtime + 1_000_000))
+
+        ingestion = DataIngestion(patient_id="P-1")
+        assert [claim["claim_id"] for claim in ingestion.ingest_patient_data()] == ["CLM1", "CLM2", "CLM3"]
+        assert ingestion.ingest_claim_data("CLM3")["Clinical_note"] == "Note for CLM3"
+
+
+def test_replaced_archive_keeps_the_old_reader_usable(tmp_path):
+    """A thread still iterating the old reader can finish after the file is replaced."""
+    path = str(tmp_path / "P-1.claims")
+    write_archive(path, [("CLM1", DETAILS, "note"), ("CLM2", DETAILS, "note 2")])
+    first = open_archive(path)
+    claims = first.iter_claims()
+    assert next(claims)["Clinical_note"] == "note"
+    write_archive(path, [("CLM1", DETAILS, "new note")])
+    os.utime(path, ns=(first.mtime_ns, first.mtime_ns + 1_000_000))
+    second = open_archive(path)
+    assert second is not first and second.note("CLM1") == "new note"
+    assert next(claims)["Clinical_note"] == "note 2" and first.details("CLM1") == DETAILS
+
+
+def test_claims_edited_in_place_make_the_archive_stale(data_root, tmp_path):
+    """Editing claim_details.json leaves the patient folder mtime alone but still wins over the archive."""
+    archive_dir = tmp_path / "archive"
+    config = {"DATA_PATH": str(data_root), "ARCHIVE_PATH": str(archive_dir)}
+    with patch("src.data_ingestion.read_config", side_effect=lambda key, default=None: config.get(key, default)):
+        convert_directory(str(data_root), str(archive_dir))
+        archive_mtime = os.stat(archive_path(str(archive_dir), "P-1")).st_mtime_ns
+        for path in (data_root / "P-1", data_root / "P-1" / "CLM1", data_root / "P-1" / "CLM2"):
+            os.utime(path, ns=(archive_mtime, archive_mtime - 1_000_000))
+        ingestion = DataIngestion(patient_id="P-1")
+        assert ingestion.uses_archive()
+
+        details_path = data_root / "P-1" / "CLM1" / "claim_details.json"
+        details_path.write_text(json.dumps(dict(DETAILS, provider_name="Dr. Edited")))
+        os.utime(details_path, ns=(archive_mtime, archive_mtime + 1_000_000))
+        assert not ingestion.uses_archive()
+        assert ingestion.ingest_claim_data("CLM1")["provider_name"] == "Dr. Edited"
+
+
+def test_iter_patient_claims_reads_only_requested_fields(data_root, tmp_path):
+    """Field projection skips the clinical note in both the folder and archive layouts."""
+    archive_dir = tmp_path / "archive"
+    config = {"DATA_PATH": str(data_root), "ARCHIVE_PATH": str(archive_dir)}
+    with patch("src.data_ingestion.read_config", side_effect=lambda key, default=None: config.get(key, default)):
+        from_folders = list(DataIngestion(patient_id="P-1").iter_patient_claims(fields=("claim_id", "financials")))
+        convert_directory(str(data_root), str(archive_dir))
+        ingestion = DataIngestion(patient_id="P-1")
+        with patch("src.claim_archive.ClaimArchive.note") as note:
+            from_archive = list(ingestion.iter_patient_claims(fields=("claim_id", "financials")))
+            note.assert_not_called()
+    assert from_folders == from_archive == [
+        {"claim_id": "CLM1", "financials": DETAILS["financials"]},
+        {"claim_id": "CLM2", "financials": {"copay": 25}},
+    ]
+
+
+def test_iter_patient_claims_raises_on_a_failed_read(data_root):
+    """A claim that cannot be read ends the stream with its error, not silently."""
+    ingestion = DataIngestion(patient_id="P-1", data_path=str(data_root))
+    claims = ingestion.iter_patient_claims()
+    assert next(claims)["claim_id"] == "CLM1"
+    os.remove(data_root / "P-1" / "CLM2" / "claim_text_data.txt")
+    with pytest.raises(FileNotFoundError):
+        next(claims)
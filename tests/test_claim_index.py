@@ -0,0 +1,96 @@
+import json
+import os
+import pytest
+from src.claim_index import ClaimIndex
+
+
+def write_claim(root, patient_id, claim_id, paid=100.0):
+    claim_dir = root / patient_id / claim_id
+    claim_dir.mkdir(parents=True)
+    details = {
+        "claim_id": claim_id,
+        "provider_name": "Dr. Test",
+        "primary_diagnosis": "Asthma",
+        "financials": {"billed_amount": 200.0, "allowed_amount": 150.0, "copay": 50.0, "insurance_paid": paid},
+    }
+    (claim_dir / "claim_details.json").write_text(json.dumps(details))
+    (claim_dir / "claim_text_data.txt").write_text(f"Note for {claim_id}")
+    return claim_dir
+
+
+@pytest.fixture
+def data_root(tmp_path):
+    root = tmp_path / "claim"
+    write_claim(root, "P-1", "CLM1")
+    write_claim(root, "P-1", "CLM2")
+    return root
+
+
+def test_claims_are_indexed_with_structured_fields(data_root, tmp_path):
+    """Refreshing a patient stores pre-parsed fields for every claim."""
+    index = ClaimIndex(str(data_root), str(tmp_path / "index.sqlite"))
+    rows = index.claims("P-1")
+    assert [row["claim_id"] for row in rows] == ["CLM1", "CLM2"]
+    assert rows[0]["insurance_paid"] == 100.0
+    assert rows[0]["provider_name"] == "Dr. Test"
+    assert rows[0]["note_length"] == len("Note for CLM1")
+
+
+def test_new_claim_folders_are_picked_up_incrementally(data_root, tmp_path):
+    """Only added or removed folders are touched on refresh."""
+    index = ClaimIndex(str(data_root), str(tmp_path / "index.sqlite"))
+    index.claims("P-1")
+    write_claim(data_root, "P-1", "CLM3")
+    changes = index.refresh_patient("P-1")
+    assert changes == {"added": ["CLM3"], "removed": [], "changed": []}
+    assert index.refresh_patient("P-1") == {"added": [], "removed": [], "changed": []}
+
+
+def test_details_edited_in_place_are_reread(data_root, tmp_path):
+    """Patient-level reads see an edit that does not change the patient folder."""
+    from src.data_ingestion import DataIngestion
+    index = ClaimIndex(str(data_root), str(tmp_path / "index.sqlite"))
+    assert index.claims("P-1")[0]["billed_amount"] == 200.0
+    details_path = data_root / "P-1" / "CLM1" / "claim_details.json"
+    details = json.loads(details_path.read_text())
+    details["financials"]["billed_amount"] = 999.0
+    mtime_ns = details_path.stat().st_mtime_ns
+    details_path.write_text(json.dumps(details))
+    os.utime(details_path, ns=(mtime_ns, mtime_ns + 1_000_000))
+
+    assert index.refresh_patient("P-1") == {"added": [], "removed": [], "changed": ["CLM1"]}
+    assert index.claims("P-1")[0]["billed_amount"] == 999.0
+
+    ingestion = DataIngestion(patient_id="P-1", data_path=str(data_root))
+    assert ingestion.ingest_patient_data()[0]["financials"]["billed_amount"] == 999.0
+    details["financials"]["billed_amount"] = 555.0
+    details_path.write_text(json.dumps(details))
+    os.utime(details_path, ns=(mtime_ns, mtime_ns + 2_000_000))
+    assert DataIngestion(patient_id="P-1", data_path=str(data_root)).ingest_patient_data()[0]["financials"][
+        "billed_amount"] == 555.0
+
+
+def test_get_claim_indexes_single_claim_on_demand(data_root, tmp_path):
+    """A single-claim lookup works without scanning the patient folder."""
+    index = ClaimIndex(str(data_root), str(tmp_path / "index.sqlite"))
+    row = index.get_claim("P-1", "CLM2")
+    assert row["claim_id"] == "CLM2"
+    assert index.get_claim("P-1", "CLM404") is None
+
+
+def test_index_persists_across_instances(data_root, tmp_path):
+    """A second process reuses the on-disk index."""
+    index_path = str(tmp_path / "index.sqlite")
+    ClaimIndex(str(data_root), index_path).claims("P-1")
+    reopened = ClaimIndex(str(data_root), index_path)
+    assert reopened.refresh_patient("P-1") == {"added": [], "removed": [], "changed": []}
+    assert reopened.claim_ids("P-1") == ["CLM1", "CLM2"]
+
+
+def test_iter_claims_pages_through_all_claims(data_root, tmp_path):
+    """Streaming yields every claim in order across page boundaries."""
+    write_claim(data_root, "P-1", "CLM3")
+    index = ClaimIndex(str(data_root), str(tmp_path / "index.sqlite"))
+    rows = list(index.iter_claims("P-1", columns=("insurance_paid",), batch_size=2))
+    assert [row["claim_id"] for row in rows] == ["CLM1", "CLM2", "CLM3"]
+    assert rows[0].keys() == ["claim_id", "insurance_paid"]
@@ -0,0 +1,58 @@
+import pytest
+from unittest.mock import MagicMock
+from src.clients import BACKEND_CHAT, BACKEND_SUMMARIZATION, ClientProvider
+from src.abstractive_qa import AbstractiveQA
+from src.summary import Summarization
+from src.utils.stub_server import StubInferenceServer
+
+
+class TransientError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.response = MagicMock(status_code=status_code)
+
+
+@pytest.fixture
+def stub_server():
+    with StubInferenceServer() as server:
+        yield server
+
+
+def test_clients_are_created_once_per_backend():
+    """Repeated calls reuse the same long-lived client."""
+    factory = MagicMock()
+    provider = ClientProvider(client_factory=factory, timeouts={BACKEND_CHAT: 5})
+    assert provider.get_client(BACKEND_CHAT) is provider.get_client(BACKEND_CHAT)
+    factory.assert_called_once_with(provider=None, api_key=None, timeout=5)
+
+
+def test_call_retries_transient_errors():
+    """429/5xx responses are retried with backoff, then succeed."""
+    factory = MagicMock()
+    factory.return_value.summarization.side_effect = [TransientError(503), TransientError(429), "summary"]
+    provider = ClientProvider(client_factory=factory, backoff_seconds=0)
+    assert provider.call(BACKEND_SUMMARIZATION, "summarization", text="note", model="m") == "summary"
+    assert provider.retries == 2
+
+
+def test_call_does_not_retry_client_errors():
+    """A 400 is raised immediately."""
+    factory = MagicMock()
+    factory.return_value.summarization.side_effect = TransientError(400)
+    provider = ClientProvider(client_factory=factory, backoff_seconds=0)
+    with pytest.raises(TransientError):
+        provider.call(BACKEND_SUMMARIZATION, "summarization", text="note", model="m")
+    assert provider.retries == 0
+
+
+def test_wrappers_run_against_stub_server(stub_server):
+    """The real InferenceClient talks to the local stub through an injected provider."""
+    provider = ClientProvider(endpoint_url=stub_server.url, max_retries=0)
+    answer = AbstractiveQA(claim_data="Claim text", client_provider=provider).qa("Who is the doctor?")
+    assert answer == ("stub answer", "stub reasoning")
+    summary = Summarization(client_provider=provider).summarize(claim_data="Claim text")
+    assert summary.summary_text == "stub summary"
+    assert [path for path, _ in stub_server.requests] == [
+        "/chat/meta-llama/Meta-Llama-3-70B-Instruct/v1/chat/completions",
+        "/summarization/facebook/bart-large-cnn",
+    ]
@@ -0,0 +1,51 @@
+import os
+import pytest
+from src.config import ConfigStore
+
+
+@pytest.fixture
+def config_file(tmp_path):
+    path = tmp_path / "config.yaml"
+    path.write_text('DATA_PATH: "data/claim"\nLLM_MODEL: "model-a"\n')
+    return path
+
+
+def test_snapshot_is_parsed_once(config_file):
+    """Repeated lookups reuse the parsed snapshot without re-reading the file."""
+    store = ConfigStore(path=str(config_file), check_interval=60)
+    for _ in range(100):
+        assert store.get("LLM_MODEL") == "model-a"
+    assert store.stats() == {"parses": 1, "lookups": 100, "mtime_checks": 0}
+
+
+def test_snapshot_is_frozen(config_file):
+    """Snapshots are immutable and expose typed fields."""
+    store = ConfigStore(path=str(config_file))
+    snapshot = store.snapshot()
+    assert snapshot.data_path == "data/claim"
+    with pytest.raises(Exception):
+        snapshot.llm_model = "other"
+    with pytest.raises(TypeError):
+        snapshot.values["LLM_MODEL"] = "other"
+
+
+def test_reload_on_mtime_change(config_file):
+    """A changed file is picked up once the check interval elapses."""
+    store = ConfigStore(path=str(config_file), check_interval=0)
+    assert store.get("LLM_MODEL") == "model-a"
+    assert store.get("LLM_MODEL") == "model-a"
+    assert store.stats()["parses"] == 1
+
+    config_file.write_text('LLM_MODEL: "model-b"\n')
+    stat = os.stat(config_file)
+    os.utime(config_file, (stat.st_atime, stat.st_mtime + 10))
+    assert store.get("LLM_MODEL") == "model-b"
+    assert store.stats()["parses"] == 2
+
+
+def test_explicit_reload(config_file):
+    """reload() re-parses even when the mtime is unchanged."""
+    store = ConfigStore(path=str(config_file), check_interval=60)
+    store.snapshot()
+    store.reload()
+    assert store.stats()["parses"] == 2
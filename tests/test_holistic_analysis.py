@@ -0,0 +1,79 @@
+import pytest
+from src.holistic_analysis import HolisticAnalysis
+from src.portfolio_analysis import PortfolioAnalysis
+
+
+def make_claim(patient_id, claim_id, diagnosis, provider, billed, allowed, copay, date="2025-07-01"):
+    return {
+        "claim_id": claim_id,
+        "claim_date": date,
+        "patient_info": {"patient_id": patient_id, "first_name": "Ann", "last_name": "Lee"},
+        "provider_name": provider,
+        "primary_diagnosis": diagnosis,
+        "financials": {"billed_amount": billed, "allowed_amount": allowed, "copay": copay,
+                       "insurance_paid": round(allowed - copay, 2)},
+    }
+
+
+@pytest.fixture
+def claims():
+    return [
+        make_claim("P-1", "CLM1", "Asthma", "Dr. A", 1000.0, 800.0, 25.0, "2025-06-03"),
+        make_claim("P-1", "CLM2", "Asthma", "Dr. B", 2000.0, 1500.0, 50.0, "2025-07-09"),
+        make_claim("P-1", "CLM3", "Migraine", "Dr. A", 1500.0, 1100.0, 75.0, "2025-07-20"),
+    ]
+
+
+def test_analysis_returns_structured_report(claims):
+    report = HolisticAnalysis().analysis(claims)
+    assert report["patient_id"] == "P-1"
+    assert report["total_copay"] == 150.0
+    assert report["total_allowed_amount"] == 3400.0
+    assert report["total_insurance_paid"] == 3250.0
+    assert report["providers"] == ["Dr. A", "Dr. B"]
+    assert report["diagnosis_counts"] == {"Asthma": 2, "Migraine": 1}
+    assert report["total_claims_count"] == 3
+    assert [trend["period"] for trend in report["trends"]] == ["2025-06", "2025-07"]
+    assert "Total Copay: 150.0" in HolisticAnalysis.format_report(report)
+
+
+def test_portfolio_aggregates_across_patients(claims):
+    claims.append(make_claim("P-2", "CLM4", "Asthma", "Dr. C", 500.0, 400.0, 25.0))
+    portfolio = PortfolioAnalysis.from_claims(claims)
+    summary = portfolio.patient_summary()
+    assert summary.loc["P-1", "claims"] == 3
+    assert summary.loc["P-2", "insurance_paid"] == 375.0
+    assert portfolio.report()["patients_count"] == 2
+
+
+def test_outliers_flag_unusual_billed_to_allowed_ratio(claims):
+    claims = [make_claim("P-1", f"CLM{i}", "Asthma", "Dr. A", 1000.0 + i, 800.0, 25.0) for i in range(20)]
+    claims.append(make_claim("P-1", "CLM-X", "Asthma", "Dr. A", 9000.0, 800.0, 25.0))
+    outliers = PortfolioAnalysis.from_claims(claims).outliers()
+    assert list(outliers["claim_id"]) == ["CLM-X"]
+
+
+def test_analysis_consumes_a_generator_once(claims):
+    """A streamed iterable gives the same report as the full list."""
+    expected = HolisticAnalysis().analysis(claims)
+    assert HolisticAnalysis().analysis(claim for claim in claims) == expected
+    assert HolisticAnalysis().analysis(iter([])) is None
+
+
+def test_streamed_report_matches_vectorized_portfolio(claims):
+    """Single-pass aggregates agree with the pandas implementation."""
+    claims = [make_claim("P-1", f"CLM{i}", "Asthma", "Dr. A", 1000.0 + i, 800.0, 25.0) for i in range(20)]
+    claims.append(make_claim("P-1", "CLM-X", "Asthma", "Dr. A", 9000.0, 800.0, 25.0))
+    report = HolisticAnalysis().analysis(iter(claims))
+    portfolio = PortfolioAnalysis.from_claims(claims)
+    assert report["percentiles"] == portfolio.percentiles()
+    assert report["outliers"] == portfolio.outliers().to_dict(orient="records")
+    assert report["trends"] == portfolio.trends().reset_index(names="period").to_dict(orient="records")
+
+
+def test_analysis_of_a_failed_stream_is_not_a_partial_report(claims):
+    def failing():
+        yield from claims[:2]
+        raise OSError("claim unreadable")
+
+    assert HolisticAnalysis().analysis(failing()) is None
@@ -0,0 +1,51 @@
+import json
+import os
+import pytest
+from datetime import date
+
+pytest.importorskip("faker")
+from data_creation.insurance_data import generate_dataset, months_ago, plan_patients
+from src.claim_archive import archive_path, open_archive
+
+REFERENCE_DATE = date(2025, 3, 31)
+
+
+def read_tree(root):
+    files = {}
+    for directory, _, names in os.walk(root):
+        for name in names:
+            with open(os.path.join(directory, name)) as f:
+                files[os.path.relpath(os.path.join(directory, name), root)] = f.read()
+    return files
+
+
+def test_output_does_not_depend_on_workers_or_shards(tmp_path):
+    """A seed gives byte-identical files whether patients are generated serially or sharded over processes."""
+    serial = generate_dataset(str(tmp_path / "serial"), claims=40, seed=3, workers=1, reference_date=REFERENCE_DATE)
+    parallel = generate_dataset(str(tmp_path / "parallel"), claims=40, seed=3, workers=2, shard_size=3,
+                                reference_date=REFERENCE_DATE)
+    assert serial["claims"] == parallel["claims"] == 40
+    assert read_tree(tmp_path / "serial") == read_tree(tmp_path / "parallel")
+    other_seed = generate_dataset(str(tmp_path / "other"), claims=40, seed=4, workers=1, reference_date=REFERENCE_DATE)
+    assert other_seed["claims"] == 40 and read_tree(tmp_path / "other") != read_tree(tmp_path / "serial")
+
+
+def test_packed_layout_matches_directories(tmp_path):
+    generate_dataset(str(tmp_path / "dirs"), patients=3, seed=1, workers=1, reference_date=REFERENCE_DATE)
+    generate_dataset(str(tmp_path / "packed"), patients=3, seed=1, workers=1, layout="packed",
+                     reference_date=REFERENCE_DATE)
+    for patient_id in sorted(os.listdir(tmp_path / "dirs")):
+        archive = open_archive(archive_path(str(tmp_path / "packed"), patient_id))
+        claim_ids = sorted(os.listdir(tmp_path / "dirs" / patient_id))
+        assert archive.claim_ids() == claim_ids
+        for claim_id in claim_ids:
+            claim_dir = tmp_path / "dirs" / patient_id / claim_id
+            assert archive.details(claim_id) == json.loads((claim_dir / "claim_details.json").read_text())
+            assert archive.note(claim_id) == (claim_dir / "claim_text_data.txt").read_text()
+
+
+def test_plan_defaults_to_sample_patients_and_trims_to_claims():
+    assert [patient_id for _, patient_id, _, _ in plan_patients(seed=0)][:2] == ["PA-12345", "PB-24680"]
+    plan = plan_patients(claims=10, claims_per_patient=(4, 4))
+    assert [count for *_, count in plan] == [4, 4, 2]
+    assert months_ago(REFERENCE_DATE, 1) == date(2025, 2, 28)
@@ -0,0 +1,117 @@
+import json
+import os
+import shutil
+import numpy as np
+import pytest
+from src.claim_index import ClaimIndex
+from src.clients import ClientProvider
+from src.note_index import HashingEmbedder, NoteIndex
+from src.patient_qa import PatientQA
+from src.pipeline import Pipeline
+from src.utils.stub_server import StubInferenceServer
+
+NOTES = {
+    "CLM1": "Patient reports wheezing and shortness of breath. Albuterol inhaler was renewed for asthma.",
+    "CLM2": "Blood pressure 150/95 on review. Lisinopril 10mg was prescribed for hypertension.",
+    "CLM3": "Follow-up for migraine. Sumatriptan was started and a headache diary was advised.",
+}
+
+
+def write_claim(root, claim_id, note, date="2025-07-01"):
+    claim_dir = root / "P-1" / claim_id
+    claim_dir.mkdir(parents=True, exist_ok=True)
+    (claim_dir / "claim_details.json").write_text(json.dumps({"claim_id": claim_id, "claim_date": date}))
+    note_path = claim_dir / "claim_text_data.txt"
+    if note_path.exists():
+        # Make an in-place edit visible even on filesystems with coarse mtimes
+        stat = os.stat(note_path)
+        note_path.write_text(note)
+        os.utime(note_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    else:
+        note_path.write_text(note)
+
+
+@pytest.fixture
+def data_root(tmp_path):
+    root = tmp_path / "claim"
+    for claim_id, note in NOTES.items():
+        write_claim(root, claim_id, note)
+    return root
+
+
+@pytest.fixture
+def note_index(data_root, tmp_path):
+    return NoteIndex(ClaimIndex(str(data_root), str(tmp_path / "index.sqlite")), check_interval=0)
+
+
+def test_hashing_embedder_is_stable_and_normalized():
+    embedder = HashingEmbedder(dim=64)
+    vectors = embedder.embed(["blood pressure was high", "blood pressure was high", ""])
+    assert vectors.shape == (3, 64) and vectors.dtype == np.float32
+    assert np.allclose(np.linalg.norm(vectors[:2], axis=1), 1.0) and not vectors[2].any()
+    # crc32 features: the same text gets the same vector in every process
+    assert np.array_equal(vectors[0], HashingEmbedder(dim=64).embed(["blood pressure was high"])[0])
+
+
+def test_search_ranks_relevant_chunks_first(note_index):
+    hits = note_index.search("P-1", "Which medication was prescribed for blood pressure?", k=2)
+    assert len(hits) == 2
+    assert hits[0].claim_id == "CLM2" and "Lisinopril" in hits[0].text
+    assert hits[0].claim_date == "2025-07-01" and hits[0].score >= hits[1].score
+    assert note_index.search("P-2", "anything") == []
+
+
+def test_sync_embeds_only_changed_claims(note_index, data_root):
+    """Added, edited and removed notes are applied without re-embedding the rest."""
+    assert note_index.sync("P-1")["added"] == ["CLM1", "CLM2", "CLM3"]
+    assert note_index.sync("P-1") == {"added": [], "changed": [], "removed": []}
+
+    write_claim(data_root, "CLM4", "Insulin dose was adjusted for type 2 diabetes.")
+    write_claim(data_root, "CLM1", "Asthma is controlled. Montelukast was added at night.")
+    shutil.rmtree(data_root / "P-1" / "CLM3")
+    embedded = note_index.claims_embedded
+    assert note_index.sync("P-1") == {"added": ["CLM4"], "changed": ["CLM1"], "removed": ["CLM3"]}
+    assert note_index.claims_embedded - embedded == 2
+
+    assert note_index.search("P-1", "insulin for diabetes", k=1)[0].claim_id == "CLM4"
+    assert "CLM3" not in {hit.claim_id for hit in note_index.search("P-1", "migraine sumatriptan", k=4)}
+    assert "Montelukast" in note_index.search("P-1", "Montelukast", k=1)[0].text
+
+
+def test_index_persists_across_instances(note_index):
+    note_index.sync("P-1")
+    reopened = NoteIndex(note_index.claim_index, check_interval=0)
+    assert reopened.sync("P-1") == {"added": [], "changed": [], "removed": []}
+    assert reopened.search("P-1", "lisinopril", k=1)[0].claim_id == "CLM2"
+    assert reopened.chunks_embedded == 0
+
+
+def test_patient_qa_sends_only_top_chunks(note_index):
+    with StubInferenceServer() as stub:
+        provider = ClientProvider(endpoint_url=stub.url, max_retries=0)
+        patient_qa = PatientQA(patient_id="P-1", note_index=note_index, top_k=1, client_provider=provider)
+        assert patient_qa.qa("What was prescribed for hypertension?") == ("stub answer", "stub reasoning")
+        prompt = stub.requests[-1][1]["messages"][-1]["content"]
+    assert [hit.claim_id for hit in patient_qa.last_hits] == ["CLM2"]
+    assert "[Claim CLM2, 2025-07-01]" in prompt and "Albuterol" not in prompt
+
+
+def test_pipeline_patient_qa_option(data_root):
+    with StubInferenceServer() as stub:
+        provider = ClientProvider(endpoint_url=stub.url, max_retries=0)
+        pipeline = Pipeline(patient_id="P-1", data_path=str(data_root), client_provider=provider)
+        assert pipeline.pipeline("patient_qa", "Is the asthma inhaler renewed?") == ("stub answer", "stub reasoning")
+        assert pipeline.pipeline("patient_qa") == "No question received."
+
+
+def test_archived_patients_are_indexed_from_the_archive(data_root, tmp_path):
+    """With archive_dir, a patient packed into an archive (no claim folders) is still searchable."""
+    from src.claim_archive import convert_directory
+    convert_directory(str(data_root), str(tmp_path / "archive"))
+    empty = tmp_path / "empty"
+    empty.mkdir()
+    note_index = NoteIndex(ClaimIndex(str(empty), str(tmp_path / "index.sqlite")), check_interval=0,
+                           archive_dir=str(tmp_path / "archive"))
+    assert note_index.sync("P-1")["added"] == ["CLM1", "CLM2", "CLM3"]
+    assert note_index.search("P-1", "lisinopril for blood pressure", k=1)[0].claim_id == "CLM2"
+    assert note_index.sync("P-1") == {"added": [], "changed": [], "removed": []}
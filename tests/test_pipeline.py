@@ -0,0 +1,74 @@
+import asyncio
+import json
+import pytest
+from unittest.mock import AsyncMock, patch
+from src.pipeline import Pipeline
+
+
+@pytest.fixture
+def data_root(tmp_path):
+    root = tmp_path / "claim"
+    for claim_id in ("CLM1", "CLM2", "CLM3"):
+        claim_dir = root / "P-1" / claim_id
+        claim_dir.mkdir(parents=True)
+        (claim_dir / "claim_details.json").write_text(json.dumps({"claim_id": claim_id}))
+        (claim_dir / "claim_text_data.txt").write_text(f"Note for {claim_id}")
+    config = {"DATA_PATH": str(root), "CLAIM_INDEX_PATH": str(tmp_path / "index.sqlite")}
+    with patch("src.data_ingestion.read_config", side_effect=lambda key, default=None: config.get(key, default)):
+        yield root
+
+
+def test_construction_reads_no_files(data_root):
+    """Building a Pipeline does not ingest anything."""
+    with patch("src.data_ingestion.DataIngestion.ingest_patient_data") as ingest_patient:
+        Pipeline(patient_id="P-1", claim_id="CLM2")
+        ingest_patient.assert_not_called()
+
+
+def test_single_claim_option_touches_only_that_claim(data_root):
+    """A summary loads only the requested claim and memoizes it."""
+    pipeline = Pipeline(patient_id="P-1", claim_id="CLM2")
+    with patch("src.summary.Summarization") as summarization:
+        summarization.return_value.summarize.return_value = "summary"
+        assert pipeline.pipeline(option="summary") == "summary"
+        assert pipeline.files_touched == 2
+        assert pipeline._patient_data_loaded is False
+
+        pipeline.pipeline(option="summary")
+        assert pipeline.files_touched == 0
+
+
+def test_async_pipeline_counts_files_read_in_worker_threads(data_root):
+    """apipeline() reports the files its to_thread reads opened, like pipeline()."""
+    pipeline = Pipeline(patient_id="P-1")
+    assert asyncio.run(pipeline.apipeline(option="analysis"))["total_claims_count"] == 3
+    assert pipeline.files_touched == 3
+
+    pipeline = Pipeline(patient_id="P-1", claim_id="CLM2")
+    with patch("src.summary.Summarization") as summarization:
+        summarization.return_value.asummarize = AsyncMock(return_value="summary")
+        assert asyncio.run(pipeline.apipeline(option="summary")) == "summary"
+        assert pipeline.files_touched == 1
+        asyncio.run(pipeline.apipeline(option="summary"))
+        assert pipeline.files_touched == 0
+
+
+def test_analysis_streams_without_reading_notes(data_root):
+    """The analysis option streams structured fields and never opens clinical notes."""
+    pipeline = Pipeline(patient_id="P-1")
+    report = pipeline.pipeline(option="analysis")
+    assert report["total_claims_count"] == 3
+    assert pipeline.files_touched == 3
+    assert pipeline._patient_data_loaded is False
+    pipeline.pipeline(option="analysis")
+    assert pipeline.files_touched == 0
+
+
+def test_patient_data_is_loaded_once(data_root):
+    """Full patient data, notes included, is memoized on first access."""
+    pipeline = Pipeline(patient_id="P-1")
+    assert [claim["Clinical_note"] for claim in pipeline.patient_data] == [
+        "Note for CLM1", "Note for CLM2", "Note for CLM3"]
+    with patch.object(pipeline.data_ingestion, "ingest_patient_data") as ingest_patient:
+        pipeline.patient_data
+        ingest_patient.assert_not_called()
@@ -0,0 +1,86 @@
+import pytest
+from unittest.mock import MagicMock
+from src.prompt_builder import PromptBuilder, PromptRecord, TokenCounter
+from src.summary import Summarization
+
+SENTENCES = [f"Sentence {i} describes routine follow up findings for the patient." for i in range(40)]
+LONG_NOTE = " ".join(SENTENCES[:20] + ["The patient was prescribed Albuterol for wheezing."] + SENTENCES[20:])
+CLAIM = {
+    "claim_id": "CLM1",
+    "provider_name": "Dr. Smith",
+    "icd_code": None,
+    "financials": {"copay": 25.0, "billed_amount": 100.0},
+    "Clinical_note": LONG_NOTE,
+}
+
+
+@pytest.fixture
+def builder():
+    return PromptBuilder(max_tokens=200, chunk_tokens=60, overlap_tokens=20, field_max_tokens=8)
+
+
+def test_fields_are_flattened_and_empty_values_dropped(builder):
+    fields = builder.compact_fields(dict(CLAIM, procedure_description="word " * 50))
+    assert "financials.copay: 25.0" in fields
+    assert "icd_code" not in fields and "Clinical_note" not in fields
+    value = fields.splitlines()[-1].split(": ", 1)[1]
+    assert value.endswith(" ...")
+    assert builder.count(value[:-len(" ...")]) <= 8
+
+
+def test_chunks_respect_the_budget_and_overlap(builder):
+    chunks = builder.chunk(LONG_NOTE)
+    assert len(chunks) > 1
+    assert all(builder.count(chunk) <= 60 for chunk in chunks)
+    for previous, current in zip(chunks, chunks[1:]):
+        assert current.splitlines()[0] in previous.splitlines()
+    assert all(sentence in "\n".join(chunks) for sentence in SENTENCES)
+
+
+def test_qa_prompt_keeps_relevant_chunks_within_budget(builder):
+    record = PromptRecord("qa")
+    messages = builder.qa_messages("Answer in JSON.", CLAIM, "What medication was prescribed?", record)
+    user = messages[1]["content"]
+    assert "Albuterol" in user
+    assert "provider_name: Dr. Smith" in user
+    assert record.prompt_tokens <= 200
+    assert record.chunks > 1
+
+
+def test_qa_prompt_trims_fields_to_keep_the_best_note_chunk(builder):
+    record = PromptRecord("qa")
+    claim = dict(CLAIM, **{f"field_{i}": f"value {i}" for i in range(60)})
+    messages = builder.qa_messages("Answer in JSON.", claim, "What medication was prescribed?", record)
+    user = messages[1]["content"]
+    assert "Albuterol" in user
+    assert "field_59" not in user
+    assert record.truncated == ["fields", "note"] and record.tokens["note"] > 0
+    assert record.prompt_tokens <= 200
+
+    # A system prompt over the whole budget still keeps the top-ranked chunk
+    record = PromptRecord("qa")
+    messages = builder.qa_messages("word " * 250, claim, "What medication was prescribed?", record)
+    assert "Albuterol" in messages[1]["content"]
+    assert record.tokens["fields"] == 0 and record.truncated == ["fields", "note"]
+
+
+def test_long_summaries_are_map_reduced():
+    provider = MagicMock()
+    provider.call.side_effect = lambda backend, method, text, model: {"summary_text": f"part of {len(text)} chars"}
+    builder = PromptBuilder(chunk_tokens=60, overlap_tokens=15, counter=TokenCounter())
+    summarization = Summarization(client_provider=provider, prompt_builder=builder)
+    result = summarization.summarize(CLAIM)
+
+    record = summarization.last_record
+    assert result["summary_text"].startswith("part of")
+    assert record.chunks > 1
+    assert record.calls == provider.call.call_count > record.chunks
+    assert set(record.timings) == {"build", "map", "reduce"}
+    assert record.tokens["reduce"] > 0
+
+
+def test_short_summary_is_a_single_call():
+    provider = MagicMock()
+    summarization = Summarization(client_provider=provider, prompt_builder=PromptBuilder())
+    assert summarization.summarize("Short claim text.") is provider.call.return_value
+    assert summarization.last_record.calls == 1
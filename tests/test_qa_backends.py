@@ -0,0 +1,71 @@
+import pytest
+from src.extractive_qa import ExtractiveQA
+from src.qa_backends import RuleBasedQABackend, create_backend
+from src.retrieval import top_k_spans
+
+CLAIM = {
+    "claim_id": "CLM1",
+    "provider_name": "Dr. Ava Sharma (Cardiology)",
+    "icd_code": "I10",
+    "cpt_code": "93306",
+    "financials": {"billed_amount": 1200.5, "allowed_amount": 900.0, "copay": 25.0, "insurance_paid": 875.0},
+    "Clinical_note": "Patient was seen by Dr. Ava Sharma (Cardiology). The diagnosis code assigned is **I10**. "
+                     "Weather was mild. Total billed charges for this visit are $1200.50.",
+}
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("Who is the doctor?", "Dr. Ava Sharma (Cardiology)"),
+    ("What is the ICD code?", "I10"),
+    ("What is the CPT code?", "93306"),
+    ("How much did insurance pay?", "875.0"),
+])
+def test_rule_backend_answers_structured_questions(question, expected):
+    """The offline backend returns the span and its offsets in the context."""
+    extractive_qa = ExtractiveQA(claim_data=CLAIM, client_provider=object(), backend="rules")
+    answer = extractive_qa.qa(question)
+    assert answer.answer == expected
+    assert extractive_qa.claim_data[answer.start:answer.end] == expected
+
+
+@pytest.mark.parametrize("question, note, expected", [
+    ("Who treated the patient?", "Seen in clinic today by Dr Okafor. Vitals stable.", "Dr Okafor"),
+    ("What is the ICD code?", "Assessment: type 2 diabetes, ICD-10 E11.9, well controlled.", "E11.9"),
+    ("What were the charges?", "Total charges: $1,200.00 including imaging.", "1,200.00"),
+    ("What medication was prescribed?", "Patient was prescribed Metformin 500 mg twice daily.", "Metformin 500 mg"),
+    ("What was the diagnosis?", "Patient diagnosed with acute bronchitis, advised rest.", "acute bronchitis"),
+    ("What is the policy number?", "Policy number: XK-4492-01 verified at intake.", "XK-4492-01"),
+])
+def test_rule_backend_reads_free_text_notes(question, note, expected):
+    """Note patterns are not tied to the synthetic generator's sentences."""
+    assert RuleBasedQABackend().answer(question, note).answer == expected
+
+
+def test_rule_backend_reads_nested_fields_by_name():
+    """Nested fields are flattened to dotted names, so rules never depend on dict repr quoting."""
+    context = ExtractiveQA(claim_data=CLAIM, client_provider=object(), backend="rules").claim_data
+    assert "financials.copay: 25.0" in context and "'copay'" not in context
+    assert RuleBasedQABackend().answer("What is the copay?", context).answer == "25.0"
+
+
+def test_rule_backend_returns_none_when_no_rule_matches():
+    assert RuleBasedQABackend().answer("Is the weather nice?", "Weather was mild.") is None
+
+
+def test_retrieval_keeps_only_relevant_sentences():
+    """Top-k narrowing drops unrelated sentences but keeps the answer."""
+    context = ExtractiveQA(claim_data=CLAIM, client_provider=object(), backend="rules", top_k=2).context_for(
+        "What is the ICD code?")
+    assert "I10" in context
+    assert "Weather" not in context
+    assert len(context) < len(ExtractiveQA(claim_data=CLAIM, client_provider=object(), backend="rules").claim_data)
+
+
+def test_retrieval_falls_back_to_full_text_without_matches():
+    text = "First sentence. Second sentence. Third sentence. Fourth sentence."
+    assert top_k_spans("zebra?", text, k=2) == text
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        create_backend("gpu")
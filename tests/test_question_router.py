@@ -0,0 +1,61 @@
+import pytest
+from unittest.mock import patch
+from src.pipeline import Pipeline
+from src.question_router import QuestionRouter
+
+CLAIM = {
+    "claim_id": "CLM1",
+    "claim_date": "2025-07-17",
+    "patient_info": {"first_name": "Katelyn", "last_name": "Whitaker", "date_of_birth": "1957-01-09"},
+    "provider_name": "Dr. David Chen (Pulmonology)",
+    "primary_diagnosis": "Asthma",
+    "icd_code": "J45.909",
+    "financials": {"billed_amount": 2662.08, "copay": 50.0, "insurance_paid": 1954.7},
+}
+
+
+@pytest.mark.parametrize("question, field, answer", [
+    ("Who is the doctor?", "provider_name", "Dr. David Chen (Pulmonology)"),
+    ("What is the ICD code?", "icd_code", "J45.909"),
+    ("What is the diagnosis code?", "icd_code", "J45.909"),
+    ("What was the diagnosis?", "primary_diagnosis", "Asthma"),
+    ("How much did insurance pay?", "financials.insurance_paid", 1954.7),
+    ("What is the date of birth?", "patient_info.date_of_birth", "1957-01-09"),
+    ("Who is the patient?", "patient_name", "Katelyn Whitaker"),
+])
+def test_factual_questions_are_answered_from_fields(question, field, answer):
+    routed = QuestionRouter().route(question, CLAIM)
+    assert (routed.field, routed.answer) == (field, answer)
+
+
+@pytest.mark.parametrize("question", [
+    "Why was a spirometry test needed?",
+    "Who is the doctor and what is the diagnosis?",
+    "What medication was prescribed?",
+    "What is the CPT code?",  # field missing from this claim
+    "What is the patient age?",
+    "Is the doctor a cardiologist?",
+    "Did insurance pay for the MRI?",
+    "Is the diagnosis correct?",
+    "Was the claim valid?",
+])
+def test_other_questions_fall_through(question):
+    router = QuestionRouter()
+    assert router.route(question, CLAIM) is None
+    assert router.stats()["fallthrough"] == 1
+
+
+def test_pipeline_skips_model_call_on_fast_path():
+    """Routed questions never build a model wrapper; others still do."""
+    pipeline = Pipeline(patient_id="PA-12345", router=QuestionRouter())
+    pipeline._claim_data, pipeline._claim_data_loaded = CLAIM, True
+    with patch("src.extractive_qa.ExtractiveQA") as extractive_qa, patch("src.abstractive_qa.AbstractiveQA") as abstractive_qa:
+        assert pipeline.pipeline(option="qa", question="Who is the doctor?").answer == "Dr. David Chen (Pulmonology)"
+        answer, reasoning = pipeline.pipeline(option="advanced_qa", question="What is the ICD code?")
+        assert answer == "J45.909" and "icd_code" in reasoning
+        extractive_qa.assert_not_called()
+        abstractive_qa.assert_not_called()
+
+        pipeline.pipeline(option="qa", question="Why was a spirometry test needed?")
+        extractive_qa.assert_called_once()
+    assert pipeline.router.stats()["fast_path"] == 2
@@ -0,0 +1,96 @@
+import threading
+import time
+from unittest.mock import MagicMock
+from src.clients import BACKEND_SUMMARIZATION, ClientProvider
+from src.result_cache import ResultCache, make_key
+
+
+def test_repeated_calls_hit_the_cache(tmp_path):
+    """Identical inputs reach the model once; stats record the hit."""
+    factory = MagicMock()
+    factory.return_value.summarization.return_value = "summary"
+    provider = ClientProvider(client_factory=factory, cache=ResultCache(str(tmp_path / "cache.sqlite")))
+
+    for _ in range(3):
+        assert provider.call(BACKEND_SUMMARIZATION, "summarization", text="note", model="m") == "summary"
+    provider.call(BACKEND_SUMMARIZATION, "summarization", text="other note", model="m")
+
+    assert factory.return_value.summarization.call_count == 2
+    stats = provider.cache.stats(BACKEND_SUMMARIZATION)
+    assert (stats["hits"], stats["misses"]) == (2, 2)
+
+
+def test_cache_persists_across_instances(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    ResultCache(path).put("key", "chat", {"answer": 1}, latency=2.0)
+    reopened = ResultCache(path)
+    assert reopened.get("key", "chat") == (True, {"answer": 1})
+    assert reopened.stats("chat")["latency_saved"] == 2.0
+
+
+def test_concurrent_identical_requests_are_deduplicated():
+    """Only one of several simultaneous callers computes the value."""
+    cache = ResultCache()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.05)
+        return "value"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute("chat", "key", compute)))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ["value"] * 5
+    assert len(calls) == 1
+
+
+def test_size_and_age_eviction():
+    cache = ResultCache(max_bytes=200, max_age_seconds=60)
+    for index in range(10):
+        cache.put(f"key{index}", "chat", "x" * 40, latency=0.1)
+    assert cache.get("key9")[0] is True
+    assert cache.get("key0")[0] is False
+
+    cache.max_age_seconds = 0
+    time.sleep(0.01)
+    assert cache.get("key9")[0] is False
+
+
+def test_key_depends_on_every_input():
+    base = make_key("chat", "chat_completion", {"model": "m", "messages": [{"content": "q"}], "temperature": 0.1})
+    assert base == make_key("chat", "chat_completion", {"temperature": 0.1, "messages": [{"content": "q"}], "model": "m"})
+    assert base != make_key("chat", "chat_completion", {"model": "m", "messages": [{"content": "q"}], "temperature": 0.2})
+
+
+def test_key_separates_endpoints_and_providers():
+    """A run against a stub server never reads or writes production entries."""
+    kwargs = {"text": "note", "model": "m"}
+    production = ClientProvider().cache_key(BACKEND_SUMMARIZATION, "summarization", kwargs)
+    stub = ClientProvider(endpoint_url="http://127.0.0.1:8765").cache_key(BACKEND_SUMMARIZATION, "summarization", kwargs)
+    assert production != stub and kwargs == {"text": "note", "model": "m"}
+    assert make_key("chat", "chat_completion", kwargs) != make_key("chat", "chat_completion", kwargs, provider="together")
+
+
+def test_values_are_stored_as_json(tmp_path):
+    """Model responses come back with their type; entries in any other format are misses, never unpickled."""
+    from huggingface_hub import ChatCompletionOutput, QuestionAnsweringOutputElement
+    cache = ResultCache(str(tmp_path / "cache.sqlite"))
+    chat = ChatCompletionOutput.parse_obj({
+        "id": "x", "object": "chat.completion", "created": 1, "model": "m", "system_fingerprint": "s",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "hi"}}],
+        "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+    })
+    cache.put("chat", "chat", chat, latency=0.1)
+    cache.put("qa", "qa", [QuestionAnsweringOutputElement(answer="a", score=0.9, start=0, end=1)], latency=0.1)
+    hit, value = cache.get("chat")
+    assert hit and isinstance(value, ChatCompletionOutput) and value.choices[0].message.content == "hi"
+    assert cache.get("qa")[1][0].answer == "a"
+
+    with cache._conn:
+        cache._conn.execute("UPDATE results SET value = ? WHERE key = 'chat'", (b"\x80\x04K\x01.",))
+    assert cache.get("chat") == (False, None)
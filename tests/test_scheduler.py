@@ -0,0 +1,133 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from src.clients import ClientProvider
+from src.scheduler import PRIORITY_BULK, PRIORITY_INTERACTIVE, RequestScheduler, retry_after
+from src.summary import Summarization
+from src.utils.stub_server import StubInferenceServer
+
+
+def http_error(status_code, headers=None):
+    error = Exception(f"HTTP {status_code}")
+    error.response = SimpleNamespace(status_code=status_code, headers=headers or {})
+    return error
+
+
+def test_retry_after_accepts_seconds_and_http_dates():
+    assert retry_after(http_error(429, {"Retry-After": "1.5"})) == 1.5
+    in_a_minute = time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(time.time() + 60))
+    assert 55 < retry_after(http_error(503, {"Retry-After": in_a_minute})) <= 60
+    assert retry_after(http_error(500)) is None and retry_after(ValueError()) is None
+
+
+def test_token_bucket_limits_call_rate():
+    scheduler = RequestScheduler(rate_limits={"m": {"rate": 20, "burst": 2}})
+    start = time.monotonic()
+    for _ in range(6):
+        scheduler.release(scheduler.acquire("m"), 0.01)
+    # Two calls from the burst, then one every 50 ms
+    assert time.monotonic() - start >= 0.18
+    assert scheduler.stats()["m"]["completed"] == 6
+
+
+def test_interactive_calls_start_before_bulk_calls():
+    scheduler = RequestScheduler(initial_concurrency=1, max_concurrency=1)
+    holder = scheduler.acquire("m")
+    order = []
+
+    def call(priority):
+        ticket = scheduler.acquire("m", priority)
+        order.append(priority)
+        scheduler.release(ticket, 0.01)
+
+    threads = [threading.Thread(target=call, args=(priority,))
+               for priority in (PRIORITY_BULK, PRIORITY_BULK, PRIORITY_INTERACTIVE)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.05)
+    assert scheduler.stats()["m"]["queue_depth"] == {PRIORITY_INTERACTIVE: 1, PRIORITY_BULK: 2}
+    scheduler.release(holder, 0.01)
+    for thread in threads:
+        thread.join(timeout=5)
+    assert order == [PRIORITY_INTERACTIVE, PRIORITY_BULK, PRIORITY_BULK]
+    assert scheduler.stats()["m"]["max_wait"] >= 0.05
+
+
+def test_concurrency_limit_adapts_to_latency_and_overload():
+    scheduler = RequestScheduler(initial_concurrency=4, max_concurrency=8, target_latency=1.0)
+    for _ in range(20):
+        scheduler.release(scheduler.acquire("m"), 0.1)
+    assert scheduler.lanes["m"].limit > 6
+
+    # Several 429s from one round of calls halve the limit once, and Retry-After pauses the lane
+    tickets = [scheduler.acquire("m") for _ in range(3)]
+    limit = scheduler.lanes["m"].limit
+    for ticket in tickets:
+        scheduler.release(ticket, 0.1, http_error(429), pause=0.2)
+    stats = scheduler.stats()["m"]
+    assert scheduler.lanes["m"].limit == limit / 2 and stats["throttled"] == 3
+    assert stats["paused_seconds"] > 0.1 and stats["error_rate"] > 0
+    start = time.monotonic()
+    scheduler.release(scheduler.acquire("m"), 5.0)
+    assert time.monotonic() - start >= 0.15
+    # Slow calls shrink it too
+    assert scheduler.lanes["m"].limit < limit / 2
+
+
+def test_async_waiters_respect_priority():
+    scheduler = RequestScheduler(initial_concurrency=1, max_concurrency=1)
+
+    async def run():
+        holder = await scheduler.aacquire("m")
+        order = []
+
+        async def call(priority):
+            ticket = await scheduler.aacquire("m", priority)
+            order.append(priority)
+            await asyncio.sleep(0)
+            scheduler.release(ticket, 0.01)
+
+        tasks = [asyncio.create_task(call(priority)) for priority in (PRIORITY_BULK, PRIORITY_INTERACTIVE)]
+        cancelled = asyncio.create_task(call(PRIORITY_INTERACTIVE))
+        await asyncio.sleep(0.05)
+        cancelled.cancel()
+        await asyncio.sleep(0)
+        scheduler.release(holder, 0.01)
+        await asyncio.wait_for(asyncio.gather(*tasks), timeout=5)
+        return order
+
+    assert asyncio.run(run()) == [PRIORITY_INTERACTIVE, PRIORITY_BULK]
+    assert scheduler.stats()["m"]["in_flight"] == 0 and scheduler.stats()["m"]["queue_depth"][PRIORITY_BULK] == 0
+
+
+def test_throttled_calls_are_retried_instead_of_lost():
+    """A stub allowing 5 requests/s answers the rest with 429 + Retry-After; every summary still completes."""
+    with StubInferenceServer(rate_limit=5) as stub:
+        scheduler = RequestScheduler()
+        provider = ClientProvider(endpoint_url=stub.url, max_retries=8, backoff_seconds=0.01, scheduler=scheduler)
+        summarization = Summarization(client_provider=provider)
+        claims = [{"claim_id": f"CLM{i}", "Clinical_note": f"Visit {i} for asthma."} for i in range(10)]
+        with ThreadPoolExecutor(max_workers=5) as pool:
+            results = list(pool.map(lambda claim: summarization.summarize(claim_data=claim), claims))
+        assert stub.throttled > 0
+    assert all(result and result["summary_text"] == "stub summary" for result in results)
+    stats = scheduler.stats()[summarization.summarization_model]
+    assert stats["completed"] == 10 and stats["throttled"] == stub.throttled
+    assert stats["concurrency_limit"] < 4 and stats["wait_p95"] > 0
+
+
+def test_stub_injects_server_errors():
+    with StubInferenceServer(error_rate=1.0, seed=0) as stub:
+        scheduler = RequestScheduler()
+        provider = ClientProvider(endpoint_url=stub.url, max_retries=1, backoff_seconds=0.01, scheduler=scheduler)
+        summarization = Summarization(client_provider=provider)
+        assert summarization.summarize(claim_data={"Clinical_note": "Visit."}) is None
+    stats = scheduler.stats()[summarization.summarization_model]
+    assert provider.retries == 1 and stats["throttled"] == 2 and stats["in_flight"] == 0
+
+
+def test_shipped_config_leaves_models_unlimited():
+    scheduler = RequestScheduler.from_config()
+    assert scheduler.lane("any-model").bucket.rate is None
@@ -0,0 +1,123 @@
+import asyncio
+import json
+import threading
+import time
+import pytest
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+from src.clients import ClientProvider
+from src.server import AgentServer
+from src.utils.stub_server import StubInferenceServer
+
+
+def post(server, path, payload):
+    request = Request(f"{server.url}{path}", data=json.dumps(payload).encode(),
+                      headers={"Content-Type": "application/json"})
+    try:
+        with urlopen(request, timeout=10) as response:
+            return response.status, json.loads(response.read()), dict(response.headers)
+    except HTTPError as e:
+        return e.code, json.loads(e.read()), dict(e.headers)
+
+
+@pytest.fixture
+def data_root(tmp_path):
+    root = tmp_path / "claim"
+    for claim_id, paid in (("CLM1", 100.0), ("CLM2", 200.0)):
+        claim_dir = root / "P-1" / claim_id
+        claim_dir.mkdir(parents=True)
+        details = {"claim_id": claim_id, "provider_name": "Dr. Test", "primary_diagnosis": "Asthma",
+                   "patient_info": {"patient_id": "P-1", "first_name": "Ann", "last_name": "Lee"},
+                   "financials": {"billed_amount": paid, "allowed_amount": paid, "copay": 10.0,
+                                  "insurance_paid": paid - 10.0}}
+        (claim_dir / "claim_details.json").write_text(json.dumps(details))
+        (claim_dir / "claim_text_data.txt").write_text(f"Seen by Dr. Test for {claim_id}.")
+    return str(root)
+
+
+@pytest.fixture
+def server(data_root):
+    with StubInferenceServer() as stub:
+        provider = ClientProvider(endpoint_url=stub.url, max_retries=0)
+        with AgentServer(port=0, workers=2, queue_size=4, client_provider=provider, data_path=data_root) as server:
+            server.stub = stub
+            yield server
+
+
+def test_endpoints_answer_through_the_stub(server):
+    """Every route works end to end against the local stub inference server."""
+    status, body, _ = post(server, "/advanced_qa", {"patient_id": "P-1", "claim_id": "CLM1",
+                                                    "question": "Why was the visit needed?"})
+    assert status == 200 and body["result"] == ["stub answer", "stub reasoning"]
+    status, body, _ = post(server, "/qa", {"patient_id": "P-1", "claim_id": "CLM1",
+                                           "question": "Why was the visit needed?"})
+    assert body["result"]["answer"] == "stub answer"
+    status, body, _ = post(server, "/summary", {"patient_id": "P-1", "claim_id": "CLM2"})
+    assert body["result"]["summary_text"] == "stub summary"
+    status, body, _ = post(server, "/analysis", {"patient_id": "P-1"})
+    assert body["result"]["total_insurance_paid"] == 280.0
+
+
+def test_bad_requests_are_rejected(server):
+    assert post(server, "/qa", {"patient_id": "P-1"})[0] == 400
+    assert post(server, "/nope", {"patient_id": "P-1"})[0] == 404
+
+
+def test_ids_outside_the_data_root_are_rejected(server, tmp_path):
+    """Path-like or non-string ids get a 400 and never reach the filesystem."""
+    secret = tmp_path / "secret" / "C1"
+    secret.mkdir(parents=True)
+    (secret / "claim_details.json").write_text(json.dumps({"claim_id": "C1"}))
+    (secret / "claim_text_data.txt").write_text("Secret note.")
+    for params in ({"patient_id": str(tmp_path / "secret"), "claim_id": "C1"},
+                   {"patient_id": "../secret", "claim_id": "C1"},
+                   {"patient_id": "P-1", "claim_id": "../../secret/C1"},
+                   {"patient_id": 7, "claim_id": "C1"},
+                   {"patient_id": ["P-1"], "claim_id": "C1"}):
+        status, body, _ = post(server, "/summary", params)
+        assert status == 400 and "result" not in body
+    assert server.stub.requests == []
+    assert post(server, "/summary", {"patient_id": "P-1", "claim_id": "CLM1", "question": 3})[0] == 400
+
+
+def test_metrics_report_requests_and_warm_clients(server):
+    """Requests after the first reuse the same provider; /metrics reports them."""
+    for _ in range(3):
+        post(server, "/summary", {"patient_id": "P-1", "claim_id": "CLM1"})
+    with urlopen(f"{server.url}/metrics", timeout=10) as response:
+        metrics = json.loads(response.read())
+    assert metrics["routes"]["/summary"]["ok"] == 3
+    assert metrics["routes"]["/summary"]["latency_ms_p50"] is not None
+    assert metrics["queue"]["capacity"] == 4
+    assert metrics["inference"]["calls"] == 3
+
+
+def test_full_queue_returns_503(server):
+    """With every worker busy and the queue full, new requests get 503 + Retry-After."""
+    release = threading.Event()
+    busy = []
+
+    async def blocked(option, params):
+        busy.append(option)
+        await asyncio.to_thread(release.wait)
+        return "done"
+
+    server.execute = blocked
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(post(server, "/analysis", {"patient_id": "P-1"})))
+               for _ in range(6)]
+    try:
+        for thread in threads:
+            thread.start()
+        # 2 busy workers + 4 queued slots: the 7th request must be turned away
+        deadline = time.monotonic() + 5
+        while (len(busy) < 2 or server._queue.qsize() < 4) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        status, body, headers = post(server, "/analysis", {"patient_id": "P-1"})
+    finally:
+        # Never leave executor threads blocked, or interpreter shutdown hangs
+        release.set()
+        for thread in threads:
+            thread.join()
+    assert status == 503 and headers["Retry-After"] == "1"
+    assert [result[0] for result in results] == [200] * 6
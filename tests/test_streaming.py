@@ -0,0 +1,109 @@
+import asyncio
+import json
+import random
+import pytest
+from main import print_stream
+from src.abstractive_qa import AbstractiveQA
+from src.clients import ClientProvider
+from src.pipeline import Pipeline
+from src.prompt_builder import PromptBuilder
+from src.streaming import JSONFieldStream, StreamMeter
+from src.summary import Summarization
+from src.utils.stub_server import StubInferenceServer
+
+ANSWER = {"answer": "Dr. \"Chen\" é \U0001F600", "score": 0.5, "spans": [1, {"a": "}"}],
+          "reasoning": "The note says: 'seen by Dr. Chen'."}
+CLAIM = {"claim_id": "CLM1", "provider_name": "Dr. Chen", "Clinical_note": "Patient was seen for asthma."}
+
+
+@pytest.fixture
+def stub():
+    with StubInferenceServer(chat_answer=ANSWER, token_latency=0.005) as server:
+        yield server
+
+
+@pytest.fixture
+def provider(stub):
+    return ClientProvider(endpoint_url=stub.url, max_retries=0)
+
+
+def test_json_field_stream_emits_string_fields_incrementally():
+    """Any split of the text gives the same deltas and values; answer is complete before reasoning starts."""
+    text = "```json\n" + json.dumps(ANSWER) + "\n```"
+    rng = random.Random(0)
+    for _ in range(50):
+        parser, deltas, position = JSONFieldStream(), [], 0
+        while position < len(text):
+            step = rng.randint(1, 6)
+            deltas.extend(parser.feed(text[position:position + step]))
+            position += step
+        assert parser.values == ANSWER and parser.complete
+        assert "".join(delta for field, delta in deltas if field == "answer") == ANSWER["answer"]
+        assert "".join(delta for field, delta in deltas if field == "reasoning") == ANSWER["reasoning"]
+        fields = [field for field, _ in deltas]
+        assert fields.index("reasoning") > len(fields) - 1 - fields[::-1].index("answer")
+
+
+def test_stream_meter_measures_first_token_and_rate():
+    meter = StreamMeter()
+    assert meter.time_to_first_token is None and meter.tokens_per_second is None
+    meter.tick()
+    meter.last = meter.first + 0.5
+    meter.tokens = 11
+    assert meter.time_to_first_token >= 0 and meter.tokens_per_second == pytest.approx(20.0)
+
+
+def test_qa_stream_yields_answer_before_reasoning(provider, stub):
+    abstractive_qa = AbstractiveQA(claim_data=CLAIM, client_provider=provider)
+    pieces = list(abstractive_qa.qa_stream("Who saw the patient?"))
+    assert [field for field, _ in pieces][0] == "answer"
+    assert "".join(text for field, text in pieces if field == "answer") == ANSWER["answer"]
+    assert abstractive_qa.last_result == (ANSWER["answer"], ANSWER["reasoning"])
+    assert stub.requests[-1][1]["stream"] is True
+
+    record = abstractive_qa.last_record
+    assert 0 < record.time_to_first_token < record.timings["call"]
+    assert record.tokens_per_second > 0 and record.completion_tokens > 1
+
+
+def test_aqa_stream_matches_sync_stream(provider):
+    abstractive_qa = AbstractiveQA(claim_data=CLAIM, client_provider=provider)
+
+    async def collect():
+        try:
+            return [piece async for piece in abstractive_qa.aqa_stream("Who saw the patient?")]
+        finally:
+            await provider.aclose()
+
+    pieces = asyncio.run(collect())
+    assert "".join(text for field, text in pieces if field == "reasoning") == ANSWER["reasoning"]
+    assert abstractive_qa.last_record.time_to_first_token is not None
+
+
+def test_summary_stream_yields_partials_before_the_summary(provider):
+    """Each chunk summary of a long note is yielded as it completes, then the final summary."""
+    claim = {"claim_id": "CLM1", "Clinical_note": " ".join(f"Sentence number {i} about the visit." for i in range(60))}
+    summarization = Summarization(client_provider=provider,
+                                  prompt_builder=PromptBuilder(chunk_tokens=80, overlap_tokens=8))
+    pieces = list(summarization.summarize_stream(claim))
+    assert [field for field, _ in pieces[:-1]] == ["partial"] * (len(pieces) - 1) and len(pieces) > 2
+    assert pieces[-1] == ("summary", "stub summary") and summarization.last_result == "stub summary"
+    assert summarization.last_record.time_to_first_token is not None
+
+    async def collect():
+        return [piece async for piece in summarization.asummarize_stream(claim)]
+    assert asyncio.run(collect()) == pieces
+
+
+def test_pipeline_stream_and_cli_output(provider, tmp_path, capsys):
+    claim_dir = tmp_path / "claim" / "P-1" / "CLM1"
+    claim_dir.mkdir(parents=True)
+    (claim_dir / "claim_details.json").write_text(json.dumps({"claim_id": "CLM1", "claim_date": "2025-01-01"}))
+    (claim_dir / "claim_text_data.txt").write_text("Patient was seen for asthma.")
+    pipeline = Pipeline(patient_id="P-1", claim_id="CLM1", data_path=str(tmp_path / "claim"),
+                        client_provider=provider)
+
+    print_stream(pipeline.pipeline("advanced_qa", "Why was the visit needed?", stream=True))
+    assert capsys.readouterr().out == f"Answer: {ANSWER['answer']}\nReason: {ANSWER['reasoning']}\n"
+    assert list(pipeline.stream("summary")) == [("summary", "stub summary")]
+    assert list(pipeline.stream("qa")) == [("result", "No question received.")]
@@ -0,0 +1,98 @@
+import json
+import os
+import pytest
+from src.clients import ClientProvider
+from src.pipeline import Pipeline
+from src.utils.stub_server import StubInferenceServer
+from src.utils.tracing import NULL_SPAN, Tracer, tracer
+
+
+@pytest.fixture
+def data_root(tmp_path):
+    root = tmp_path / "claim"
+    for claim_id in ("CLM1", "CLM2"):
+        claim_dir = root / "P-1" / claim_id
+        claim_dir.mkdir(parents=True)
+        details = {"claim_id": claim_id, "claim_date": "2025-01-01",
+                   "financials": {"billed_amount": 100.0, "allowed_amount": 80.0,
+                                  "copay": 10.0, "insurance_paid": 70.0}}
+        (claim_dir / "claim_details.json").write_text(json.dumps(details))
+        (claim_dir / "claim_text_data.txt").write_text(f"Note for {claim_id}.")
+    return str(root)
+
+
+@pytest.fixture
+def enabled_tracer():
+    "The process-wide tracer, enabled for one test"
+    tracer.reset()
+    tracer.enabled = True
+    yield tracer
+    tracer.enabled = False
+    tracer.reset()
+
+
+def test_disabled_tracer_records_nothing():
+    disabled = Tracer()
+    with disabled.span("stage") as span:
+        span.set(claims=3)
+    with disabled.request("pipeline.qa") as root:
+        assert root is NULL_SPAN
+    assert span is NULL_SPAN
+    assert disabled.snapshot() == {"enabled": False, "stages": {}}
+
+
+def test_spans_nest_into_traces_and_histograms(tmp_path):
+    local = Tracer(enabled=True)
+    with local.request("pipeline.summary", claim_id="CLM1"):
+        with local.span("ingestion.claim"):
+            pass
+        for _ in range(2):
+            with local.span("inference.summarization"):
+                pass
+    snapshot = local.snapshot(traces=True)
+    assert snapshot["stages"]["inference.summarization"]["count"] == 2
+    trace = snapshot["traces"][0]
+    assert trace["name"] == "pipeline.summary" and trace["attributes"] == {"claim_id": "CLM1"}
+    assert [child["name"] for child in trace["children"]] == ["ingestion.claim"] + ["inference.summarization"] * 2
+
+    text = local.to_prometheus()
+    assert 'form_agent_stage_seconds_bucket{stage="inference.summarization",le="+Inf"} 2' in text
+    assert 'form_agent_stage_seconds_count{stage="pipeline.summary"} 1' in text
+    local.export(str(tmp_path / "stages.prom"))
+    local.export(str(tmp_path / "stages.json"))
+    assert (tmp_path / "stages.prom").read_text() == text
+    assert json.loads((tmp_path / "stages.json").read_text())["traces"][0]["name"] == "pipeline.summary"
+
+
+def test_failed_span_is_marked():
+    local = Tracer(enabled=True)
+    with pytest.raises(KeyError):
+        with local.request("pipeline.qa"):
+            raise KeyError("missing")
+    assert local.snapshot(traces=True)["traces"][0]["attributes"] == {"error": "KeyError"}
+
+
+def test_request_profile_is_written(tmp_path):
+    local = Tracer(profile_dir=str(tmp_path / "profiles"))
+    with local.request("pipeline.analysis", profiler="cprofile"):
+        sum(range(1000))
+    assert [name.split("-")[0] for name in os.listdir(tmp_path / "profiles")] == ["pipeline.analysis"]
+    with pytest.raises(ValueError):
+        with local.request("pipeline.analysis", profiler="perf"):
+            pass
+
+
+def test_pipeline_stages_are_traced(data_root, enabled_tracer):
+    """Ingestion, prompt building, inference and analysis stages show up under the request span."""
+    with StubInferenceServer() as stub:
+        provider = ClientProvider(endpoint_url=stub.url, max_retries=0)
+        Pipeline(patient_id="P-1", claim_id="CLM1", data_path=data_root,
+                 client_provider=provider).pipeline("summary")
+    Pipeline(patient_id="P-1", data_path=data_root).pipeline("analysis")
+
+    stages = enabled_tracer.snapshot()["stages"]
+    for name in ("pipeline.summary", "ingestion.claim", "ingestion.load_claim", "summary.build",
+                 "summary.map", "inference.summarization", "client.create", "pipeline.analysis"):
+        assert stages[name]["count"] >= 1, name
+    summary_trace = next(span for span in enabled_tracer.traces if span.name == "pipeline.summary")
+    assert {child.name for child in summary_trace.children} >= {"ingestion.claim", "summary.build", "summary.map"}